@@ -46,6 +46,18 @@ def create_app():
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///sampark_setu.db'
     
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Read replicas (see app/database.py): comma-separated URLs of PostgreSQL standbys (or SQLite
+    # copies for local testing). Request reads go to a replica unless the user wrote within
+    # REPLICA_PIN_SECONDS or the replica is more than REPLICA_MAX_LAG seconds behind
+    replica_urls = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    app.config['SQLALCHEMY_BINDS'] = {
+        f'replica_{i}': 'postgresql://' + url[len('postgres://'):] if url.startswith('postgres://') else url
+        for i, url in enumerate(replica_urls)
+    }
+    app.config['REPLICA_PIN_SECONDS'] = float(os.environ.get('REPLICA_PIN_SECONDS', 5))
+    app.config['REPLICA_MAX_LAG'] = float(os.environ.get('REPLICA_MAX_LAG', 2))
+    app.config['REPLICA_CHECK_INTERVAL'] = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
     # Only set engine options for PostgreSQL (not SQLite)
     if database_url and 'postgresql' in database_url:
         app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
@@ -65,9 +77,107 @@ def create_app():
     app.config['SESSION_COOKIE_HTTPONLY'] = True
     app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
     
+    # Media offload: routes only authorize the request and a front proxy streams the file
+    # 'x-accel' = nginx X-Accel-Redirect, 'x-sendfile' = Apache/lighttpd X-Sendfile,
+    # unset = the worker sends the file itself (wsgi.file_wrapper, i.e. sendfile under gunicorn)
+    media_offload = os.environ.get('MEDIA_OFFLOAD', '').lower()
+    app.config['MEDIA_OFFLOAD'] = media_offload
+    app.config['MEDIA_ACCEL_PREFIX'] = os.environ.get('MEDIA_ACCEL_PREFIX', '/internal-uploads')
+    app.config['USE_X_SENDFILE'] = media_offload == 'x-sendfile'
+    
+    # Upload storage: 'local' (hash-sharded directories under uploads/) or 's3'
+    # (any S3-compatible store, e.g. MinIO with S3_ENDPOINT_URL=http://localhost:9000)
+    app.config['UPLOADS_ROOT'] = os.path.join(root_dir, 'uploads')
+    app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'local').lower()
+    app.config['STORAGE_SHARD_DEPTH'] = int(os.environ.get('STORAGE_SHARD_DEPTH', 2))
+    app.config['S3_BUCKET'] = os.environ.get('S3_BUCKET')
+    app.config['S3_ENDPOINT_URL'] = os.environ.get('S3_ENDPOINT_URL')
+    app.config['S3_REGION'] = os.environ.get('S3_REGION')
+    app.config['S3_PREFIX'] = os.environ.get('S3_PREFIX', 'uploads')
+    app.config['S3_PRESIGN_EXPIRES'] = int(os.environ.get('S3_PRESIGN_EXPIRES', 3600))
+    
+    # Orphaned upload sweeper (see app/upload_gc.py); an interval of 0 disables it
+    app.config['UPLOAD_GC_INTERVAL'] = int(os.environ.get('UPLOAD_GC_INTERVAL', 6 * 60 * 60))
+    app.config['UPLOAD_GC_GRACE_PERIOD'] = int(os.environ.get('UPLOAD_GC_GRACE_PERIOD', 24 * 60 * 60))
+    # Sweeper for voice recordings abandoned mid-upload (see app/routes/uploads.py)
+    app.config['AUDIO_STREAM_SWEEP_INTERVAL'] = int(os.environ.get('AUDIO_STREAM_SWEEP_INTERVAL', 60))
+    
+    # Local mirror of Giphy media (see app/routes/gifs.py)
+    app.config['GIF_MIRROR'] = os.environ.get('GIF_MIRROR', '').lower() in ('1', 'true', 'yes')
+    app.config['GIF_MIRROR_DIR'] = os.environ.get('GIF_MIRROR_DIR', os.path.join(root_dir, 'cache', 'gifs'))
+    app.config['GIF_MIRROR_MAX_BYTES'] = int(os.environ.get('GIF_MIRROR_MAX_MB', 512)) * 1024 * 1024
+    
+    # SQLite tuning (see app/database.py): 'wal' or 'default' for SQLite's stock settings
+    app.config['SQLITE_PROFILE'] = os.environ.get('SQLITE_PROFILE', 'wal').lower()
+    app.config['SQLITE_CHECKPOINT_INTERVAL'] = int(os.environ.get('SQLITE_CHECKPOINT_INTERVAL', 300))
+    
+    # Monthly message partitions on PostgreSQL (see app/partitions.py, partition_messages.py);
+    # MESSAGE_RETENTION_MONTHS=0 keeps history forever
+    app.config['PARTITION_MAINTENANCE_INTERVAL'] = int(os.environ.get('PARTITION_MAINTENANCE_INTERVAL', 6 * 60 * 60))
+    app.config['PARTITION_MONTHS_AHEAD'] = int(os.environ.get('PARTITION_MONTHS_AHEAD', 3))
+    app.config['MESSAGE_RETENTION_MONTHS'] = int(os.environ.get('MESSAGE_RETENTION_MONTHS', 0))
+    
+    # Per-room retention reaper (see app/retention.py); ROOM_RETENTION_DAYS is the default
+    # max age for rooms created through /create-room (0 = keep forever)
+    app.config['RETENTION_INTERVAL'] = int(os.environ.get('RETENTION_INTERVAL', 10 * 60))
+    app.config['ROOM_RETENTION_DAYS'] = int(os.environ.get('ROOM_RETENTION_DAYS', 0))
+    
+    # MessagePack Socket.IO frames for clients that ask for them (see app/wire.py); needs msgpack installed
+    app.config['SOCKETIO_MSGPACK'] = os.environ.get('SOCKETIO_MSGPACK', 'true').lower() in ('1', 'true', 'yes')
+    
+    # Negotiated brotli/gzip for text responses (see app/compression.py); WebSocket messages
+    # under WS_COMPRESSION_THRESHOLD bytes skip permessage-deflate (0 compresses all of them:
+    # with the shared deflate context even typing frames shrink, see bench_compression.py)
+    app.config['HTTP_COMPRESSION'] = os.environ.get('HTTP_COMPRESSION', 'true').lower() in ('1', 'true', 'yes')
+    app.config['WS_COMPRESSION_THRESHOLD'] = int(os.environ.get('WS_COMPRESSION_THRESHOLD', 0))
+    
+    # Slow consumers (see app/backpressure.py): past SOCKET_QUEUE_DROP queued packets a connection
+    # loses typing/presence events, past SOCKET_QUEUE_RESYNC it is told to resync, and it is
+    # disconnected if still behind SOCKET_SLOW_DISCONNECT seconds later; 0 disables the limits
+    app.config['SOCKET_QUEUE_DROP'] = int(os.environ.get('SOCKET_QUEUE_DROP', 100))
+    app.config['SOCKET_QUEUE_RESYNC'] = int(os.environ.get('SOCKET_QUEUE_RESYNC', 500))
+    app.config['SOCKET_SLOW_DISCONNECT'] = float(os.environ.get('SOCKET_SLOW_DISCONNECT', 30))
+    
+    # Busy rooms (over BROADCAST_BATCH_RATE hot events a second, 0 disables) have their broadcasts
+    # collected for BROADCAST_BATCH_TICK_MS and sent as one frame (see app/batching.py)
+    app.config['BROADCAST_BATCH_RATE'] = int(os.environ.get('BROADCAST_BATCH_RATE', 20))
+    app.config['BROADCAST_BATCH_TICK_MS'] = int(os.environ.get('BROADCAST_BATCH_TICK_MS', 40))
+    
+    # Prometheus metrics at /metrics (see app/metrics.py); scrapes send METRICS_TOKEN as a bearer
+    # token. Off unless a token is set; METRICS_ENABLED=true without one serves them to anyone
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['METRICS_ENABLED'] = os.environ.get(
+        'METRICS_ENABLED', 'true' if app.config['METRICS_TOKEN'] else 'false'
+    ).lower() in ('1', 'true', 'yes')
+    
+    # Development/staging SQL profiler (see app/profiler.py): flags statements repeated
+    # SQL_N_PLUS_ONE_THRESHOLD+ times in one request or event and EXPLAINs ones over SQL_SLOW_QUERY_MS
+    app.config['SQL_PROFILER'] = os.environ.get('SQL_PROFILER', 'false').lower() in ('1', 'true', 'yes')
+    app.config['SQL_SLOW_QUERY_MS'] = float(os.environ.get('SQL_SLOW_QUERY_MS', 100))
+    app.config['SQL_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+    
+    # Acks of the last SEND_DEDUP_WINDOW messages sent with a client id, so retries are answered
+    # from memory; the message_client_ids table catches older ones (see app/dedup.py)
+    app.config['SEND_DEDUP_WINDOW'] = int(os.environ.get('SEND_DEDUP_WINDOW', 10000))
+    
+    # Apply pending schema migrations at startup; on by default only for local SQLite,
+    # deployments run `python init_db.py` in their build step instead
+    auto_migrate = os.environ.get('AUTO_MIGRATE')
+    if auto_migrate is None:
+        app.config['AUTO_MIGRATE'] = app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')
+    else:
+        app.config['AUTO_MIGRATE'] = auto_migrate.lower() in ('1', 'true', 'yes')
+    
     # Initialize extensions with app
     from app.models import db
+    from app.database import configure_sqlite, configure_replicas
+    from app.batching import configure_batching
+    from app.dedup import configure_dedup
     db.init_app(app)
+    configure_sqlite(app, db)
+    configure_replicas(app)
+    configure_batching(app)
+    configure_dedup(app)
     login_manager.init_app(app)
     # Use eventlet for production, threading for development
     # Default to threading for local development (more reliable)
@@ -83,87 +193,67 @@ def create_app():
     else:
         socketio.init_app(app, async_mode=async_mode, cors_allowed_origins="*")
     
+    # Request, event, query and frame metrics (first, so its after_request hook runs last)
+    from app.metrics import configure_metrics, instrument_socketio_events
+    configure_metrics(app, socketio)
+    from app.profiler import configure_profiler, profile_socketio_events
+    configure_profiler(app)
+    
+    # Outbound queue limits for slow Socket.IO clients
+    from app.backpressure import configure_backpressure
+    configure_backpressure(app, socketio)
+    
+    # Response compression and the WebSocket permessage-deflate threshold
+    from app.compression import configure_compression
+    configure_compression(app)
+    
+    # Fingerprinted, precompressed static assets from build_assets.py
+    from app.assets import configure_assets
+    configure_assets(app)
+    
     # Register blueprints
     from app.routes.auth import auth_bp
     from app.routes.chat import chat_bp
     from app.routes.uploads import uploads_bp
     from app.routes.profile import profile_bp
+    from app.routes.gifs import gifs_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(chat_bp)
     app.register_blueprint(uploads_bp)
     app.register_blueprint(profile_bp)
+    app.register_blueprint(gifs_bp)
     
     # Register SocketIO events
     from app.socketio_events import register_socketio_events
     register_socketio_events(socketio)
+    instrument_socketio_events(app, socketio)
+    profile_socketio_events(app, socketio)
     
-    # Create database tables and upload directories
-    with app.app_context():
-        db.create_all()
-        
-        # Run runtime migrations to ensure all columns exist
-        # This is a safety net in case migrations didn't run during build
-        try:
-            from sqlalchemy import text, inspect
-            inspector = inspect(db.engine)
-            database_url = os.environ.get('DATABASE_URL', '')
-            
-            def column_exists_safe(table_name, column_name):
-                """Safely check if column exists"""
-                try:
-                    columns = [col['name'] for col in inspector.get_columns(table_name)]
-                    return column_name in columns
-                except:
-                    return False
-            
-            # Check and add missing columns
-            with db.engine.connect() as conn:
-                # Check file_name in messages
-                if not column_exists_safe('messages', 'file_name'):
-                    try:
-                        conn.execute(text("ALTER TABLE messages ADD COLUMN file_name VARCHAR(255)"))
-                        conn.commit()
-                        print("✓ Runtime migration: Added file_name column to messages")
-                    except Exception as e:
-                        conn.rollback()
-                        print(f"⚠ Runtime migration: file_name may already exist: {e}")
-                
-                # Check profile_picture and display_name in users
-                if not column_exists_safe('users', 'profile_picture'):
-                    try:
-                        conn.execute(text("ALTER TABLE users ADD COLUMN profile_picture VARCHAR(255)"))
-                        conn.commit()
-                        print("✓ Runtime migration: Added profile_picture column to users")
-                    except Exception as e:
-                        conn.rollback()
-                        print(f"⚠ Runtime migration: profile_picture may already exist: {e}")
-                
-                if not column_exists_safe('users', 'display_name'):
-                    try:
-                        conn.execute(text("ALTER TABLE users ADD COLUMN display_name VARCHAR(100)"))
-                        conn.commit()
-                        print("✓ Runtime migration: Added display_name column to users")
-                    except Exception as e:
-                        conn.rollback()
-                        print(f"⚠ Runtime migration: display_name may already exist: {e}")
-        except Exception as e:
-            # Don't fail app startup if migrations fail - log and continue
-            print(f"⚠ Runtime migration check failed (non-critical): {e}")
-        
-        # Create upload directories if they don't exist
-        uploads_dir = os.path.join(root_dir, 'uploads')
-        audio_dir = os.path.join(uploads_dir, 'audio')
-        attachments_dir = os.path.join(uploads_dir, 'attachments')
-        profiles_dir = os.path.join(uploads_dir, 'profiles')
-        
-        os.makedirs(audio_dir, exist_ok=True)
-        os.makedirs(attachments_dir, exist_ok=True)
-        os.makedirs(profiles_dir, exist_ok=True)
+    # Schema is migrated offline by init_db.py (see app/migrations.py); startup only checks the version
+    from app.migrations import check_schema
+    check_schema(app, db)
+    
+    # Create upload directories if they don't exist
+    uploads_dir = os.path.join(root_dir, 'uploads')
+    audio_dir = os.path.join(uploads_dir, 'audio')
+    attachments_dir = os.path.join(uploads_dir, 'attachments')
+    profiles_dir = os.path.join(uploads_dir, 'profiles')
+    
+    os.makedirs(audio_dir, exist_ok=True)
+    os.makedirs(attachments_dir, exist_ok=True)
+    os.makedirs(profiles_dir, exist_ok=True)
     
     return app
 
-# Provide default WSGI application for servers expecting `app:app`
-# This mirrors `wsgi.py` but keeps compatibility if start command is misconfigured
-app = create_app()
-application = app
+def __getattr__(name):
+    """Build the default WSGI application on first access, for servers expecting `app:app`.
+    
+    This mirrors `wsgi.py` but keeps compatibility if the start command is misconfigured,
+    without importing the package (as wsgi.py, run.py and the scripts do) building an app.
+    """
+    if name in ('app', 'application'):
+        application = create_app()
+        globals().update(app=application, application=application)
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
@@ -0,0 +1,94 @@
+"""
+Static Assets
+Serves the output of build_assets.py: url_for('static', filename=...) is
+rewritten to the minified, content-hashed file from static/dist/manifest.json,
+which is sent precompressed (.br/.gz) with a one-year immutable Cache-Control
+"""
+
+import glob
+import hashlib
+import json
+import mimetypes
+import os
+from flask import current_app, request, send_from_directory
+from app.compression import choose_encoding
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+ASSET_PATTERNS = ('js/*.js', 'css/*.css')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def source_files(static_dir):
+    """Asset paths relative to static/, e.g. 'js/chat.js'"""
+    names = []
+    for pattern in ASSET_PATTERNS:
+        names.extend(os.path.relpath(path, static_dir).replace(os.sep, '/')
+                     for path in glob.glob(os.path.join(static_dir, pattern)))
+    return sorted(names)
+
+
+def load_manifest(static_dir):
+    """{source name: built name} for built assets whose source has not changed since the build"""
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST_NAME)) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    manifest = {}
+    stale = []
+    for name, entry in entries.items():
+        try:
+            with open(os.path.join(static_dir, name), 'rb') as f:
+                current = content_hash(f.read())
+        except OSError:
+            continue
+        # An edited source is served as is until the next build, rather than the old build
+        if current == entry.get('source_hash'):
+            manifest[name] = entry['file']
+        else:
+            stale.append(name)
+    if stale:
+        print(f"⚠ Built assets out of date for {', '.join(stale)}; run: python build_assets.py")
+    return manifest
+
+
+def fingerprint_static_url(endpoint, values):
+    """url_defaults hook pointing url_for('static', ...) at the built file"""
+    if endpoint == 'static':
+        built = current_app.extensions['asset_manifest'].get(values.get('filename'))
+        if built:
+            values['filename'] = built
+
+
+def serve_static(filename):
+    """Static route: built files go out precompressed and immutable, everything else as before"""
+    if not filename.startswith(f"{DIST_DIR}/"):
+        return current_app.send_static_file(filename)
+
+    static_dir = current_app.static_folder
+    available = [encoding for encoding, suffix in PRECOMPRESSED_SUFFIXES.items()
+                 if os.path.isfile(os.path.join(static_dir, filename + suffix))]
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'), available)
+    if encoding:
+        response = send_from_directory(static_dir, filename + PRECOMPRESSED_SUFFIXES[encoding],
+                                       mimetype=mimetypes.guess_type(filename)[0], max_age=IMMUTABLE_MAX_AGE)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_from_directory(static_dir, filename, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def configure_assets(app):
+    """Use the build from build_assets.py when there is one"""
+    app.extensions['asset_manifest'] = load_manifest(app.static_folder)
+    app.url_defaults(fingerprint_static_url)
+    app.view_functions['static'] = serve_static
@@ -0,0 +1,98 @@
+"""
+Attachment Metadata
+MIME types for uploads and a small in-memory cache of stored_files facts, so
+serving media can answer 404s, HEAD and revalidation without touching disk
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from app.models import StoredFile, load_media_info
+from app.metrics import count_cache
+
+AUDIO_MIME_TYPES = {
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'ogg': 'audio/ogg',
+    'webm': 'audio/webm',
+    'm4a': 'audio/mp4'
+}
+IMAGE_MIME_TYPES = {
+    'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png',
+    'gif': 'image/gif', 'webp': 'image/webp', 'bmp': 'image/bmp', 'svg': 'image/svg+xml'
+}
+VIDEO_MIME_TYPES = {
+    'mp4': 'video/mp4', 'webm': 'video/webm', 'ogg': 'video/ogg',
+    'mov': 'video/quicktime', 'avi': 'video/x-msvideo', 'mkv': 'video/x-matroska'
+}
+DOCUMENT_MIME_TYPES = {
+    'pdf': 'application/pdf',
+    'doc': 'application/msword', 'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xls': 'application/vnd.ms-excel', 'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'ppt': 'application/vnd.ms-powerpoint', 'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'txt': 'text/plain', 'rtf': 'application/rtf', 'csv': 'text/csv'
+}
+# Extension-only lookup for files without a stored_files row; ambiguous
+# containers (ogg, webm) resolve to audio as they always have
+ATTACHMENT_MIME_TYPES = {**IMAGE_MIME_TYPES, **VIDEO_MIME_TYPES, **DOCUMENT_MIME_TYPES, **AUDIO_MIME_TYPES}
+MIME_TYPES_BY_FILE_TYPE = {
+    'image': IMAGE_MIME_TYPES,
+    'video': VIDEO_MIME_TYPES,
+    'audio': AUDIO_MIME_TYPES,
+    'file': DOCUMENT_MIME_TYPES
+}
+
+ATTACHMENT_CACHE_SIZE = 4096  # Files whose metadata is kept in memory
+ATTACHMENT_MISS_TTL = 30  # Seconds a "no such file" answer is cached
+
+# {url: (expires_at or None, metadata dict or None)}, least recently used first
+_metadata_cache = OrderedDict()
+_metadata_lock = threading.Lock()  # Held for cache reads and writes, never across the database query
+
+
+def guess_mime_type(ext, file_type=None):
+    """MIME type for an extension, using the upload's file type to pick between audio and video containers"""
+    ext = (ext or '').lower()
+    return MIME_TYPES_BY_FILE_TYPE.get(file_type, {}).get(ext) or ATTACHMENT_MIME_TYPES.get(ext) or 'application/octet-stream'
+
+
+def get_attachment_metadata(url):
+    """Return cached stored_files facts for an upload URL, or None if there is no such upload"""
+    with _metadata_lock:
+        entry = _metadata_cache.get(url)
+        if entry is not None:
+            expires_at, metadata = entry
+            if expires_at is None or expires_at > time.time():
+                _metadata_cache.move_to_end(url)
+            else:
+                entry = None
+    if entry is not None:
+        count_cache('attachment_metadata', 'hit')
+        return metadata
+
+    count_cache('attachment_metadata', 'miss')
+    stored_file = StoredFile.query.filter_by(path=url).first()
+    if stored_file:
+        metadata = {
+            'sha256': stored_file.sha256,
+            'size': stored_file.size,
+            'mime_type': stored_file.mime_type,
+            'media_info': load_media_info(stored_file.media_info)
+        }
+        entry = (None, metadata)
+    else:
+        metadata = None
+        entry = (time.time() + ATTACHMENT_MISS_TTL, None)
+
+    with _metadata_lock:
+        _metadata_cache[url] = entry
+        _metadata_cache.move_to_end(url)
+        while len(_metadata_cache) > ATTACHMENT_CACHE_SIZE:
+            _metadata_cache.popitem(last=False)
+    return metadata
+
+
+def invalidate_attachment_metadata(url):
+    """Forget cached metadata after an upload is stored, changed or deleted"""
+    with _metadata_lock:
+        _metadata_cache.pop(url, None)
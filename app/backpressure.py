@@ -0,0 +1,183 @@
+"""
+Socket.IO Backpressure
+Per-connection outbound queue limits, so one client on a bad network cannot
+grow its queue without bound. Past SOCKET_QUEUE_DROP queued packets, typing
+and presence events are dropped. Past SOCKET_QUEUE_RESYNC, everything is
+dropped and the client gets a single 'resync' hint to refetch once it catches
+up. A client still behind after SOCKET_SLOW_DISCONNECT seconds is disconnected.
+"""
+
+import threading
+import time
+from socketio import packet
+
+# Safe to lose: the next one (or a refetch) replaces them
+DROPPABLE_EVENTS = frozenset({'user_typing', 'stop_typing', 'user_status', 'room_members_update'})
+RESYNC_EVENT = 'resync'
+
+# Private python-socketio/python-engineio internals the limits hook into, written against
+# python-socketio 5.10.0 and python-engineio 4.9.0 (requirements.txt). install() refuses to run
+# without them rather than silently leaving queues unbounded after an upgrade
+SERVER_HOOKS = ('_send_eio_packet', '_send_packet', 'packet_class')
+ENGINE_HOOKS = ('sockets', 'get_queue_empty_exception')
+
+
+def event_of(data):
+    """(event name, binary attachment count) of an encoded Socket.IO event packet, or (None, 0)"""
+    if data[:1] not in ('2', '5'):
+        return None, 0
+    attachments = int(data[1:data.index('-')]) if data[0] == '5' else 0
+    start = data.index('[') + 2
+    return data[start:data.index('"', start)], attachments
+
+
+class Backpressure:
+    """Outbound queue policy for every connection of a Socket.IO server"""
+
+    def __init__(self, server, drop_depth, resync_depth, disconnect_after):
+        self.server = server
+        self.drop_depth = drop_depth
+        self.resync_depth = resync_depth
+        self.disconnect_after = disconnect_after
+        self.resyncing = {}  # {eio_sid: time the resync hint was queued}
+        self.dropping_attachments = {}  # {eio_sid: binary attachments of a dropped event still to come}
+        self.dropped = {}  # {event: packets dropped}
+        self.resyncs = 0
+        self.disconnects = 0
+        self.lock = threading.Lock()
+
+    def queue_depth(self, eio_sid):
+        socket = self.server.eio.sockets.get(eio_sid)
+        return socket.queue.qsize() if socket is not None else 0
+
+    def admit(self, eio_sid, event):
+        """True if an event may be queued for the connection, False to drop it"""
+        depth = self.queue_depth(eio_sid)
+        if depth < self.drop_depth and eio_sid not in self.resyncing:
+            return True
+
+        with self.lock:
+            since = self.resyncing.get(eio_sid)
+            if since is not None:
+                if depth < self.drop_depth:
+                    # The hint (queued last) has been sent: the client is refetching and caught up
+                    del self.resyncing[eio_sid]
+                    return True
+                if time.time() - since > self.disconnect_after:
+                    # Keeps dropping (without rescheduling) until disconnect() removes it
+                    self.resyncing[eio_sid] = float('inf')
+                    self.disconnects += 1
+                    self.server.start_background_task(self.disconnect, eio_sid)
+            elif depth >= self.resync_depth:
+                # Forget connections that closed while resyncing
+                for stale in [sid for sid in self.resyncing if sid not in self.server.eio.sockets]:
+                    del self.resyncing[stale]
+                self.resyncing[eio_sid] = time.time()
+                self.resyncs += 1
+                self.send_resync(eio_sid)
+            elif event not in DROPPABLE_EVENTS:
+                return True
+            self.dropped[event] = self.dropped.get(event, 0) + 1
+        return False
+
+    def admit_eio_packet(self, eio_sid, data):
+        """admit() for a pre-encoded packet of a broadcast; a binary event's attachments share its fate"""
+        if isinstance(data, bytes):
+            remaining = self.dropping_attachments.get(eio_sid)
+            if remaining is None:
+                return True
+            if remaining <= 1:
+                del self.dropping_attachments[eio_sid]
+            else:
+                self.dropping_attachments[eio_sid] = remaining - 1
+            return False
+
+        if self.queue_depth(eio_sid) < self.drop_depth and eio_sid not in self.resyncing:
+            return True
+        event, attachments = event_of(data)
+        if event is None or self.admit(eio_sid, event):
+            return True
+        if attachments:
+            self.dropping_attachments[eio_sid] = attachments
+        return False
+
+    def send_resync(self, eio_sid):
+        """Queue the resync hint behind the backlog (bypassing the limits)"""
+        self.send_packet(eio_sid, self.server.packet_class(packet.EVENT, namespace='/', data=[
+            RESYNC_EVENT, {'reason': 'slow_connection'}
+        ]))
+        print(f"⚠ Socket {eio_sid} is {self.resync_depth}+ packets behind; dropping its events until it resyncs")
+
+    def disconnect(self, eio_sid):
+        """Close a connection that never caught up, discarding its backlog"""
+        socket = self.server.eio.sockets.get(eio_sid)
+        with self.lock:
+            self.resyncing.pop(eio_sid, None)
+        if socket is None:
+            return
+        # Otherwise the writer would keep sending the backlog before it reaches the close marker
+        try:
+            while True:
+                socket.queue.get(block=False)
+                socket.queue.task_done()
+        except self.server.eio.get_queue_empty_exception():
+            pass
+        socket.close(wait=False, abort=True)
+        self.server.eio.sockets.pop(eio_sid, None)
+        self.dropping_attachments.pop(eio_sid, None)
+        print(f"⚠ Disconnected socket {eio_sid}: still behind {self.disconnect_after:.0f}s after a resync")
+
+    def install(self):
+        """Route the server's outbound Socket.IO packets through the limits"""
+        server = self.server
+        missing = [name for name in SERVER_HOOKS if not hasattr(server, name)]
+        missing += [f"eio.{name}" for name in ENGINE_HOOKS if not hasattr(getattr(server, 'eio', None), name)]
+        if missing:
+            raise RuntimeError(
+                f"Socket.IO backpressure cannot hook this python-socketio version (missing {', '.join(missing)}); "
+                f"use the versions in requirements.txt or set SOCKET_QUEUE_DROP=0"
+            )
+        send_eio_packet = server._send_eio_packet
+        self.send_packet = server._send_packet
+
+        def _send_eio_packet(eio_sid, eio_pkt):
+            # Broadcasts: packets encoded once and sent to each recipient
+            if self.admit_eio_packet(eio_sid, eio_pkt.data):
+                send_eio_packet(eio_sid, eio_pkt)
+
+        def _send_packet(eio_sid, pkt):
+            # Everything else (acks, connect and disconnect packets always go out)
+            if pkt.packet_type not in (packet.EVENT, packet.BINARY_EVENT) or self.admit(eio_sid, pkt.data[0]):
+                self.send_packet(eio_sid, pkt)
+
+        server._send_eio_packet = _send_eio_packet
+        server._send_packet = _send_packet
+
+    def stats(self):
+        """Outbound queue depths and policy counters"""
+        depths = [socket.queue.qsize() for socket in list(self.server.eio.sockets.values())]
+        return {
+            'connections': len(depths),
+            'queued_packets': sum(depths),
+            'max_queue_depth': max(depths, default=0),
+            'over_drop_depth': sum(1 for depth in depths if depth >= self.drop_depth),
+            'resyncing': len(self.resyncing),
+            'dropped': dict(self.dropped),
+            'resyncs': self.resyncs,
+            'disconnects': self.disconnects,
+        }
+
+
+def configure_backpressure(app, socketio):
+    """Apply the outbound queue limits to the app's Socket.IO server (SOCKET_QUEUE_DROP=0 disables them)"""
+    drop_depth = app.config.get('SOCKET_QUEUE_DROP', 0)
+    if drop_depth <= 0:
+        return
+    backpressure = Backpressure(
+        socketio.server,
+        drop_depth=drop_depth,
+        resync_depth=max(app.config.get('SOCKET_QUEUE_RESYNC', drop_depth * 5), drop_depth),
+        disconnect_after=app.config.get('SOCKET_SLOW_DISCONNECT', 30)
+    )
+    backpressure.install()
+    app.extensions['socket_backpressure'] = backpressure
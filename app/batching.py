@@ -0,0 +1,92 @@
+"""
+Broadcast Batching
+Adaptive batching of a busy room's hot broadcasts: once a room sends more
+than BROADCAST_BATCH_RATE events a second, its events are collected for one
+tick (BROADCAST_BATCH_TICK_MS) and sent as a single 'message_batch' frame
+"""
+
+import threading
+import time
+from flask import current_app
+from app.wire import BATCH_EVENT, emit_frame
+
+TYPING_EVENTS = ('user_typing', 'stop_typing')
+
+
+class RoomBatcher:
+    """Event rate of each room and the events waiting for its next tick"""
+
+    def __init__(self, rate_threshold, tick):
+        self.rate_threshold = rate_threshold
+        self.tick = tick
+        self.rates = {}  # {room: (start of the current one-second window, events in it)}
+        self.pending = {}  # {room: [(event, data)]}
+        self.lock = threading.Lock()
+
+    def count(self, room, now):
+        """Count one event against the room's rate; True while the room is over the threshold"""
+        started, events = self.rates.get(room, (now, 0))
+        if now - started >= 1:
+            started, events = now, 0
+        self.rates[room] = (started, events + 1)
+        return events + 1 > self.rate_threshold
+
+    def add(self, room, event, data):
+        """Queue an event for the room's tick; returns True if it opened the tick.
+
+        Only the latest typing state of each user is kept: within a tick the
+        earlier ones would be overwritten on screen anyway.
+        """
+        opened = room not in self.pending
+        entries = self.pending.setdefault(room, [])
+        if event in TYPING_EVENTS:
+            entries[:] = [entry for entry in entries
+                          if not (entry[0] in TYPING_EVENTS and entry[1].get('user_id') == data.get('user_id'))]
+        entries.append((event, data))
+        return opened
+
+    def take(self, room):
+        with self.lock:
+            return self.pending.pop(room, [])
+
+
+def broadcast(event, data, room, include_self=True):
+    """emit_frame, except that a busy room's events wait for the room's next tick and go out together.
+
+    A batch is one frame for everyone in the room, so include_self=False is
+    left to the client (it ignores its own typing events).
+    """
+    batcher = current_app.extensions.get('broadcast_batcher')
+    if batcher is None:
+        return emit_frame(event, data, room, include_self)
+
+    with batcher.lock:
+        busy = batcher.count(room, time.monotonic())
+        # Once a tick is open, later events join it so the room's order is kept
+        if not busy and room not in batcher.pending:
+            opened = None
+        else:
+            opened = batcher.add(room, event, data)
+    if opened is None:
+        emit_frame(event, data, room, include_self)
+    elif opened:
+        from app import socketio
+        socketio.start_background_task(_flush_after_tick, current_app._get_current_object(), batcher, room)
+
+
+def _flush_after_tick(app, batcher, room):
+    from app import socketio
+
+    socketio.sleep(batcher.tick)
+    entries = batcher.take(room)
+    if entries:
+        with app.app_context():
+            emit_frame(BATCH_EVENT, [[event, data] for event, data in entries], room)
+
+
+def configure_batching(app):
+    """Enable broadcast batching unless BROADCAST_BATCH_RATE is 0"""
+    rate = app.config.get('BROADCAST_BATCH_RATE', 0)
+    if rate <= 0:
+        return
+    app.extensions['broadcast_batcher'] = RoomBatcher(rate, app.config.get('BROADCAST_BATCH_TICK_MS', 40) / 1000)
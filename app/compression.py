@@ -0,0 +1,169 @@
+"""
+Response Compression
+Negotiated brotli/gzip compression of HTTP responses (JSON APIs, pages and
+static text assets; media and other already-compressed types pass through)
+and a size threshold for WebSocket permessage-deflate
+"""
+
+import gzip
+import sys
+import threading
+from flask import request
+from app.metrics import count_cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 500  # Smaller bodies are not worth a compressor run (and may grow)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Close to gzip -6 in CPU and smaller; 11 is ~70x slower and would stall the worker
+STATIC_CACHE_ENTRIES = 64  # Compressed static files kept in memory, keyed by ETag and encoding
+STATIC_MAX_SIZE = 2 * 1024 * 1024  # Larger static files are sent as they are
+
+# Text formats worth compressing; images, audio, video, archives and PDFs are already compressed
+COMPRESSIBLE_MIMETYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/xml',
+    'application/manifest+json', 'image/svg+xml',
+)
+
+_static_cache = {}
+_static_cache_lock = threading.Lock()
+
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_MIMETYPES)
+
+
+def choose_encoding(accept_encoding, available=None):
+    """Pick 'br' or 'gzip' (of those available) from an Accept-Encoding header, honouring q=0; or None"""
+    if available is None:
+        available = ('br', 'gzip') if brotli is not None else ('gzip',)
+    accepted = {}
+    for part in (accept_encoding or '').lower().split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    if 'br' in available and accepted.get('br', 0) > 0:
+        return 'br'
+    if 'gzip' in available and accepted.get('gzip', accepted.get('*', 0)) > 0:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _compress_static(response, encoding):
+    """Compressed body of a static file response, cached by its ETag"""
+    etag, _ = response.get_etag()
+    key = (etag, encoding)
+    body = _static_cache.get(key)
+    count_cache('static_compression', 'miss' if body is None else 'hit')
+    if body is None:
+        response.direct_passthrough = False
+        body = compress(response.get_data(), encoding)
+        with _static_cache_lock:
+            if len(_static_cache) >= STATIC_CACHE_ENTRIES:
+                _static_cache.pop(next(iter(_static_cache)))
+            _static_cache[key] = body
+    return body
+
+
+def compress_response(response):
+    """after_request hook: compress a response body when the client accepts it and it is worth it"""
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or request.method == 'HEAD' \
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype) \
+            or 'no-transform' in response.headers.get('Cache-Control', ''):
+        return response
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+
+    if response.direct_passthrough:
+        # File responses: only the app's own static assets (uploads are users' files, often large)
+        if request.endpoint != 'static' or not response.content_length \
+                or not COMPRESS_MIN_SIZE <= response.content_length <= STATIC_MAX_SIZE:
+            return response
+        body = _compress_static(response, encoding)
+    elif response.is_streamed:
+        return response
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        body = compress(data, encoding)
+
+    response.direct_passthrough = False
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # Same content, different bytes: a strong validator would be wrong for this representation
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def configure_compression(app):
+    """Compress HTTP responses unless HTTP_COMPRESSION is off, and apply WS_COMPRESSION_THRESHOLD"""
+    if app.config.get('HTTP_COMPRESSION', True):
+        app.after_request(compress_response)
+    threshold = app.config.get('WS_COMPRESSION_THRESHOLD', 0)
+    if threshold > 0:
+        configure_websocket_compression(threshold)
+
+
+def configure_websocket_compression(threshold):
+    """Skip permessage-deflate for WebSocket messages smaller than threshold bytes.
+
+    Both WebSocket servers Engine.IO uses (simple-websocket under threading,
+    eventlet in production) negotiate permessage-deflate whenever the browser
+    offers it and compress every message; neither takes a threshold, so the
+    class each one builds its compressor from is swapped for a subclass.
+    Uncompressed messages are legal on a deflate connection (RSV1 is per message).
+    """
+    # Each server is only loaded in its async mode (importing the other would cost startup time)
+    if 'simple_websocket' in sys.modules:
+        import simple_websocket.ws
+        from wsproto.extensions import PerMessageDeflate
+        from wsproto.frame_protocol import Opcode
+
+        class ThresholdPerMessageDeflate(PerMessageDeflate):
+            compression_threshold = threshold
+
+            def frame_outbound(self, proto, opcode, rsv, data, fin):
+                if opcode in (Opcode.TEXT, Opcode.BINARY) and fin and len(data) < self.compression_threshold:
+                    return (rsv, data)
+                return super().frame_outbound(proto, opcode, rsv, data, fin)
+
+        simple_websocket.ws.PerMessageDeflate = ThresholdPerMessageDeflate
+
+    if 'eventlet' not in sys.modules:
+        return
+    import eventlet.websocket
+    # A second create_app in the same process must not stack subclasses
+    base = getattr(eventlet.websocket.RFC6455WebSocket, 'base_class', eventlet.websocket.RFC6455WebSocket)
+
+    class ThresholdWebSocket(base):
+        base_class = base
+        compression_threshold = threshold
+        _compress_next = True
+
+        def _pack_message(self, message, **kwargs):
+            self._compress_next = len(message) >= self.compression_threshold
+            return super()._pack_message(message, **kwargs)
+
+        def _get_permessage_deflate_enc(self):
+            return super()._get_permessage_deflate_enc() if self._compress_next else None
+
+    eventlet.websocket.RFC6455WebSocket = ThresholdWebSocket
@@ -0,0 +1,223 @@
+"""
+Database Engine Tuning
+SQLite connection profile (WAL journal, relaxed fsync, busy timeout, larger
+caches) applied to every pooled connection, a periodic WAL checkpoint, and
+read/write routing of session queries to read replicas
+"""
+
+import time
+import threading
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text, Select
+
+# Applied with PRAGMA on each new connection when SQLITE_PROFILE=wal (the default)
+SQLITE_WAL_PRAGMAS = {
+    'journal_mode': 'WAL',            # Readers no longer block the writer (or each other)
+    'synchronous': 'NORMAL',          # fsync at checkpoints instead of every commit; safe with WAL
+    'busy_timeout': 5000,             # ms to wait for the write lock before "database is locked"
+    'cache_size': -20000,             # Page cache per connection in KiB (negative) - about 20 MB
+    'mmap_size': 256 * 1024 * 1024,   # Read pages through the OS page cache instead of copying
+    'temp_store': 'MEMORY',           # Sorts and temp indexes stay off disk
+}
+SQLITE_PROFILES = {
+    'wal': SQLITE_WAL_PRAGMAS,
+    'default': {},  # SQLite's own defaults: rollback journal, synchronous=FULL
+}
+
+
+def is_sqlite(app):
+    return app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')
+
+
+def sqlite_profile(app):
+    """The configured SQLITE_PROFILE; an unknown name fails startup rather than silently meaning 'wal'"""
+    profile = (app.config.get('SQLITE_PROFILE') or 'wal').strip().lower()
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLITE_PROFILE {profile!r}; expected one of: {', '.join(SQLITE_PROFILES)}")
+    return profile
+
+
+def configure_sqlite(app, db):
+    """Install a connect hook that applies the SQLITE_PROFILE pragmas to the primary and any SQLite
+    replicas (must run before the first connection)"""
+    with app.app_context():
+        engines = [engine for engine in db.engines.values() if engine.dialect.name == 'sqlite']
+    if not engines:
+        return
+    pragmas = SQLITE_PROFILES[sqlite_profile(app)]
+    if not pragmas:
+        return
+
+    def apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    for engine in engines:
+        event.listen(engine, 'connect', apply_sqlite_pragmas)
+
+
+def checkpoint_sqlite(db):
+    """Fold the WAL back into the database file and truncate it; returns (busy, wal_pages, checkpointed_pages)"""
+    with db.engine.connect() as conn:
+        return tuple(conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)")).fetchone())
+
+
+def start_sqlite_checkpoints(app):
+    """Checkpoint the WAL every SQLITE_CHECKPOINT_INTERVAL seconds as a Socket.IO background task.
+
+    SQLite's automatic checkpoints run inside whichever commit crosses the
+    threshold and never shrink the WAL file; this keeps both off the request path.
+    """
+    interval = app.config.get('SQLITE_CHECKPOINT_INTERVAL', 0)
+    if not is_sqlite(app) or sqlite_profile(app) != 'wal' or interval <= 0:
+        return
+    if app.extensions.get('sqlite_checkpoints'):
+        return
+    app.extensions['sqlite_checkpoints'] = True
+
+    from app import socketio
+    from app.models import db
+
+    def run():
+        while True:
+            socketio.sleep(interval)
+            with app.app_context():
+                try:
+                    busy, wal_pages, checkpointed = checkpoint_sqlite(db)
+                    if busy:
+                        print(f"⚠ SQLite checkpoint: database busy, {checkpointed}/{wal_pages} WAL pages copied")
+                except Exception as e:
+                    print(f"⚠ SQLite checkpoint failed: {e}")
+
+    socketio.start_background_task(run)
+
+
+# ---------------------------------------------------------------------------
+# Read replicas
+# ---------------------------------------------------------------------------
+
+# Seconds a PostgreSQL standby is behind: 0 when it has replayed everything it received,
+# NULL (treated as 0) when the server is not a standby at all
+POSTGRES_REPLICA_LAG_SQL = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+PINNED_USERS_PRUNE_SIZE = 10000  # Drop expired read-your-writes pins once this many are tracked
+
+
+def replica_lag(engine):
+    """Seconds a replica is behind the primary (SQLite copies cannot tell and report 0)"""
+    if engine.dialect.name != 'postgresql':
+        return 0.0
+    with engine.connect() as conn:
+        return float(conn.execute(text(POSTGRES_REPLICA_LAG_SQL)).scalar() or 0)
+
+
+class ReplicaSet:
+    """Replica engines (SQLALCHEMY_BINDS 'replica_N'), their last measured lag and read-your-writes pins"""
+
+    def __init__(self, keys, pin_seconds, max_lag, check_interval):
+        self.keys = keys
+        self.pin_seconds = pin_seconds
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag = {key: 0.0 for key in keys}  # None while a replica is unreachable
+        self.checked_at = 0
+        self.pinned_until = {}  # {user_id: time until which the user's reads go to the primary}
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def pin(self, user_id):
+        """Send this user's reads to the primary for pin_seconds after a write"""
+        now = time.time()
+        with self.lock:
+            self.pinned_until[user_id] = now + self.pin_seconds
+            if len(self.pinned_until) > PINNED_USERS_PRUNE_SIZE:
+                self.pinned_until = {uid: until for uid, until in self.pinned_until.items() if until > now}
+
+    def is_pinned(self, user_id):
+        return self.pinned_until.get(user_id, 0) > time.time()
+
+    def check_lag(self, engines):
+        """Re-measure replica lag at most once per check_interval (one caller does it, the rest move on)"""
+        with self.lock:
+            if time.time() - self.checked_at < self.check_interval:
+                return
+            self.checked_at = time.time()
+        for key in self.keys:
+            try:
+                lag = replica_lag(engines[key])
+            except Exception as e:
+                lag = None
+                if self.lag[key] is not None:
+                    print(f"⚠ Read replica {key} unavailable, reading from the primary: {e}")
+            self.lag[key] = lag
+
+    def choose(self, engines):
+        """Return the next replica engine within max_lag, or None to use the primary"""
+        self.check_lag(engines)
+        healthy = [key for key in self.keys if self.lag[key] is not None and self.lag[key] <= self.max_lag]
+        if not healthy:
+            return None
+        with self.lock:
+            self.next = (self.next + 1) % len(healthy)
+            return engines[healthy[self.next]]
+
+
+def _current_user_id():
+    """Id of the logged-in user from Flask-Login's session cookie entry (known before the user is loaded)"""
+    return flask_session.get('_user_id')
+
+
+class RoutingSession(Session):
+    """db.session that sends request-time SELECTs to a read replica.
+
+    Everything else goes to the primary: writes and flushes, SELECT ... FOR UPDATE,
+    reads later in a session that has written, reads by a user who wrote within
+    REPLICA_PIN_SECONDS (read-your-writes), and all background jobs and scripts.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and isinstance(clause, Select) and clause._for_update_arg is None \
+                and not self._flushing and not self.info.get('wrote') and has_request_context():
+            replicas = current_app.extensions.get('db_replicas')
+            if replicas is not None:
+                user_id = _current_user_id()
+                if user_id is None or not replicas.is_pinned(user_id):
+                    engine = replicas.choose(self._db.engines)
+                    if engine is not None:
+                        return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_write(session, flush_context):
+    session.info['wrote'] = True
+    if has_request_context():
+        session.info['writer'] = _current_user_id()
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_writer(session):
+    user_id = session.info.pop('writer', None)
+    replicas = current_app.extensions.get('db_replicas') if has_request_context() else None
+    if user_id is not None and replicas is not None:
+        replicas.pin(user_id)
+
+
+def configure_replicas(app):
+    """Enable replica routing for the replica binds configured from DATABASE_REPLICA_URLS"""
+    keys = sorted(key for key in app.config.get('SQLALCHEMY_BINDS', {}) if key.startswith('replica_'))
+    if not keys:
+        return
+    app.extensions['db_replicas'] = ReplicaSet(
+        keys,
+        pin_seconds=app.config.get('REPLICA_PIN_SECONDS', 5),
+        max_lag=app.config.get('REPLICA_MAX_LAG', 2),
+        check_interval=app.config.get('REPLICA_CHECK_INTERVAL', 5)
+    )
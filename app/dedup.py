@@ -0,0 +1,75 @@
+"""
+Send Deduplication
+Idempotent send_message retries: the client tags each message with its own
+id and resends it with the same id until the server acknowledges it. The
+acks of recent sends are kept in a bounded in-memory window, so a retry is
+answered without touching the database; older retries (or ones reaching
+another worker) are caught by the primary key of message_client_ids
+(user_id, client_id), a separate table so the guarantee also holds once
+messages is partitioned.
+"""
+
+import threading
+from collections import OrderedDict
+from flask import current_app
+from app.models import MessageClientId
+from app.metrics import count_cache
+
+CLIENT_ID_MAX_LENGTH = 64  # Matches messages.client_id; clients send UUIDs
+
+
+def parse_client_id(value):
+    """A usable client message id, or None (messages without one are not deduplicated)"""
+    if isinstance(value, str) and 0 < len(value) <= CLIENT_ID_MAX_LENGTH:
+        return value
+    return None
+
+
+def forget_client_ids(message_ids):
+    """Delete the dedup keys of messages being deleted (caller commits).
+    
+    message_ids is a list or a subquery of ids. Without this a key would outlive
+    its message, and once SQLite reuses the id a resend would be acked as another message.
+    """
+    MessageClientId.query.filter(MessageClientId.message_id.in_(message_ids)).delete(synchronize_session=False)
+
+
+def message_ack(message_data, duplicate=False):
+    """Ack for a stored message: enough for the sender to confirm its optimistic copy"""
+    return {
+        'ok': True,
+        'id': message_data['id'],
+        'client_id': message_data.get('client_id'),
+        'timestamp': message_data['timestamp'],
+        'formatted_time': message_data['formatted_time'],
+        'duplicate': duplicate,
+    }
+
+
+class RecentSends:
+    """Acks of the last `size` messages sent with a client id"""
+
+    def __init__(self, size):
+        self.size = size
+        self.acks = OrderedDict()  # {(user_id, client_id): ack}
+        self.lock = threading.Lock()
+
+    def get(self, user_id, client_id):
+        ack = self.acks.get((user_id, client_id))
+        count_cache('send_dedup', 'miss' if ack is None else 'hit')
+        return ack
+
+    def add(self, user_id, client_id, ack):
+        with self.lock:
+            self.acks[(user_id, client_id)] = ack
+            while len(self.acks) > self.size:
+                self.acks.popitem(last=False)
+
+
+def recent_sends():
+    return current_app.extensions['recent_sends']
+
+
+def configure_dedup(app):
+    """Keep the acks of the last SEND_DEDUP_WINDOW sends in memory"""
+    app.extensions['recent_sends'] = RecentSends(max(app.config.get('SEND_DEDUP_WINDOW', 10000), 0))
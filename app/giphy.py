@@ -0,0 +1,150 @@
+"""
+Giphy Client
+Cached, coalesced access to the Giphy search/trending API over a pooled HTTP
+session, with a circuit breaker that falls back to stale results
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+
+# Point GIPHY_API_URL at a local stub server to develop or test without Giphy
+GIPHY_API_URL = os.environ.get('GIPHY_API_URL', 'https://api.giphy.com/v1/gifs').rstrip('/')
+# Public beta key - get your own from https://developers.giphy.com/ for production
+GIPHY_API_KEY = os.environ.get('GIPHY_API_KEY', 'GlVGYHkr3WSBnllca54iNt0yFbjz7L65')
+GIPHY_TIMEOUT = (2, float(os.environ.get('GIPHY_TIMEOUT', 2.5)))  # (connect, read) seconds
+GIPHY_MAX_LIMIT = 50
+
+GIPHY_CACHE_SIZE = 512  # Distinct (endpoint, query, limit) results kept
+GIPHY_CACHE_TTL = {'search': 10 * 60, 'trending': 60}  # Seconds a result is served without refetching
+GIPHY_STALE_TTL = 24 * 60 * 60  # Seconds an expired result may still stand in while Giphy is down
+
+GIPHY_BREAKER_THRESHOLD = 3  # Consecutive failures that open the circuit
+GIPHY_BREAKER_COOLDOWN = 30  # Seconds to skip Giphy once the circuit is open
+
+
+class GiphyUnavailable(Exception):
+    """Giphy failed and there is no cached result to fall back on"""
+
+
+# {(endpoint, query, limit): (fetched_at, gifs)}, least recently used first
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Requests currently being fetched: {key: threading.Event}; followers wait on the leader's event
+_in_flight = {}
+
+_failures = 0
+_circuit_open_until = 0
+
+_session = None
+
+
+def get_session():
+    """Shared keep-alive session so searches reuse TLS connections to Giphy"""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _session = session
+    return _session
+
+
+def _simplify(data):
+    """Keep only the fields the GIF picker uses"""
+    gifs = []
+    for gif in data.get('data', []):
+        images = gif.get('images', {})
+        gifs.append({
+            'id': gif.get('id'),
+            'url': images.get('original', {}).get('url'),
+            'preview': images.get('preview_gif', {}).get('url'),
+            'title': gif.get('title', '')
+        })
+    return gifs
+
+
+def _fetch(endpoint, query, limit):
+    """Call Giphy once and return the simplified GIF list, tracking failures for the circuit breaker"""
+    global _failures, _circuit_open_until
+    params = {'api_key': GIPHY_API_KEY, 'limit': limit, 'rating': 'g'}
+    if query:
+        params['q'] = query
+    try:
+        response = get_session().get(f"{GIPHY_API_URL}/{endpoint}", params=params, timeout=GIPHY_TIMEOUT)
+        response.raise_for_status()
+        gifs = _simplify(response.json())
+    except Exception:
+        _failures += 1
+        if _failures >= GIPHY_BREAKER_THRESHOLD:
+            _circuit_open_until = time.time() + GIPHY_BREAKER_COOLDOWN
+        raise
+    _failures = 0
+    return gifs
+
+
+def get_gifs(endpoint, query='', limit=20):
+    """Return (gifs, cache_status) for a search or trending request.
+
+    cache_status is 'HIT', 'MISS' or 'STALE'. Identical concurrent requests share
+    one upstream call. Raises GiphyUnavailable when Giphy fails and nothing is cached.
+    """
+    query = ' '.join(query.lower().split())
+    limit = max(1, min(limit, GIPHY_MAX_LIMIT))
+    key = (endpoint, query, limit)
+
+    with _cache_lock:
+        now = time.time()
+        cached = _cache.get(key)
+        if cached:
+            _cache.move_to_end(key)
+            if now - cached[0] < GIPHY_CACHE_TTL.get(endpoint, 60):
+                return cached[1], 'HIT'
+        stale = cached[1] if cached and now - cached[0] < GIPHY_STALE_TTL else None
+
+        if now < _circuit_open_until:
+            # Giphy has been failing; don't make users wait on it
+            if stale is not None:
+                return stale, 'STALE'
+            raise GiphyUnavailable('Giphy is temporarily unavailable')
+
+        waiting = _in_flight.get(key)
+        if waiting is None:
+            done = threading.Event()
+            _in_flight[key] = done
+
+    if waiting is not None:
+        # Another request is already fetching this key; wait for it, then re-read the cache
+        waiting.wait(GIPHY_TIMEOUT[0] + GIPHY_TIMEOUT[1])
+        with _cache_lock:
+            cached = _cache.get(key)
+            if cached and time.time() - cached[0] < GIPHY_CACHE_TTL.get(endpoint, 60):
+                return cached[1], 'HIT'
+            if stale is not None:
+                return stale, 'STALE'
+        raise GiphyUnavailable('Giphy request failed')
+
+    try:
+        gifs = _fetch(endpoint, query, limit)
+    except Exception as e:
+        with _cache_lock:
+            _in_flight.pop(key, None)
+        done.set()
+        if stale is not None:
+            return stale, 'STALE'
+        raise GiphyUnavailable(str(e))
+
+    # Cache before waking followers so they find the result
+    with _cache_lock:
+        _cache[key] = (time.time(), gifs)
+        _cache.move_to_end(key)
+        while len(_cache) > GIPHY_CACHE_SIZE:
+            _cache.popitem(last=False)
+        _in_flight.pop(key, None)
+    done.set()
+    return gifs, 'MISS'
@@ -0,0 +1,300 @@
+"""
+Metrics
+Prometheus metrics at /metrics: latency histograms per HTTP route and per
+Socket.IO event, database queries and query time per request or event,
+Socket.IO frames and bytes sent, connected sockets, active rooms, outbound
+queues and cache hit rates.
+
+Per-frame and per-query accounting uses plain counters that are read at
+scrape time: a prometheus_client Counter costs about 1 us per increment,
+which would add up on every recipient of a broadcast.
+"""
+
+import hmac
+import threading
+from time import perf_counter
+from flask import current_app, g, request, Response, jsonify
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+    from prometheus_client import GCCollector, PlatformCollector, ProcessCollector, disable_created_metrics
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+except ImportError:
+    CollectorRegistry = None
+
+HTTP_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+EVENT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+QUERY_TIME_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+
+_local = threading.local()  # .unit: the QueryUnit of the request or event this thread is handling
+_tally_lock = threading.Lock()
+_query_totals = {}  # {source: [queries, seconds]}, source being 'http', 'socketio' or 'background'
+_cache_counts = {}  # {(cache, result): lookups}
+_engine_listening = False
+
+
+class QueryUnit:
+    """Database queries issued while handling one HTTP request or Socket.IO event"""
+    __slots__ = ('source', 'queries', 'query_time')
+
+    def __init__(self, source):
+        self.source = source
+        self.queries = 0
+        self.query_time = 0.0
+
+
+def begin_unit(source):
+    unit = QueryUnit(source)
+    _local.unit = unit
+    return unit
+
+
+def end_unit(unit):
+    _local.unit = None
+    _add_queries(unit.source, unit.queries, unit.query_time)
+
+
+def _add_queries(source, queries, seconds):
+    with _tally_lock:
+        totals = _query_totals.setdefault(source, [0, 0.0])
+        totals[0] += queries
+        totals[1] += seconds
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info.pop('query_started', perf_counter())
+    unit = getattr(_local, 'unit', None)
+    if unit is None:
+        # Background tasks (reapers, media workers, batching ticks)
+        _add_queries('background', 1, elapsed)
+    else:
+        unit.queries += 1
+        unit.query_time += elapsed
+
+
+def count_cache(cache, result):
+    """Record a cache lookup; result is 'hit', 'miss' or 'stale'"""
+    key = (cache, result)
+    with _tally_lock:
+        _cache_counts[key] = _cache_counts.get(key, 0) + 1
+
+
+class SentFrames:
+    """Engine.IO packets queued for clients, counted on the way into each socket's queue"""
+
+    def __init__(self):
+        self.text_frames = self.text_bytes = self.binary_frames = self.binary_bytes = 0
+        self.last = (None, False, 0)  # A broadcast sends one packet object to every recipient
+
+    def install(self, server):
+        send_packet = server.eio.send_packet
+
+        def _send_packet(eio_sid, eio_pkt):
+            send_packet(eio_sid, eio_pkt)
+            packet, binary, size = self.last
+            if packet is not eio_pkt:
+                data = eio_pkt.data
+                binary = isinstance(data, bytes)
+                size = len(data) if binary else len(data.encode('utf-8')) if data else 0
+                self.last = (eio_pkt, binary, size)
+            # No lock: there is no call between the read and the write for a thread switch to happen at
+            if binary:
+                self.binary_frames += 1
+                self.binary_bytes += size
+            else:
+                self.text_frames += 1
+                self.text_bytes += size
+
+        server.eio.send_packet = _send_packet
+
+
+class RuntimeCollector:
+    """Values read from the running server at scrape time"""
+
+    def __init__(self, app, server, sent_frames):
+        self.app = app
+        self.server = server
+        self.sent_frames = sent_frames
+
+    def collect(self):
+        sockets = GaugeMetricFamily('socketio_connected_sockets', 'Connected Engine.IO sockets')
+        sockets.add_metric([], len(self.server.eio.sockets))
+        yield sockets
+
+        # Chat rooms are 'room_<id>'; 'room_<id>/<wire>' sub-rooms (app/wire.py) and sid rooms are skipped
+        rooms = {room: members for room, members in list(self.server.manager.rooms.get('/', {}).items())
+                 if isinstance(room, str) and room.startswith('room_') and '/' not in room}
+        active = GaugeMetricFamily('socketio_active_rooms', 'Chat rooms with at least one connected member')
+        active.add_metric([], sum(1 for members in rooms.values() if members))
+        yield active
+        memberships = GaugeMetricFamily('socketio_room_memberships', 'Connections joined to chat rooms')
+        memberships.add_metric([], sum(len(members) for members in rooms.values()))
+        yield memberships
+
+        frames = CounterMetricFamily('socketio_sent_frames', 'Engine.IO packets queued for clients', labels=['type'])
+        sent_bytes = CounterMetricFamily('socketio_sent_bytes', 'Payload bytes queued for clients', labels=['type'])
+        frames.add_metric(['text'], self.sent_frames.text_frames)
+        frames.add_metric(['binary'], self.sent_frames.binary_frames)
+        sent_bytes.add_metric(['text'], self.sent_frames.text_bytes)
+        sent_bytes.add_metric(['binary'], self.sent_frames.binary_bytes)
+        yield frames
+        yield sent_bytes
+
+        backpressure = self.app.extensions.get('socket_backpressure')
+        if backpressure is not None:
+            stats = backpressure.stats()
+            queued = GaugeMetricFamily('socketio_queued_packets', 'Packets waiting in outbound socket queues')
+            queued.add_metric([], stats['queued_packets'])
+            yield queued
+            deepest = GaugeMetricFamily('socketio_max_queue_depth', 'Longest outbound socket queue')
+            deepest.add_metric([], stats['max_queue_depth'])
+            yield deepest
+            dropped = CounterMetricFamily('socketio_dropped_packets', 'Events dropped for slow clients',
+                                          labels=['event'])
+            for name, count in stats['dropped'].items():
+                dropped.add_metric([name], count)
+            yield dropped
+            resyncs = CounterMetricFamily('socketio_slow_resyncs', 'Slow clients told to resync')
+            resyncs.add_metric([], stats['resyncs'])
+            yield resyncs
+            disconnects = CounterMetricFamily('socketio_slow_disconnects', 'Slow clients disconnected')
+            disconnects.add_metric([], stats['disconnects'])
+            yield disconnects
+
+        with _tally_lock:
+            query_totals = {source: list(totals) for source, totals in _query_totals.items()}
+            cache_counts = dict(_cache_counts)
+        queries = CounterMetricFamily('db_queries', 'Database queries', labels=['source'])
+        query_seconds = CounterMetricFamily('db_query_seconds', 'Time spent in database queries', labels=['source'])
+        for source, (count, seconds) in sorted(query_totals.items()):
+            queries.add_metric([source], count)
+            query_seconds.add_metric([source], seconds)
+        yield queries
+        yield query_seconds
+
+        lookups = CounterMetricFamily('cache_lookups', 'Cache lookups by result', labels=['cache', 'result'])
+        for (cache, result), count in sorted(cache_counts.items()):
+            lookups.add_metric([cache, result], count)
+        yield lookups
+
+
+class Metrics:
+    """Prometheus registry and request/event instrumentation of one app"""
+
+    def __init__(self, app, server):
+        self.registry = CollectorRegistry()
+        self.http_latency = Histogram(
+            'http_request_duration_seconds', 'HTTP request latency by route',
+            ['method', 'route'], buckets=HTTP_BUCKETS, registry=self.registry)
+        self.http_requests = Counter(
+            'http_requests', 'HTTP responses by route and status',
+            ['method', 'route', 'status'], registry=self.registry)
+        self.http_queries = Histogram(
+            'http_request_db_queries', 'Database queries per HTTP request',
+            ['method', 'route'], buckets=QUERY_COUNT_BUCKETS, registry=self.registry)
+        self.http_query_time = Histogram(
+            'http_request_db_seconds', 'Database time per HTTP request',
+            ['method', 'route'], buckets=QUERY_TIME_BUCKETS, registry=self.registry)
+        self.event_latency = Histogram(
+            'socketio_event_duration_seconds', 'Socket.IO event handler latency',
+            ['event'], buckets=EVENT_BUCKETS, registry=self.registry)
+        self.event_queries = Histogram(
+            'socketio_event_db_queries', 'Database queries per Socket.IO event',
+            ['event'], buckets=QUERY_COUNT_BUCKETS, registry=self.registry)
+        self.event_query_time = Histogram(
+            'socketio_event_db_seconds', 'Database time per Socket.IO event',
+            ['event'], buckets=QUERY_TIME_BUCKETS, registry=self.registry)
+        self.sent_frames = SentFrames()
+        self.registry.register(RuntimeCollector(app, server, self.sent_frames))
+        ProcessCollector(registry=self.registry)
+        PlatformCollector(registry=self.registry)
+        GCCollector(registry=self.registry)
+
+    def before_request(self):
+        g.metrics_started = perf_counter()
+        g.metrics_unit = begin_unit('http')
+
+    def after_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        # Unmatched URLs share one label so scanners cannot create series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        unit = g.pop('metrics_unit')
+        end_unit(unit)
+        self.http_latency.labels(request.method, route).observe(perf_counter() - started)
+        self.http_requests.labels(request.method, route, str(response.status_code)).inc()
+        self.http_queries.labels(request.method, route).observe(unit.queries)
+        self.http_query_time.labels(request.method, route).observe(unit.query_time)
+        return response
+
+    def instrument_event(self, name, handler):
+        """Wrap a registered Socket.IO handler with the event's latency and query histograms"""
+        latency = self.event_latency.labels(name)
+        queries = self.event_queries.labels(name)
+        query_time = self.event_query_time.labels(name)
+
+        def timed_handler(*args):
+            started = perf_counter()
+            unit = begin_unit('socketio')
+            try:
+                return handler(*args)
+            finally:
+                end_unit(unit)
+                latency.observe(perf_counter() - started)
+                queries.observe(unit.queries)
+                query_time.observe(unit.query_time)
+
+        return timed_handler
+
+
+def metrics_view():
+    """Prometheus exposition; needs `Authorization: Bearer <METRICS_TOKEN>` when a token is set"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({'error': 'Unauthorized'}), 401
+    metrics = current_app.extensions['metrics']
+    return Response(generate_latest(metrics.registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def configure_metrics(app, socketio):
+    """Serve /metrics and time HTTP requests and outbound frames when METRICS_ENABLED is on"""
+    global _engine_listening
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    if CollectorRegistry is None:
+        print("Warning: prometheus_client not installed, /metrics is disabled")
+        return
+    if not app.config.get('METRICS_TOKEN'):
+        print("Warning: METRICS_TOKEN is not set, /metrics is served without authentication")
+
+    # The *_created series double the exposition and nothing reads them
+    disable_created_metrics()
+    metrics = Metrics(app, socketio.server)
+    metrics.sent_frames.install(socketio.server)
+    app.before_request(metrics.before_request)
+    app.after_request(metrics.after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    app.extensions['metrics'] = metrics
+    # Every engine: the primary and any read replicas (app/database.py)
+    if not _engine_listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _engine_listening = True
+
+
+def instrument_socketio_events(app, socketio):
+    """Time every handler registered by register_socketio_events"""
+    metrics = app.extensions.get('metrics')
+    if metrics is None:
+        return
+    for namespace, handlers in socketio.server.handlers.items():
+        for name, handler in list(handlers.items()):
+            handlers[name] = metrics.instrument_event(name, handler)
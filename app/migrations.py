@@ -0,0 +1,193 @@
+"""
+Schema Migrations
+Versioned, run-once schema changes. The database records a single schema
+version; `python init_db.py` applies newer migrations offline and app startup
+only compares the recorded version with SCHEMA_VERSION.
+
+To change the schema: update the model, then add a function decorated with
+@migration(<next version>, '<description>') that makes the same change to an
+existing database. Keep migrations idempotent with the helpers below.
+"""
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+SCHEMA_VERSION_TABLE = 'schema_version'
+
+# [(version, description, function)] in version order
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a migration function taking an open SQLAlchemy connection"""
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def table_exists(conn, table_name):
+    return inspect(conn).has_table(table_name)
+
+
+def column_exists(conn, table_name, column_name):
+    return any(column['name'] == column_name for column in inspect(conn).get_columns(table_name))
+
+
+def add_column(conn, table_name, column_name, column_type):
+    """ALTER TABLE ... ADD COLUMN unless the column is already there"""
+    if table_exists(conn, table_name) and not column_exists(conn, table_name, column_name):
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+
+
+def create_index(conn, index_name, table_name, columns, unique=False):
+    """CREATE INDEX IF NOT EXISTS (SQLite and PostgreSQL 9.5+)"""
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {index_name} "
+        f"ON {table_name} ({', '.join(columns)})"
+    ))
+
+
+# ---------------------------------------------------------------------------
+# Migrations
+# ---------------------------------------------------------------------------
+
+@migration(1, 'Baseline: tables and columns previously added by runtime checks')
+def baseline(conn):
+    from app.models import db
+    # Creates only the tables that are missing (e.g. stored_files, media_derivatives)
+    db.metadata.create_all(bind=conn)
+    for table_name, column_name, column_type in (
+        ('messages', 'message_type', "VARCHAR(20) DEFAULT 'text'"),
+        ('messages', 'file_name', 'VARCHAR(255)'),
+        ('messages', 'media_info', 'TEXT'),
+        ('users', 'profile_picture', 'VARCHAR(255)'),
+        ('users', 'display_name', 'VARCHAR(100)'),
+        ('stored_files', 'media_info', 'TEXT'),
+        ('stored_files', 'mime_type', 'VARCHAR(100)'),
+        ('stored_files', 'original_name', 'VARCHAR(255)'),
+        ('stored_files', 'width', 'INTEGER'),
+        ('stored_files', 'height', 'INTEGER'),
+        ('stored_files', 'duration', 'FLOAT'),
+    ):
+        add_column(conn, table_name, column_name, column_type)
+    conn.execute(text("UPDATE messages SET message_type = 'text' WHERE message_type IS NULL OR message_type = ''"))
+
+
+@migration(2, 'Indexes for room history and joined-room lookups')
+def message_indexes(conn):
+    # Room history: WHERE room_id = ? ORDER BY timestamp DESC LIMIT n
+    create_index(conn, 'ix_messages_room_id_timestamp', 'messages', ['room_id', 'timestamp'])
+    # Joined rooms and membership checks: WHERE user_id = ? [AND room_id = ?]
+    create_index(conn, 'ix_messages_user_id_room_id', 'messages', ['user_id', 'room_id'])
+
+
+@migration(3, 'Per-room message retention policy')
+def room_retention(conn):
+    add_column(conn, 'rooms', 'retention_days', 'INTEGER')
+    add_column(conn, 'rooms', 'retention_max_messages', 'INTEGER')
+
+
+@migration(4, 'Client message ids for idempotent sends')
+def message_client_ids(conn):
+    # Uniqueness per sender is enforced by message_client_ids (migration 6): a unique index here
+    # would be rejected on a partitioned messages table, which cannot leave out the timestamp
+    add_column(conn, 'messages', 'client_id', 'VARCHAR(64)')
+
+
+@migration(5, 'Uploaders of stored files, for private content hash lookups')
+def upload_owners(conn):
+    from app.models import db
+    # Files stored before this are not looked up for anyone; re-uploading them records the uploader
+    db.metadata.tables['upload_owners'].create(bind=conn, checkfirst=True)
+
+
+@migration(6, 'Send dedup keys in their own table, so they survive partitioning messages')
+def message_client_id_table(conn):
+    from app.models import db
+    db.metadata.tables['message_client_ids'].create(bind=conn, checkfirst=True)
+    conn.execute(text(
+        "INSERT INTO message_client_ids (user_id, client_id, message_id) "
+        "SELECT user_id, client_id, id FROM messages WHERE client_id IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM message_client_ids k "
+        "WHERE k.user_id = messages.user_id AND k.client_id = messages.client_id)"
+    ))
+    # Created by migration 4 on databases upgraded before it moved here
+    conn.execute(text("DROP INDEX IF EXISTS ix_messages_user_id_client_id"))
+
+
+@migration(7, 'Dedup keys looked up by message, to delete them with their messages')
+def message_client_id_cleanup(conn):
+    create_index(conn, 'ix_message_client_ids_message_id', 'message_client_ids', ['message_id'])
+    # Keys of messages deleted before this
+    conn.execute(text(
+        "DELETE FROM message_client_ids WHERE NOT EXISTS "
+        "(SELECT 1 FROM messages WHERE messages.id = message_client_ids.message_id)"
+    ))
+
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def get_schema_version(engine):
+    """Return the recorded schema version, or None if the database is unversioned"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text(f"SELECT version FROM {SCHEMA_VERSION_TABLE}")).scalar()
+    except (OperationalError, ProgrammingError):
+        return None
+
+
+def _set_schema_version(conn, version):
+    if not table_exists(conn, SCHEMA_VERSION_TABLE):
+        conn.execute(text(f"CREATE TABLE {SCHEMA_VERSION_TABLE} (version INTEGER NOT NULL)"))
+    if conn.execute(text(f"UPDATE {SCHEMA_VERSION_TABLE} SET version = :version"), {'version': version}).rowcount == 0:
+        conn.execute(text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version) VALUES (:version)"), {'version': version})
+
+
+def upgrade(engine):
+    """Bring the database to SCHEMA_VERSION, one transaction per migration; returns the versions applied"""
+    from app.models import db
+
+    current = get_schema_version(engine)
+    if current is None:
+        with engine.begin() as conn:
+            if not table_exists(conn, 'users'):
+                # Empty database: build the current schema directly
+                db.metadata.create_all(bind=conn)
+                _set_schema_version(conn, SCHEMA_VERSION)
+                print(f"✓ Created database schema at version {SCHEMA_VERSION}")
+                return [SCHEMA_VERSION]
+        # Tables from before versioning: start from the baseline
+        current = 0
+
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            _set_schema_version(conn, version)
+        print(f"✓ Migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+def check_schema(app, db):
+    """Startup check: one query for the schema version; migrates only when AUTO_MIGRATE is set"""
+    with app.app_context():
+        version = get_schema_version(db.engine)
+        if version == SCHEMA_VERSION:
+            return
+        if app.config.get('AUTO_MIGRATE'):
+            upgrade(db.engine)
+        elif version is None or version < SCHEMA_VERSION:
+            print(f"⚠ Database schema is at version {version or 'unversioned'}, this code expects "
+                  f"{SCHEMA_VERSION}. Run: python init_db.py")
+        else:
+            print(f"⚠ Database schema version {version} is newer than this code ({SCHEMA_VERSION})")
@@ -7,8 +7,20 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import json
+from app.database import RoutingSession
 
-db = SQLAlchemy()
+# Request-time reads may go to a read replica (see app/database.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def load_media_info(value):
+    """Decode a JSON media_info column, tolerating empty or malformed values"""
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return None
 
 class User(UserMixin, db.Model):
     """User model for authentication and user management"""
@@ -60,6 +72,9 @@ class Room(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_global = db.Column(db.Boolean, default=False)  # Global chat room
+    # Retention policy enforced by app/retention.py (None = keep forever / no limit)
+    retention_days = db.Column(db.Integer, nullable=True)
+    retention_max_messages = db.Column(db.Integer, nullable=True)
     
     # Relationships
     messages = db.relationship('Message', backref='room', lazy=True, cascade='all, delete-orphan')
@@ -74,6 +89,8 @@ class Room(db.Model):
             'created_by': self.created_by,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'is_global': self.is_global,
+            'retention_days': self.retention_days,
+            'retention_max_messages': self.retention_max_messages,
             'message_count': len(self.messages)
         }
     
@@ -84,6 +101,10 @@ class Room(db.Model):
 class Message(db.Model):
     """Message model for chat messages with support for text, GIF, audio, and file attachments"""
     __tablename__ = 'messages'
+    __table_args__ = (
+        db.Index('ix_messages_room_id_timestamp', 'room_id', 'timestamp'),  # Room history pages
+        db.Index('ix_messages_user_id_room_id', 'user_id', 'room_id'),  # Joined rooms / membership
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)  # Text content, GIF URL, audio file path, or file path
@@ -91,7 +112,17 @@ class Message(db.Model):
     room_id = db.Column(db.Integer, db.ForeignKey('rooms.id'), nullable=False)
     message_type = db.Column(db.String(20), default='text', nullable=False)  # 'text', 'gif', 'audio', 'file', 'image', 'video'
     file_name = db.Column(db.String(255), nullable=True)  # Original filename for attachments
+    media_info = db.Column(db.Text, nullable=True)  # JSON: duration/waveform peaks/transcoded URL for voice notes
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    client_id = db.Column(db.String(64), nullable=True)  # Sender-generated id, so a resent message is stored once
+    
+    # Metadata of the uploaded file a media message points at (joined by URL, no foreign key)
+    attachment = db.relationship(
+        'StoredFile',
+        primaryjoin='foreign(Message.content) == remote(StoredFile.path)',
+        uselist=False,
+        viewonly=True
+    )
     
     def to_dict(self):
         """Convert message to dictionary for JSON serialization"""
@@ -133,6 +164,14 @@ class Message(db.Model):
             except Exception as time_error:
                 print(f"Error formatting timestamp for message {self.id}: {time_error}")
             
+            # Safely get attachment metadata (size, mime, dimensions, duration)
+            attachment = None
+            try:
+                if message_type in ('audio', 'image', 'video', 'file') and self.attachment:
+                    attachment = self.attachment.to_dict()
+            except Exception as attachment_error:
+                print(f"Error accessing attachment for message {self.id}: {attachment_error}")
+            
             return {
                 'id': self.id,
                 'content': str(self.content) if self.content else '',
@@ -144,9 +183,12 @@ class Message(db.Model):
                 'room_name': room_name,
                 'message_type': message_type,
                 'file_name': getattr(self, 'file_name', None),
+                'media_info': load_media_info(getattr(self, 'media_info', None)),
+                'attachment': attachment,
                 'timestamp': timestamp_iso,
                 'formatted_time': formatted_time,
-                'formatted_date': formatted_date
+                'formatted_date': formatted_date,
+                'client_id': self.client_id
             }
         except Exception as e:
             # Fallback for any serialization errors
@@ -164,11 +206,102 @@ class Message(db.Model):
                 'room_name': 'Unknown',
                 'message_type': 'text',
                 'file_name': None,
+                'media_info': None,
+                'attachment': None,
                 'timestamp': None,
                 'formatted_time': '',
-                'formatted_date': ''
+                'formatted_date': '',
+                'client_id': getattr(self, 'client_id', None)
             }
     
     def __repr__(self):
         return f'<Message {self.id} [{self.message_type}] by {self.user_id} in {self.room_id}>'
 
+
+
+class StoredFile(db.Model):
+    """Content-addressed upload stored once on disk and shared by every message that references it"""
+    __tablename__ = 'stored_files'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(255), unique=True, nullable=False, index=True)  # URL path, e.g. /uploads/attachments/<sha256>.pdf
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False, default=0)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # Number of messages referencing this file
+    media_info = db.Column(db.Text, nullable=True)  # JSON metadata computed after upload, copied to new messages
+    mime_type = db.Column(db.String(100), nullable=True)
+    original_name = db.Column(db.String(255), nullable=True)  # Name of the first upload; messages keep their own file_name
+    width = db.Column(db.Integer, nullable=True)  # Images only
+    height = db.Column(db.Integer, nullable=True)
+    duration = db.Column(db.Float, nullable=True)  # Seconds, for voice notes once processed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Users who uploaded this content (deleted with the file)
+    uploaders = db.relationship('UploadOwner', cascade='all, delete-orphan')
+    
+    def to_dict(self):
+        """Attachment facts included with messages in history responses"""
+        return {
+            'size': self.size,
+            'mime_type': self.mime_type,
+            'width': self.width,
+            'height': self.height,
+            'duration': self.duration
+        }
+    
+    def __repr__(self):
+        return f'<StoredFile {self.path} refs={self.ref_count}>'
+
+
+class MessageClientId(db.Model):
+    """Dedup key of a message sent with a client id (see app/dedup.py).
+    
+    Kept out of messages: a partitioned messages table (app/partitions.py) cannot
+    have a unique index without the timestamp, so uniqueness per sender lives here.
+    """
+    __tablename__ = 'message_client_ids'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    client_id = db.Column(db.String(64), primary_key=True)
+    # No foreign key (a partitioned messages key includes the timestamp); deleted with the message by forget_client_ids
+    message_id = db.Column(db.Integer, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<MessageClientId {self.user_id}/{self.client_id} -> {self.message_id}>'
+
+
+class UploadOwner(db.Model):
+    """A user who uploaded a stored file; only they may look its content hash up before uploading again"""
+    __tablename__ = 'upload_owners'
+    
+    stored_file_id = db.Column(db.Integer, db.ForeignKey('stored_files.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    
+    def __repr__(self):
+        return f'<UploadOwner file={self.stored_file_id} user={self.user_id}>'
+
+
+class MediaDerivative(db.Model):
+    """Resized preview generated in the background from an uploaded image"""
+    __tablename__ = 'media_derivatives'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    source_path = db.Column(db.String(255), nullable=False, index=True)  # URL path of the original image
+    size = db.Column(db.String(10), nullable=False)  # Size name, e.g. 'sm' or 'md'
+    format = db.Column(db.String(10), nullable=False)  # 'webp' or 'jpg'
+    path = db.Column(db.String(255), nullable=True)  # URL-style path of the derivative on disk
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert derivative to dictionary for JSON serialization"""
+        return {
+            'size': self.size,
+            'format': self.format,
+            'width': self.width,
+            'height': self.height
+        }
+    
+    def __repr__(self):
+        return f'<MediaDerivative {self.source_path} {self.size}.{self.format} {self.width}x{self.height}>'
@@ -0,0 +1,292 @@
+"""
+Message Partitions
+Optional monthly range partitioning of the messages table on PostgreSQL:
+conversion of an existing table, creation of upcoming partitions, and
+retention by detaching and dropping whole months
+"""
+
+import re
+from datetime import datetime
+from sqlalchemy import text
+from app.models import db
+from app.upload_gc import MEDIA_MESSAGE_TYPES
+
+PARTITION_MONTHS_AHEAD = 3  # Upcoming months that always have a partition ready
+PARTITION_RELEASE_BATCH = 500  # Attachment references released (and rows deleted) per commit when dropping a month
+PARTITION_NAME_PATTERN = re.compile(r'^messages_y(\d{4})m(\d{2})$')
+
+# Created on the partitioned parent, so every partition gets them
+MESSAGE_INDEXES = (
+    ('ix_messages_timestamp', '"timestamp"'),
+    ('ix_messages_room_id_timestamp', 'room_id, "timestamp"'),
+    ('ix_messages_user_id_room_id', 'user_id, room_id'),
+)
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"messages_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name):
+    match = PARTITION_NAME_PATTERN.match(name)
+    return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def partitioning_supported(engine):
+    return engine.dialect.name == 'postgresql'
+
+
+def is_partitioned(conn):
+    """True once messages is a partitioned table"""
+    return bool(conn.execute(text(
+        "SELECT relkind = 'p' FROM pg_class WHERE relname = 'messages' AND pg_table_is_visible(oid)"
+    )).scalar())
+
+
+def list_partitions(conn):
+    """Return [(month, table name)] for the attached monthly partitions, oldest first"""
+    names = conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'messages' AND pg_table_is_visible(parent.oid)"
+    )).scalars()
+    return sorted((partition_month(name), name) for name in names if partition_month(name))
+
+
+def detached_partitions(conn):
+    """Monthly tables no longer attached to messages (a retention drop that has not finished)"""
+    names = conn.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition "
+        "AND relname ~ '^messages_y[0-9]{4}m[0-9]{2}$' AND pg_table_is_visible(oid)"
+    )).scalars()
+    return sorted(names)
+
+
+def messages_partitioned(app):
+    """Whether messages is partitioned, checked once per process (the app is restarted after converting)"""
+    partitioned = app.extensions.get('messages_partitioned')
+    if partitioned is None:
+        partitioned = False
+        if partitioning_supported(db.engine):
+            with db.engine.connect() as conn:
+                partitioned = is_partitioned(conn)
+        app.extensions['messages_partitioned'] = partitioned
+    return partitioned
+
+
+def create_partition(conn, month):
+    """Create the partition holding one calendar month (UTC) if it does not exist yet.
+
+    PostgreSQL refuses CREATE ... PARTITION OF while messages_default holds rows
+    for the month (e.g. sent with a skewed clock), so those rows are moved into
+    the new table before it is attached.
+    """
+    name = partition_name(month)
+    if conn.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar():
+        return
+    start, end = month, add_months(month, 1)
+    bounds = f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    in_month = '"timestamp" >= :start AND "timestamp" < :end'
+    strays = conn.execute(text("SELECT to_regclass('messages_default')")).scalar() and conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM messages_default WHERE {in_month})"
+    ), {'start': start, 'end': end}).scalar()
+    if not strays:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF messages {bounds}"))
+        return
+
+    conn.execute(text(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS)"))
+    moved = conn.execute(text(
+        f"WITH moved AS (DELETE FROM messages_default WHERE {in_month} RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {'start': start, 'end': end}).rowcount
+    # Attaching adds the parent's keys and indexes to the table
+    conn.execute(text(f"ALTER TABLE messages ATTACH PARTITION {name} {bounds}"))
+    print(f"⚠ Moved {moved} messages from messages_default into {name}")
+
+
+def ensure_future_partitions(conn, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Make sure this month and the next months_ahead months have partitions; returns the names created"""
+    existing = {name for _, name in list_partitions(conn)}
+    current = month_start(datetime.utcnow())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if partition_name(month) not in existing:
+            create_partition(conn, month)
+            created.append(partition_name(month))
+    return created
+
+
+def partition_messages(engine, months_ahead=PARTITION_MONTHS_AHEAD, keep_old=False):
+    """Convert an unpartitioned messages table into monthly partitions, copying every row.
+
+    Runs as one transaction holding an exclusive lock on messages, so chat is
+    paused for the duration of the copy; run it in a maintenance window.
+    Returns the number of rows copied, or None if messages is already partitioned.
+    """
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return None
+        conn.execute(text("LOCK TABLE messages IN ACCESS EXCLUSIVE MODE"))
+        conn.execute(text("ALTER TABLE messages RENAME TO messages_unpartitioned"))
+        # Index names are unique per schema; free them for the new table
+        for index_name in ('messages_pkey',) + tuple(name for name, _ in MESSAGE_INDEXES):
+            conn.execute(text(
+                f"ALTER INDEX IF EXISTS {index_name} "
+                f"RENAME TO {index_name.replace('messages', 'messages_unpartitioned', 1)}"
+            ))
+        conn.execute(text(
+            "UPDATE messages_unpartitioned SET \"timestamp\" = now() AT TIME ZONE 'utc' WHERE \"timestamp\" IS NULL"
+        ))
+
+        # Same columns and defaults (including the id sequence); the partition key has to be in the primary key
+        conn.execute(text(
+            'CREATE TABLE messages (LIKE messages_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")'
+        ))
+        conn.execute(text('ALTER TABLE messages ALTER COLUMN "timestamp" SET NOT NULL'))
+        conn.execute(text('ALTER TABLE messages ADD PRIMARY KEY (id, "timestamp")'))
+        conn.execute(text("ALTER TABLE messages ADD FOREIGN KEY (user_id) REFERENCES users (id)"))
+        conn.execute(text("ALTER TABLE messages ADD FOREIGN KEY (room_id) REFERENCES rooms (id)"))
+        # Rows outside every monthly range (e.g. a badly skewed clock) land here instead of failing
+        conn.execute(text("CREATE TABLE messages_default PARTITION OF messages DEFAULT"))
+
+        oldest = conn.execute(text('SELECT MIN("timestamp") FROM messages_unpartitioned')).scalar()
+        month = month_start(oldest or datetime.utcnow())
+        last = add_months(month_start(datetime.utcnow()), months_ahead)
+        while month <= last:
+            create_partition(conn, month)
+            month = add_months(month, 1)
+
+        copied = conn.execute(text("INSERT INTO messages SELECT * FROM messages_unpartitioned")).rowcount
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence('messages_unpartitioned', 'id')")).scalar()
+        if sequence:
+            # Otherwise dropping the old table would drop the id sequence with it
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY messages.id"))
+        for index_name, columns in MESSAGE_INDEXES:
+            conn.execute(text(f"CREATE INDEX {index_name} ON messages ({columns})"))
+        if not keep_old:
+            conn.execute(text("DROP TABLE messages_unpartitioned"))
+        conn.execute(text("ANALYZE messages"))
+    return copied
+
+
+def keep_member_anchors(name):
+    """Move each member's latest message in a room out of a detached month and back into messages.
+
+    Room membership is "has a message in the room" (see member_anchor_ids in
+    app/retention.py), so dropping a month must not take a member's last
+    message with it. Their month no longer has a partition, so the moved rows
+    land in messages_default. Returns the number of messages kept.
+    """
+    kept = db.session.execute(text(
+        f"WITH anchors AS (DELETE FROM {name} m "
+        f"WHERE m.id IN (SELECT MAX(id) FROM {name} GROUP BY room_id, user_id) "
+        f"AND NOT EXISTS (SELECT 1 FROM messages later "
+        f"WHERE later.room_id = m.room_id AND later.user_id = m.user_id AND later.id > m.id) "
+        f"RETURNING *) "
+        f"INSERT INTO messages SELECT * FROM anchors"
+    )).rowcount
+    db.session.commit()
+    return kept
+
+
+def drop_detached_partition(name, batch_size=PARTITION_RELEASE_BATCH):
+    """Release the uploads referenced by a detached month's messages, then drop the table.
+
+    Member anchors are moved back into messages first, keeping their uploads.
+    Each batch deletes the rows it released in the same commit, so an
+    interrupted drop resumes without releasing any file twice.
+    Returns the number of attachment references released.
+    """
+    from app.routes.uploads import release_file
+
+    keep_member_anchors(name)
+    released = 0
+    while True:
+        rows = db.session.execute(text(
+            f"SELECT id, content, message_type FROM {name} WHERE message_type = ANY(:types) LIMIT :limit"
+        ), {'types': list(MEDIA_MESSAGE_TYPES), 'limit': batch_size}).all()
+        if not rows:
+            break
+        for _, content, message_type in rows:
+            release_file(content, message_type)
+        db.session.execute(text(f"DELETE FROM {name} WHERE id = ANY(:ids)"), {'ids': [row[0] for row in rows]})
+        db.session.commit()
+        released += len(rows)
+    # Send dedup keys of the month's messages go with them (see app/dedup.py)
+    db.session.execute(text(f"DELETE FROM message_client_ids WHERE message_id IN (SELECT id FROM {name})"))
+    db.session.execute(text(f"DROP TABLE {name}"))
+    db.session.commit()
+    return released
+
+
+def drop_partitions_before(engine, cutoff):
+    """Detach and drop every monthly partition that ends on or before cutoff; returns the names dropped"""
+    with engine.begin() as conn:
+        for month, name in list_partitions(conn):
+            if add_months(month, 1) <= cutoff:
+                conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+        expired = detached_partitions(conn)
+    # Newest first, so a member's anchor kept from a later month supersedes the earlier ones
+    for name in reversed(expired):
+        drop_detached_partition(name)
+    return expired
+
+
+def maintain_partitions(app):
+    """Create upcoming partitions and drop months past MESSAGE_RETENTION_MONTHS.
+
+    Returns (created, dropped) partition names, or None if messages is not partitioned.
+    """
+    engine = db.engine
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return None
+        created = ensure_future_partitions(conn, app.config.get('PARTITION_MONTHS_AHEAD', PARTITION_MONTHS_AHEAD))
+    dropped = []
+    retention_months = app.config.get('MESSAGE_RETENTION_MONTHS', 0)
+    if retention_months > 0:
+        dropped = drop_partitions_before(engine, add_months(month_start(datetime.utcnow()), -retention_months))
+    return created, dropped
+
+
+def start_partition_maintenance(app):
+    """Run maintain_partitions at startup and every PARTITION_MAINTENANCE_INTERVAL seconds (PostgreSQL only)"""
+    interval = app.config.get('PARTITION_MAINTENANCE_INTERVAL', 0)
+    if interval <= 0 or app.extensions.get('partition_maintenance'):
+        return
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
+        return
+    app.extensions['partition_maintenance'] = True
+
+    from app import socketio
+
+    def run():
+        while True:
+            with app.app_context():
+                try:
+                    result = maintain_partitions(app)
+                    if result is None:
+                        # messages is a plain table; nothing to maintain until it is converted
+                        return
+                    created, dropped = result
+                    if created or dropped:
+                        print(f"✓ Message partitions: created {created or 'none'}, dropped {dropped or 'none'}")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠ Message partition maintenance failed: {e}")
+                finally:
+                    db.session.remove()
+            socketio.sleep(interval)
+
+    socketio.start_background_task(run)
@@ -0,0 +1,256 @@
+"""
+SQL Profiler
+Development/staging profiler: records every SQL statement issued while
+handling an HTTP request or Socket.IO event, flags statement shapes that
+repeat within one request (N+1 queries, e.g. a lazy relationship loaded per
+row in a to_dict loop) and logs slow queries with their EXPLAIN plan.
+Enabled with SQL_PROFILER; the recent profiles are served at
+GET /api/sql-profile.
+
+assert_max_queries() works without it, for tests:
+
+    with assert_max_queries(3):
+        client.get('/api/rooms')
+"""
+
+import os
+import re
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+from flask import current_app, g, request, jsonify
+from flask_login import login_required
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_HISTORY = 50  # Recent profiles kept for /api/sql-profile
+PROFILE_MAX_STATEMENTS = 500  # Statements kept per profile (all are still counted)
+LOG_STATEMENT_LENGTH = 300
+EXPLAIN_PREFIXES = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN '}
+
+_local = threading.local()  # .profile: the Profile of the request or event this thread is handling
+_recorders = []  # Statement lists of the active assert_max_queries() blocks
+_recorders_lock = threading.Lock()
+_profiler = None  # The SQLProfiler of the app that turned SQL_PROFILER on
+_engine_listening = False
+
+_IN_LIST = re.compile(r'IN \((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,?)+\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Statement with whitespace collapsed and expanded IN lists and number literals folded"""
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _IN_LIST.sub('IN (...)', shape)
+    return _NUMBER.sub('N', shape)
+
+
+def shorten(statement, length=LOG_STATEMENT_LENGTH):
+    text = _WHITESPACE.sub(' ', statement).strip()
+    return text if len(text) <= length else text[:length] + '...'
+
+
+def caller_location():
+    """First frame in the app's own code below the SQL execution, as 'app/x.py:12 in fn'"""
+    frame = sys._getframe(2)
+    here = os.path.abspath(__file__)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and filename != here:
+            return f"{os.path.relpath(filename, os.path.dirname(APP_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+class Profile:
+    """Statements of one HTTP request or Socket.IO event"""
+
+    def __init__(self, label):
+        self.label = label
+        self.started = perf_counter()
+        self.statements = []  # [(statement, seconds)]
+        self.count = 0
+        self.query_time = 0.0
+        self.shapes = {}  # {shape: [executions, seconds, location of the first one]}
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.query_time += seconds
+        if len(self.statements) < PROFILE_MAX_STATEMENTS:
+            self.statements.append((statement, seconds))
+        shape = statement_shape(statement)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            self.shapes[shape] = [1, seconds, caller_location()]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def repeated(self, threshold):
+        """[(shape, executions, seconds, location)] run at least threshold times, most frequent first"""
+        return sorted(((shape, count, seconds, location)
+                       for shape, (count, seconds, location) in self.shapes.items() if count >= threshold),
+                      key=lambda item: -item[1])
+
+    def to_dict(self, threshold):
+        return {
+            'label': self.label,
+            'duration_ms': round((perf_counter() - self.started) * 1000, 1),
+            'queries': self.count,
+            'query_ms': round(self.query_time * 1000, 1),
+            'n_plus_one': [{'statement': shape, 'count': count, 'ms': round(seconds * 1000, 1), 'location': location}
+                           for shape, count, seconds, location in self.repeated(threshold)],
+            'statements': [{'statement': shorten(statement), 'ms': round(seconds * 1000, 2)}
+                           for statement, seconds in self.statements],
+        }
+
+
+class SQLProfiler:
+    """Per-request/event profiles, N+1 warnings and slow query plans"""
+
+    def __init__(self, slow_seconds, repeat_threshold):
+        self.slow_seconds = slow_seconds
+        self.repeat_threshold = repeat_threshold
+        self.recent = deque(maxlen=PROFILE_HISTORY)
+
+    def begin(self, label):
+        profile = Profile(label)
+        _local.profile = profile
+        return profile
+
+    def end(self, profile):
+        _local.profile = None
+        for shape, count, seconds, location in profile.repeated(self.repeat_threshold):
+            where = f" (first at {location})" if location else ''
+            print(f"⚠ N+1 in {profile.label}: {count}x {shorten(shape)}{where}, {seconds * 1000:.1f} ms total")
+        self.recent.append(profile.to_dict(self.repeat_threshold))
+
+    def before_request(self):
+        rule = request.url_rule.rule if request.url_rule else request.path
+        g.sql_profile = self.begin(f"{request.method} {rule}")
+
+    def after_request(self, response):
+        profile = g.pop('sql_profile', None)
+        if profile is not None:
+            self.end(profile)
+            response.headers['X-SQL-Queries'] = str(profile.count)
+        return response
+
+    def profile_event(self, name, handler):
+        """Wrap a registered Socket.IO handler so its statements form one profile"""
+        def profiled_handler(*args):
+            profile = self.begin(f"socket {name}")
+            try:
+                return handler(*args)
+            finally:
+                self.end(profile)
+
+        return profiled_handler
+
+    def slow_query(self, cursor, dialect, statement, parameters, seconds):
+        """Log a slow statement with its plan (SELECTs only; the plan query does not execute it)"""
+        label = _local.profile.label if getattr(_local, 'profile', None) else 'background'
+        print(f"⚠ Slow query ({seconds * 1000:.0f} ms) in {label}: {shorten(statement)}")
+        prefix = EXPLAIN_PREFIXES.get(dialect)
+        if prefix is None or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return
+        try:
+            # A separate DBAPI cursor: the caller has not fetched the original's rows yet
+            explain = cursor.connection.cursor()
+            try:
+                explain.execute(prefix + statement, parameters)
+                for row in explain.fetchall():
+                    print(f"    {row[-1]}")  # The plan text (SQLite also returns node ids before it)
+            finally:
+                explain.close()
+        except Exception as e:
+            print(f"    (EXPLAIN failed: {e})")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['profile_started'] = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = perf_counter() - conn.info.pop('profile_started', perf_counter())
+    if _recorders:
+        with _recorders_lock:
+            for recorder in _recorders:
+                recorder.append(statement)
+
+    profiler = _profiler
+    if profiler is None:
+        return
+    profile = getattr(_local, 'profile', None)
+    if profile is not None:
+        profile.record(statement, seconds)
+    if seconds >= profiler.slow_seconds and not executemany:
+        profiler.slow_query(cursor, conn.dialect.name, statement, parameters, seconds)
+
+
+def _listen():
+    global _engine_listening
+    if not _engine_listening:
+        # Every engine: the primary and any read replicas (app/database.py)
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _engine_listening = True
+
+
+@contextmanager
+def assert_max_queries(limit):
+    """Fail if the block issues more than limit SQL statements (on any thread); yields the statements"""
+    _listen()
+    statements = []
+    with _recorders_lock:
+        _recorders.append(statements)
+    try:
+        yield statements
+    finally:
+        with _recorders_lock:
+            _recorders.remove(statements)
+    if len(statements) > limit:
+        listing = '\n'.join(f"  {i + 1}. {shorten(statement, 200)}" for i, statement in enumerate(statements))
+        raise AssertionError(f"{len(statements)} queries, expected at most {limit}:\n{listing}")
+
+
+@login_required
+def sql_profile_view():
+    """Recent profiles, newest first; ?n_plus_one=1 keeps only the flagged ones"""
+    profiles = list(reversed(current_app.extensions['sql_profiler'].recent))
+    if request.args.get('n_plus_one'):
+        profiles = [profile for profile in profiles if profile['n_plus_one']]
+    return jsonify({'profiles': profiles})
+
+
+def configure_profiler(app):
+    """Profile every request's SQL when SQL_PROFILER is on (development and staging only)"""
+    global _profiler
+    if not app.config.get('SQL_PROFILER'):
+        return
+    profiler = SQLProfiler(
+        slow_seconds=app.config.get('SQL_SLOW_QUERY_MS', 100) / 1000,
+        repeat_threshold=max(app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5), 2)
+    )
+    _profiler = profiler
+    _listen()
+    app.before_request(profiler.before_request)
+    app.after_request(profiler.after_request)
+    app.add_url_rule('/api/sql-profile', 'sql_profile', sql_profile_view)
+    app.extensions['sql_profiler'] = profiler
+    print(f"✓ SQL profiler on: N+1 at {profiler.repeat_threshold}+ repeats, "
+          f"slow queries over {profiler.slow_seconds * 1000:.0f} ms")
+
+
+def profile_socketio_events(app, socketio):
+    """Give every handler registered by register_socketio_events its own profile"""
+    profiler = app.extensions.get('sql_profiler')
+    if profiler is None:
+        return
+    for namespace, handlers in socketio.server.handlers.items():
+        for name, handler in list(handlers.items()):
+            handlers[name] = profiler.profile_event(name, handler)
@@ -0,0 +1,123 @@
+"""
+Message Retention
+Per-room retention policies (maximum age and/or maximum message count)
+enforced by a background reaper that deletes expired messages, and the
+uploads only they referenced, in small rate-limited batches
+"""
+
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app.models import db, Room, Message
+from app.dedup import forget_client_ids
+
+RETENTION_BATCH_SIZE = 200  # Messages deleted per transaction, so locks are held only briefly
+RETENTION_BATCH_PAUSE = 0.2  # Seconds yielded to the chat worker between batches
+RETENTION_MAX_BATCHES = 50  # Batches per room per run; the rest waits for the next run
+
+
+def room_policies():
+    """Return [(room_id, retention_days, retention_max_messages)] for rooms that have a policy"""
+    return db.session.query(Room.id, Room.retention_days, Room.retention_max_messages).filter(
+        db.or_(Room.retention_days.isnot(None), Room.retention_max_messages.isnot(None))
+    ).all()
+
+
+def member_anchor_ids(room_id):
+    """Latest message id of each user in the room.
+
+    Room membership is "has a message in the room", so these are never reaped:
+    retention must not drop a room from its members' room lists.
+    """
+    return [row[0] for row in db.session.query(func.max(Message.id)).filter(
+        Message.room_id == room_id
+    ).group_by(Message.user_id).all()]
+
+
+def _delete_batch(room_id, filters, limit, anchors):
+    """Delete up to limit of the room's oldest messages matching filters; returns the deleted ids"""
+    from app.routes.uploads import release_file
+
+    query = db.session.query(Message.id, Message.content, Message.message_type).filter(
+        Message.room_id == room_id, *filters
+    )
+    if anchors:
+        query = query.filter(Message.id.notin_(anchors))
+    # Walks ix_messages_room_id_timestamp from the oldest end
+    rows = query.order_by(Message.timestamp.asc(), Message.id.asc()).limit(limit).all()
+    if not rows:
+        return []
+    for _, content, message_type in rows:
+        release_file(content, message_type)
+    ids = [row[0] for row in rows]
+    forget_client_ids(ids)
+    Message.query.filter(Message.id.in_(ids)).delete(synchronize_session=False)
+    db.session.commit()
+    return ids
+
+
+def reap_room(room_id, retention_days=None, max_messages=None, batch_size=RETENTION_BATCH_SIZE,
+              max_batches=RETENTION_MAX_BATCHES, pause=None):
+    """Delete a room's messages beyond its policy; returns the ids deleted"""
+    from app import socketio
+
+    anchors = member_anchor_ids(room_id)
+    deleted = []
+
+    def run_batches(filters, remaining):
+        while remaining > 0 and len(deleted) < batch_size * max_batches:
+            ids = _delete_batch(room_id, filters, min(batch_size, remaining), anchors)
+            if not ids:
+                return
+            deleted.extend(ids)
+            remaining -= len(ids)
+            # Clients drop the expired messages from an open room
+            socketio.emit('messages_expired', {'room_id': room_id, 'message_ids': ids}, room=f"room_{room_id}")
+            if pause:
+                pause()
+
+    if retention_days:
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        run_batches([Message.timestamp < cutoff], float('inf'))
+    if max_messages:
+        excess = Message.query.filter_by(room_id=room_id).count() - max_messages
+        run_batches([], excess)
+    return deleted
+
+
+def reap_expired_messages(batch_size=RETENTION_BATCH_SIZE, pause=None):
+    """Apply every room's retention policy; returns stats"""
+    started = time.time()
+    stats = {'rooms': 0, 'deleted': 0}
+    for room_id, retention_days, max_messages in room_policies():
+        stats['rooms'] += 1
+        stats['deleted'] += len(reap_room(room_id, retention_days, max_messages, batch_size=batch_size, pause=pause))
+    stats['seconds'] = round(time.time() - started, 2)
+    return stats
+
+
+def start_retention_reaper(app):
+    """Run the reaper every RETENTION_INTERVAL seconds as a Socket.IO background task"""
+    interval = app.config.get('RETENTION_INTERVAL', 0)
+    if interval <= 0 or app.extensions.get('retention_reaper'):
+        return
+    app.extensions['retention_reaper'] = True
+
+    from app import socketio
+
+    def run():
+        while True:
+            socketio.sleep(interval)
+            with app.app_context():
+                try:
+                    stats = reap_expired_messages(pause=lambda: socketio.sleep(RETENTION_BATCH_PAUSE))
+                    if stats['deleted']:
+                        print(f"✓ Retention: deleted {stats['deleted']} expired messages "
+                              f"in {stats['rooms']} rooms ({stats['seconds']}s)")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠ Retention reaper failed: {e}")
+                finally:
+                    db.session.remove()
+
+    socketio.start_background_task(run)
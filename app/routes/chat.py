@@ -3,15 +3,21 @@ Chat Routes
 Handles main chat interface and room management
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from app.models import db, Room, Message, User
-from datetime import datetime
-import requests
-import os
+from app.routes.uploads import release_file
+from app.giphy import get_gifs, GiphyUnavailable
+from app.routes.gifs import mirror_gifs
+from app.metrics import count_cache
+from app.dedup import forget_client_ids
+from app.partitions import messages_partitioned
+from datetime import datetime, timedelta
 
 chat_bp = Blueprint('chat', __name__)
 
+HISTORY_RECENT_DAYS = 31  # Room history is looked up in this window first, then further back if needed
+
 @chat_bp.route('/')
 @login_required
 def index():
@@ -42,7 +48,8 @@ def create_room():
         new_room = Room(
             name=room_name,
             description=description,
-            created_by=current_user.id
+            created_by=current_user.id,
+            retention_days=current_app.config.get('ROOM_RETENTION_DAYS') or None
         )
         db.session.add(new_room)
         db.session.commit()
@@ -126,11 +133,22 @@ def get_messages(room_id):
         # Get messages with proper error handling and eager loading
         try:
             from sqlalchemy.orm import joinedload
-            messages = Message.query.options(joinedload(Message.user), joinedload(Message.room))\
+            # Attachment metadata comes from the same query via a join on the unique stored_files.path
+            room_messages = Message.query.options(joinedload(Message.user), joinedload(Message.room), joinedload(Message.attachment))\
                 .filter_by(room_id=room_id)\
-                .order_by(Message.timestamp.desc())\
-                .limit(limit)\
-                .all()
+                .order_by(Message.timestamp.desc())
+            if messages_partitioned(current_app):
+                # Look in the recent window first: with monthly partitions (app/partitions.py) the
+                # timestamp bound lets PostgreSQL prune every older partition at plan time
+                recent_cutoff = datetime.utcnow() - timedelta(days=HISTORY_RECENT_DAYS)
+                messages = room_messages.filter(Message.timestamp >= recent_cutoff).limit(limit).all()
+                if len(messages) < limit:
+                    messages += room_messages.filter(
+                        db.or_(Message.timestamp < recent_cutoff, Message.timestamp.is_(None))
+                    ).limit(limit - len(messages)).all()
+            else:
+                # A plain table walks ix_messages_room_id_timestamp either way; one query suffices
+                messages = room_messages.limit(limit).all()
         except Exception as query_error:
             print(f"Database query error: {query_error}")
             import traceback
@@ -175,6 +193,16 @@ def get_rooms():
     return jsonify([room.to_dict() for room in user_rooms])
 
 
+@chat_bp.route('/api/socket-stats')
+@login_required
+def get_socket_stats():
+    """API endpoint with Socket.IO outbound queue depths and slow-consumer counters"""
+    backpressure = current_app.extensions.get('socket_backpressure')
+    if backpressure is None:
+        return jsonify({'error': 'Socket queue limits are disabled'}), 404
+    return jsonify(backpressure.stats())
+
+
 @chat_bp.route('/api/online-users/<int:room_id>')
 @login_required
 def get_online_users(room_id):
@@ -218,19 +246,9 @@ def delete_message(message_id):
         
         room_id = message.room_id
         
-        # Delete associated audio file if it's an audio message
-        if message.message_type == 'audio' and message.content:
-            import os
-            audio_path = message.content
-            if audio_path.startswith('/'):
-                audio_path = audio_path[1:]  # Remove leading slash
-            # Try to find and delete the audio file
-            full_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), audio_path)
-            if os.path.exists(full_path):
-                try:
-                    os.remove(full_path)
-                except Exception as e:
-                    print(f"Warning: Could not delete audio file: {e}")
+        # Release the message's uploaded file (deleted once no other message uses it)
+        release_file(message.content, message.message_type)
+        forget_client_ids([message.id])
         
         db.session.delete(message)
         db.session.commit()
@@ -261,20 +279,11 @@ def delete_room(room_id):
         
         room_name = room.name
         
-        # Delete all messages in the room (cascade will handle this, but we'll also clean up audio files)
+        # Delete all messages in the room (cascade will handle this, but we'll also release their uploaded files)
         messages = Message.query.filter_by(room_id=room_id).all()
-        import os
         for msg in messages:
-            if msg.message_type == 'audio' and msg.content:
-                audio_path = msg.content
-                if audio_path.startswith('/'):
-                    audio_path = audio_path[1:]
-                full_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), audio_path)
-                if os.path.exists(full_path):
-                    try:
-                        os.remove(full_path)
-                    except Exception as e:
-                        print(f"Warning: Could not delete audio file: {e}")
+            release_file(msg.content, msg.message_type)
+        forget_client_ids([msg.id for msg in messages])
         
         db.session.delete(room)
         db.session.commit()
@@ -285,42 +294,48 @@ def delete_room(room_id):
         return jsonify({'error': str(e)}), 500
 
 
+@chat_bp.route('/api/rooms/<int:room_id>/retention', methods=['PUT'])
+@login_required
+def update_room_retention(room_id):
+    """Set a room's retention policy (only by the creator); null clears a limit"""
+    room = Room.query.get(room_id)
+    if not room:
+        return jsonify({'error': 'Room not found'}), 404
+    if room.created_by != current_user.id:
+        return jsonify({'error': 'Unauthorized: You can only change rooms you created'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    for field in ('retention_days', 'retention_max_messages'):
+        if field not in data:
+            continue
+        value = data[field]
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+            return jsonify({'error': f'{field} must be a positive integer or null'}), 400
+        setattr(room, field, value)
+    
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'success': True, 'room': room.to_dict()})
+
+
 @chat_bp.route('/api/search-gifs')
 @login_required
 def search_gifs():
-    """Search GIFs using Giphy API"""
+    """Search GIFs using Giphy API (cached, see app/giphy.py)"""
     query = request.args.get('q', '')
     limit = request.args.get('limit', 20, type=int)
     
     if not query:
         return jsonify({'error': 'Query parameter is required'}), 400
     
-    # Giphy API (using public beta key - replace with your own for production)
-    # Get free API key from https://developers.giphy.com/
-    api_key = os.environ.get('GIPHY_API_KEY', 'GlVGYHkr3WSBnllca54iNt0yFbjz7L65')  # Public beta key
-    url = f'https://api.giphy.com/v1/gifs/search'
-    
     try:
-        response = requests.get(url, params={
-            'api_key': api_key,
-            'q': query,
-            'limit': limit,
-            'rating': 'g'  # General audience
-        }, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            gifs = []
-            for gif in data.get('data', []):
-                gifs.append({
-                    'id': gif.get('id'),
-                    'url': gif.get('images', {}).get('original', {}).get('url'),
-                    'preview': gif.get('images', {}).get('preview_gif', {}).get('url'),
-                    'title': gif.get('title', '')
-                })
-            return jsonify({'gifs': gifs}), 200
-        else:
-            return jsonify({'error': 'Failed to fetch GIFs'}), 500
+        gifs, cache_status = get_gifs('search', query, limit)
+        return gif_response(gifs, cache_status)
+    except GiphyUnavailable as e:
+        return jsonify({'error': f'Error searching GIFs: {str(e)}'}), 503
     except Exception as e:
         return jsonify({'error': f'Error searching GIFs: {str(e)}'}), 500
 
@@ -328,31 +343,24 @@ def search_gifs():
 @chat_bp.route('/api/trending-gifs')
 @login_required
 def trending_gifs():
-    """Get trending GIFs from Giphy"""
+    """Get trending GIFs from Giphy (cached, see app/giphy.py)"""
     limit = request.args.get('limit', 20, type=int)
-    api_key = os.environ.get('GIPHY_API_KEY', 'GlVGYHkr3WSBnllca54iNt0yFbjz7L65')
-    url = f'https://api.giphy.com/v1/gifs/trending'
     
     try:
-        response = requests.get(url, params={
-            'api_key': api_key,
-            'limit': limit,
-            'rating': 'g'
-        }, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            gifs = []
-            for gif in data.get('data', []):
-                gifs.append({
-                    'id': gif.get('id'),
-                    'url': gif.get('images', {}).get('original', {}).get('url'),
-                    'preview': gif.get('images', {}).get('preview_gif', {}).get('url'),
-                    'title': gif.get('title', '')
-                })
-            return jsonify({'gifs': gifs}), 200
-        else:
-            return jsonify({'error': 'Failed to fetch trending GIFs'}), 500
+        gifs, cache_status = get_gifs('trending', '', limit)
+        return gif_response(gifs, cache_status)
+    except GiphyUnavailable as e:
+        return jsonify({'error': f'Error fetching trending GIFs: {str(e)}'}), 503
     except Exception as e:
         return jsonify({'error': f'Error fetching trending GIFs: {str(e)}'}), 500
 
+
+def gif_response(gifs, cache_status):
+    """JSON response for the GIF picker; browsers may reuse it briefly too"""
+    response = jsonify({'gifs': mirror_gifs(gifs)})
+    response.headers['X-Cache'] = cache_status
+    count_cache('giphy', cache_status.lower())
+    response.cache_control.private = True
+    response.cache_control.max_age = 60
+    return response
+
@@ -0,0 +1,209 @@
+"""
+GIF Mirror
+Optional local mirror of Giphy media: each GIF is fetched once into a
+size-bounded on-disk LRU cache and served from our own origin
+"""
+
+from flask import Blueprint, current_app, redirect, send_from_directory, make_response, jsonify
+from flask_login import login_required
+from urllib.parse import urlsplit
+import os
+import re
+import time
+import secrets
+import threading
+from app.giphy import get_session
+from app.metrics import count_cache
+
+gifs_bp = Blueprint('gifs', __name__)
+
+# Giphy media is addressed as https://mediaN.giphy.com/media/[<version>/]<id>/<rendition>
+GIPHY_MEDIA_URL = os.environ.get('GIPHY_MEDIA_URL', 'https://media.giphy.com').rstrip('/')
+GIF_ID_PATTERN = re.compile(r'^[A-Za-z0-9]{1,64}$')
+GIF_RENDITION_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,40}\.(gif|webp|mp4)$')
+GIF_MIME_TYPES = {'gif': 'image/gif', 'webp': 'image/webp', 'mp4': 'video/mp4'}
+
+GIF_MIRROR_MAX_FILE = 20 * 1024 * 1024  # Larger renditions are left on Giphy
+GIF_MIRROR_TOUCH_INTERVAL = 60 * 60  # Seconds between LRU timestamp updates for a cached file
+GIF_MIRROR_EVICT_TARGET = 0.9  # Evict down to this fraction of the size limit
+GIF_CACHE_MAX_AGE = 365 * 24 * 60 * 60  # A Giphy rendition never changes
+
+# Running total of the cache directory size; None until first scanned
+_cache_bytes = None
+_cache_lock = threading.Lock()
+# Renditions being downloaded: {cache name: threading.Event}
+_downloads = {}
+
+
+def mirror_enabled():
+    return bool(current_app.config.get('GIF_MIRROR'))
+
+
+def parse_giphy_url(url):
+    """Return (gif_id, rendition) for a Giphy media URL, or None for anything else"""
+    try:
+        parts = urlsplit(url or '')
+    except ValueError:
+        return None
+    host = (parts.hostname or '').lower()
+    if parts.scheme not in ('http', 'https') or not (host == 'giphy.com' or host.endswith('.giphy.com')):
+        return None
+    segments = [s for s in parts.path.split('/') if s]
+    if len(segments) < 3 or segments[0] != 'media':
+        return None
+    gif_id, rendition = segments[-2], segments[-1]
+    if not GIF_ID_PATTERN.match(gif_id) or not GIF_RENDITION_PATTERN.match(rendition):
+        return None
+    return gif_id, rendition
+
+
+def mirror_url(url):
+    """Rewrite a Giphy media URL to its /gifs/ mirror URL when the mirror is enabled"""
+    if not mirror_enabled():
+        return url
+    parsed = parse_giphy_url(url)
+    if not parsed:
+        return url
+    return f"/gifs/{parsed[0]}/{parsed[1]}"
+
+
+def mirror_gifs(gifs):
+    """Point GIF picker results at the mirror"""
+    if not mirror_enabled():
+        return gifs
+    return [dict(gif, url=mirror_url(gif.get('url')), preview=mirror_url(gif.get('preview'))) for gif in gifs]
+
+
+def _cache_dir():
+    cache_dir = current_app.config['GIF_MIRROR_DIR']
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def _scan_cache(cache_dir):
+    """Return [(mtime, size, path)] for every cached file"""
+    entries = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.startswith('.'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+
+def _add_to_cache(cache_dir, size):
+    """Account for a new file and evict least recently used ones once over the limit"""
+    global _cache_bytes
+    max_bytes = current_app.config.get('GIF_MIRROR_MAX_BYTES', 512 * 1024 * 1024)
+    with _cache_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(size for _, size, _ in _scan_cache(cache_dir))
+        else:
+            _cache_bytes += size
+        if _cache_bytes <= max_bytes:
+            return
+
+        entries = sorted(_scan_cache(cache_dir))
+        total = sum(size for _, size, _ in entries)
+        target = max_bytes * GIF_MIRROR_EVICT_TARGET
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        _cache_bytes = total
+
+
+def _download(gif_id, rendition, dest):
+    """Fetch a rendition from Giphy into dest; returns False if it is too large or unavailable"""
+    temp_path = os.path.join(os.path.dirname(dest), f".download-{secrets.token_hex(8)}")
+    upstream = f"{GIPHY_MEDIA_URL}/media/{gif_id}/{rendition}"
+    try:
+        with get_session().get(upstream, stream=True, timeout=(2, 10)) as response:
+            if response.status_code != 200:
+                return False
+            if int(response.headers.get('Content-Length') or 0) > GIF_MIRROR_MAX_FILE:
+                return False
+            size = 0
+            with open(temp_path, 'wb') as f:
+                for chunk in response.iter_content(64 * 1024):
+                    size += len(chunk)
+                    if size > GIF_MIRROR_MAX_FILE:
+                        return False
+                    f.write(chunk)
+        os.replace(temp_path, dest)
+        _add_to_cache(os.path.dirname(dest), size)
+        return True
+    except Exception as e:
+        print(f"Warning: Could not mirror GIF {gif_id}/{rendition}: {e}")
+        return False
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def ensure_cached(gif_id, rendition):
+    """Return the cached file path for a rendition, downloading it once if needed (None on failure)"""
+    cache_dir = _cache_dir()
+    name = f"{gif_id}_{rendition}"
+    path = os.path.join(cache_dir, name)
+
+    with _cache_lock:
+        cached = os.path.exists(path)
+        waiting = None if cached else _downloads.get(name)
+        leader = not cached and waiting is None
+        if leader:
+            done = threading.Event()
+            _downloads[name] = done
+    count_cache('gif_mirror', 'hit' if cached else 'miss')
+
+    if waiting is not None:
+        # Someone else is downloading it; wait instead of fetching it twice
+        waiting.wait(15)
+    elif leader:
+        try:
+            _download(gif_id, rendition, path)
+        finally:
+            with _cache_lock:
+                _downloads.pop(name, None)
+            done.set()
+
+    if not os.path.exists(path):
+        return None
+    try:
+        # Record the hit for LRU eviction, at most once per interval
+        if os.path.getmtime(path) < time.time() - GIF_MIRROR_TOUCH_INTERVAL:
+            os.utime(path)
+    except OSError:
+        pass
+    return path
+
+
+@gifs_bp.route('/gifs/<gif_id>/<rendition>')
+@login_required
+def serve_gif(gif_id, rendition):
+    """Serve a Giphy rendition from the local mirror, falling back to Giphy itself"""
+    if not GIF_ID_PATTERN.match(gif_id) or not GIF_RENDITION_PATTERN.match(rendition):
+        return jsonify({'error': 'Invalid GIF'}), 400
+
+    upstream = f"{GIPHY_MEDIA_URL}/media/{gif_id}/{rendition}"
+    if not mirror_enabled():
+        return redirect(upstream, code=302)
+
+    path = ensure_cached(gif_id, rendition)
+    if path is None:
+        return redirect(upstream, code=302)
+
+    ext = rendition.rsplit('.', 1)[-1]
+    response = make_response(send_from_directory(
+        os.path.dirname(path), os.path.basename(path),
+        mimetype=GIF_MIME_TYPES[ext],
+        max_age=GIF_CACHE_MAX_AGE,
+        etag=True
+    ))
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -3,10 +3,11 @@ Profile Routes
 Handles user profile management
 """
 
-from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash
+from flask import Blueprint, request, jsonify, render_template, current_app
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
 from app.models import db, User
+from app.thumbnails import submit_thumbnails, delete_thumbnails
+from app.storage import get_storage, key_from_url
 import os
 from datetime import datetime
 
@@ -18,9 +19,6 @@ PROFILE_PICTURES_FOLDER = os.path.join(BASE_DIR, 'uploads', 'profiles')
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
 
-# Ensure profile pictures directory exists
-os.makedirs(PROFILE_PICTURES_FOLDER, exist_ok=True)
-
 def allowed_image_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_IMAGE_EXTENSIONS
@@ -98,26 +96,29 @@ def upload_profile_picture():
         return jsonify({'error': 'File too large. Maximum size: 5MB'}), 400
     
     try:
+        storage = get_storage()
+        
         # Delete old profile picture if exists
         if current_user.profile_picture:
-            old_path = os.path.join(BASE_DIR, current_user.profile_picture.lstrip('/'))
-            if os.path.exists(old_path):
-                os.remove(old_path)
+            old_key = key_from_url(current_user.profile_picture)
+            delete_thumbnails(current_user.profile_picture)
+            if old_key:
+                storage.delete(old_key)
         
         # Generate secure filename
         timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
         ext = file.filename.rsplit('.', 1)[1].lower()
         filename = f"{current_user.id}_{timestamp}.{ext}"
-        filepath = os.path.join(PROFILE_PICTURES_FOLDER, filename)
         
-        # Ensure directory exists
-        os.makedirs(PROFILE_PICTURES_FOLDER, exist_ok=True)
-        file.save(filepath)
+        storage.save_stream(f"profiles/{filename}", file.stream)
         
         # Update user profile picture path
         current_user.profile_picture = f"/uploads/profiles/{filename}"
         db.session.commit()
         
+        # Small avatars are served from derivatives generated in the background
+        submit_thumbnails(current_app._get_current_object(), current_user.profile_picture)
+        
         return jsonify({
             'success': True,
             'profile_picture': current_user.profile_picture
@@ -129,16 +130,20 @@ def upload_profile_picture():
 @profile_bp.route('/uploads/profiles/<filename>')
 def serve_profile_picture(filename):
     """Serve profile pictures (public endpoint)"""
-    from flask import send_from_directory
+    from app.routes.uploads import serve_upload, serve_thumbnail
     
     # Security: ensure filename doesn't contain path traversal
     if '..' in filename or '/' in filename:
         return jsonify({'error': 'Invalid filename'}), 400
     
-    file_path = os.path.join(PROFILE_PICTURES_FOLDER, filename)
+    # Resized avatar for ?size=, when one has been generated
+    thumbnail_response = serve_thumbnail(f"profiles/{filename}")
+    if thumbnail_response:
+        return thumbnail_response
     
-    if not os.path.exists(file_path):
+    # Each upload gets a new timestamped filename, so the URL is immutable
+    response = serve_upload(f"profiles/{filename}")
+    if response is None:
         return jsonify({'error': 'File not found'}), 404
-    
-    return send_from_directory(PROFILE_PICTURES_FOLDER, filename)
+    return response
 
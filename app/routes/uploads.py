@@ -3,16 +3,31 @@ File Upload Routes
 Handles audio file uploads and file attachments
 """
 
-from flask import Blueprint, request, jsonify, send_from_directory, make_response
+from flask import Blueprint, request, jsonify, send_from_directory, make_response, current_app, redirect
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException
+from sqlalchemy.exc import IntegrityError
+from app.models import db, StoredFile, UploadOwner, load_media_info
+from urllib.parse import quote
+import mimetypes
+from app.thumbnails import submit_thumbnails, find_thumbnail, delete_thumbnails, read_image_size
+from app.voice_notes import submit_voice_note
+from app.storage import get_storage, key_from_url, url_from_key
+from app.upload_gc import MEDIA_MESSAGE_TYPES
+from app.attachments import (AUDIO_MIME_TYPES, ATTACHMENT_MIME_TYPES, guess_mime_type,
+                             get_attachment_metadata, invalidate_attachment_metadata)
 import os
+import time
+import secrets
+import hashlib
 from datetime import datetime
 
 uploads_bp = Blueprint('uploads', __name__)
 
 # Get absolute path for upload folder (root directory of project)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+UPLOADS_ROOT = os.path.join(BASE_DIR, 'uploads')
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads', 'audio')
 ATTACHMENTS_FOLDER = os.path.join(BASE_DIR, 'uploads', 'attachments')
 ALLOWED_AUDIO_EXTENSIONS = {'mp3', 'wav', 'ogg', 'webm', 'm4a'}
@@ -23,9 +38,18 @@ ALLOWED_FILE_EXTENSIONS = ALLOWED_IMAGE_EXTENSIONS | ALLOWED_VIDEO_EXTENSIONS |
 MAX_AUDIO_SIZE = 10 * 1024 * 1024  # 10MB
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB for other files
 
-# Ensure upload directories exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(ATTACHMENTS_FOLDER, exist_ok=True)
+# Voice notes streamed while recording are appended to a partial file here
+AUDIO_STREAM_FOLDER = os.path.join(UPLOAD_FOLDER, 'partial')
+AUDIO_STREAM_TIMEOUT = 10 * 60  # Partial recordings idle this long are abandoned
+AUDIO_STREAM_SWEEP_INTERVAL = 60  # Seconds between abandoned-recording sweeps
+_last_audio_stream_sweep = 0
+
+# Uploads are hashed in blocks of this size while they are written to disk
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Upload URLs never change content (content hash or per-upload timestamp in the
+# name), so browsers may cache them for a year without revalidating
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 60 * 60
 
 def allowed_file(filename, allowed_extensions=None):
     """Check if file extension is allowed"""
@@ -46,6 +70,265 @@ def get_file_type(filename):
         return 'file'
     return 'file'
 
+def save_stream_hashed(stream, folder):
+    """Write an upload stream to a temporary file in folder, hashing it on the way.
+    
+    Returns (temp_path, sha256_hex, size).
+    """
+    os.makedirs(folder, exist_ok=True)
+    temp_path = os.path.join(folder, f".upload-{secrets.token_hex(8)}.tmp")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, 'wb') as f:
+            while True:
+                block = stream.read(HASH_CHUNK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                f.write(block)
+                size += len(block)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return temp_path, digest.hexdigest(), size
+
+def hash_file(file_path):
+    """Return (sha256_hex, size) of a file already on disk"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(HASH_CHUNK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+def store_content_addressed(temp_path, sha256, size, url_prefix, ext, mime_type=None, original_name=None):
+    """Move a hashed temp file into storage at its content address, or drop it if that content is already stored.
+    
+    Returns (filename, url). The StoredFile row starts with no references; sending
+    a message that points at the URL retains it. It also records the attachment
+    metadata (mime type, name, image dimensions) that serving and history use.
+    """
+    filename = f"{sha256}.{ext}" if ext else sha256
+    url = f"{url_prefix}/{filename}"
+    key = key_from_url(url)
+    storage = get_storage()
+    stored_file = StoredFile.query.filter_by(path=url).first()
+    media_info = load_media_info(stored_file.media_info) if stored_file else None
+    
+    # Read while the file is still local; only the header is parsed
+    dimensions = read_image_size(temp_path) if mime_type and mime_type.startswith('image/') else None
+    
+    if storage.exists(key) or (media_info and media_info.get('url')):
+        # Duplicate upload: the bytes (or their transcoded replacement) are already stored
+        os.remove(temp_path)
+        if stored_file and not stored_file.ref_count:
+            # Restart the grace period so the upload GC leaves it alone until it is sent
+            stored_file.created_at = datetime.utcnow()
+            db.session.commit()
+    else:
+        storage.save_file(key, temp_path)
+    
+    if stored_file and not stored_file.mime_type and mime_type:
+        # Row from before attachment metadata was recorded
+        stored_file.mime_type = mime_type
+        if dimensions:
+            stored_file.width, stored_file.height = dimensions
+        db.session.commit()
+        invalidate_attachment_metadata(url)
+    elif not stored_file:
+        try:
+            db.session.add(StoredFile(
+                path=url,
+                sha256=sha256,
+                size=size,
+                ref_count=0,
+                mime_type=mime_type,
+                original_name=original_name,
+                width=dimensions[0] if dimensions else None,
+                height=dimensions[1] if dimensions else None
+            ))
+            db.session.commit()
+        except IntegrityError:
+            # Another request stored the same content at the same time
+            db.session.rollback()
+        # Drop any cached "not found" answer for this URL
+        invalidate_attachment_metadata(url)
+    
+    record_uploader(url)
+    return filename, url
+
+def record_uploader(url):
+    """Remember that the current user uploaded this content, which lets them look its hash up later"""
+    stored_file = StoredFile.query.filter_by(path=url).first()
+    if stored_file is None or db.session.get(UploadOwner, (stored_file.id, current_user.id)):
+        return
+    try:
+        db.session.add(UploadOwner(stored_file_id=stored_file.id, user_id=current_user.id))
+        db.session.commit()
+    except IntegrityError:
+        # Same user uploading the same content twice at once
+        db.session.rollback()
+
+def retain_file(url):
+    """Record that a new message references an uploaded file (caller commits)"""
+    stored_file = StoredFile.query.filter_by(path=url).first()
+    if stored_file:
+        stored_file.ref_count = (stored_file.ref_count or 0) + 1
+    return stored_file
+
+def release_file(url, message_type):
+    """Drop a message's reference to an uploaded file, deleting it once unreferenced (caller commits).
+    
+    Only media messages hold a reference (retain_file runs for those alone); a
+    text message that merely contains an upload URL must not release it.
+    """
+    if message_type not in MEDIA_MESSAGE_TYPES or not url or not url.startswith('/uploads/'):
+        return
+    stored_file = StoredFile.query.filter_by(path=url).first()
+    derived_url = None
+    if stored_file:
+        stored_file.ref_count = max((stored_file.ref_count or 0) - 1, 0)
+        if stored_file.ref_count > 0:
+            return
+        media_info = load_media_info(stored_file.media_info)
+        derived_url = media_info.get('url') if media_info else None
+        db.session.delete(stored_file)
+        invalidate_attachment_metadata(url)
+    elif message_type != 'audio':
+        # Files uploaded before content addressing are only cleaned up for audio messages
+        return
+    
+    key = key_from_url(url)
+    if not key:
+        return
+    delete_thumbnails(url)
+    try:
+        storage = get_storage()
+        storage.delete(key)
+        if key_from_url(derived_url):
+            # Transcoded voice note that replaced the original
+            storage.delete(key_from_url(derived_url))
+    except Exception as e:
+        print(f"Warning: Could not delete file {url}: {e}")
+
+def is_content_hash(name):
+    """Check whether a filename stem is a SHA-256 content address"""
+    return len(name) == 64 and all(c in '0123456789abcdef' for c in name)
+
+def send_media(folder, filename, mimetype=None):
+    """Send an uploaded file with immutable caching, ETag/Last-Modified validation and byte ranges.
+    
+    Conditional requests get a 304 and Range requests a 206 from send_file's
+    conditional handling; an unsatisfiable range raises a 416 HTTPException.
+    """
+    if current_app.config.get('MEDIA_OFFLOAD') == 'x-accel':
+        response = accel_redirect(folder, filename, mimetype)
+        response.cache_control.public = True
+        response.cache_control.max_age = MEDIA_CACHE_MAX_AGE
+        response.cache_control.immutable = True
+        return response
+    
+    # Content-addressed files use their hash as a strong ETag that stays the
+    # same across copies and restores; others use werkzeug's mtime/size ETag
+    stem = filename.rsplit('.', 1)[0]
+    etag = stem if is_content_hash(stem) else True
+    
+    # With USE_X_SENDFILE this only emits an X-Sendfile header; otherwise the
+    # file object is handed to the server's wsgi.file_wrapper (sendfile(2) under gunicorn)
+    response = make_response(send_from_directory(
+        folder, filename,
+        mimetype=mimetype,
+        max_age=MEDIA_CACHE_MAX_AGE,
+        etag=etag
+    ))
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def accel_redirect(folder, filename, mimetype=None):
+    """Build an empty response telling nginx to serve the file from its internal uploads location.
+    
+    nginx handles conditional and Range requests itself, so the worker never reads the file.
+    """
+    rel_path = os.path.relpath(os.path.join(folder, filename), UPLOADS_ROOT).replace(os.sep, '/')
+    prefix = current_app.config.get('MEDIA_ACCEL_PREFIX', '/internal-uploads').rstrip('/')
+    
+    response = make_response('')
+    response.headers['X-Accel-Redirect'] = f"{prefix}/{quote(rel_path)}"
+    response.mimetype = mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    return response
+
+def metadata_response(metadata, mimetype=None):
+    """Answer a HEAD or a matching If-None-Match from stored metadata alone, without opening the file"""
+    response = make_response('')
+    response.set_etag(metadata['sha256'])
+    response.cache_control.public = True
+    response.cache_control.max_age = MEDIA_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+    response.mimetype = mimetype or 'application/octet-stream'
+    response.headers['Accept-Ranges'] = 'bytes'
+    if request.if_none_match.contains(metadata['sha256']):
+        response.status_code = 304
+        response.headers.pop('Content-Length', None)
+    else:
+        response.headers['Content-Length'] = str(metadata['size'])
+    return response
+
+def serve_upload(key, mimetype=None):
+    """Serve a stored upload: from local disk via send_media, or by redirecting to a presigned URL.
+    
+    Content-addressed uploads are looked up in the cached attachment metadata
+    first, so an unknown file, a HEAD and a revalidation never touch the disk.
+    Returns None when the file does not exist. Remote backends skip the
+    existence check for other files and let the object store answer 404 itself.
+    """
+    metadata = None
+    stem = key.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+    if is_content_hash(stem):
+        metadata = get_attachment_metadata(url_from_key(key))
+        if metadata is None:
+            return None
+        mimetype = metadata['mime_type'] or mimetype
+    
+    storage = get_storage()
+    if storage.presigned:
+        response = redirect(storage.presigned_url(key, mimetype), code=302)
+        # The redirect target expires, so only cache the redirect for part of its lifetime
+        response.cache_control.private = True
+        response.cache_control.max_age = current_app.config.get('S3_PRESIGN_EXPIRES', 3600) // 2
+        return response
+    
+    if metadata and (request.method == 'HEAD' or request.if_none_match.contains(metadata['sha256'])):
+        return metadata_response(metadata, mimetype)
+    
+    file_path = storage.local_path(key)
+    if metadata is None and not os.path.exists(file_path):
+        return None
+    return send_media(os.path.dirname(file_path), os.path.basename(file_path), mimetype=mimetype)
+
+def serve_thumbnail(key):
+    """Serve the derivative requested with ?size=, or None to fall back to the original"""
+    size = request.args.get('size')
+    if not size:
+        return None
+    accept_webp = 'image/webp' in request.headers.get('Accept', '')
+    thumbnail = find_thumbnail(f"/uploads/{key}", size, accept_webp)
+    if not thumbnail:
+        return None
+    thumb_key, mime_type = thumbnail
+    response = serve_upload(thumb_key, mimetype=mime_type)
+    if response is None:
+        return None
+    # The same URL returns WebP or JPEG depending on what the browser accepts
+    response.headers['Vary'] = 'Accept'
+    return response
+
 @uploads_bp.route('/upload_audio', methods=['POST'])
 @login_required
 def upload_audio():
@@ -69,21 +352,16 @@ def upload_audio():
     if file_size > MAX_AUDIO_SIZE:
         return jsonify({'error': 'File too large. Maximum size: 10MB'}), 400
     
-    # Generate secure filename
-    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-    filename = f"{current_user.id}_{timestamp}_{secure_filename(file.filename)}"
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    ext = secure_filename(file.filename).rsplit('.', 1)[-1].lower()
     
     try:
-        # Ensure directory exists
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        file.save(filepath)
-        # Verify file was saved
-        if not os.path.exists(filepath):
-            return jsonify({'error': 'File was not saved correctly'}), 500
-        
-        # Return URL path (not full system path)
-        url = f"/uploads/audio/{filename}"
+        # Store under the content hash so identical recordings share one file
+        temp_path, sha256, size = save_stream_hashed(file.stream, UPLOAD_FOLDER)
+        filename, url = store_content_addressed(
+            temp_path, sha256, size, '/uploads/audio', ext,
+            mime_type=AUDIO_MIME_TYPES.get(ext), original_name=secure_filename(file.filename)
+        )
+        submit_voice_note(current_app._get_current_object(), url)
         return jsonify({
             'success': True,
             'url': url,
@@ -93,6 +371,174 @@ def upload_audio():
         print(f"Error saving audio file: {e}")
         return jsonify({'error': f'Failed to save file: {str(e)}'}), 500
 
+def get_audio_stream_path(user_id, stream_id):
+    """Return the partial file path for a streamed recording, or None if the id is invalid"""
+    if not stream_id or not stream_id.isalnum():
+        return None
+    return os.path.join(AUDIO_STREAM_FOLDER, f"{user_id}_{stream_id}.part")
+
+def cleanup_abandoned_audio_streams(max_age=AUDIO_STREAM_TIMEOUT):
+    """Delete partial recordings that have not received a chunk for max_age seconds"""
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        with os.scandir(AUDIO_STREAM_FOLDER) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.part'):
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError as e:
+                    print(f"Warning: Could not remove abandoned recording {entry.name}: {e}")
+    except FileNotFoundError:
+        pass
+    return removed
+
+def _maybe_cleanup_audio_streams():
+    """Run the abandoned-recording sweep at most once per sweep interval"""
+    global _last_audio_stream_sweep
+    now = time.time()
+    if now - _last_audio_stream_sweep >= AUDIO_STREAM_SWEEP_INTERVAL:
+        _last_audio_stream_sweep = now
+        cleanup_abandoned_audio_streams()
+
+def start_audio_stream_sweeper(app):
+    """Sweep abandoned recordings every AUDIO_STREAM_SWEEP_INTERVAL seconds as a Socket.IO background task"""
+    interval = app.config.get('AUDIO_STREAM_SWEEP_INTERVAL', AUDIO_STREAM_SWEEP_INTERVAL)
+    if interval <= 0 or app.extensions.get('audio_stream_sweeper'):
+        return
+    app.extensions['audio_stream_sweeper'] = True
+
+    from app import socketio
+
+    def run():
+        global _last_audio_stream_sweep
+        while True:
+            socketio.sleep(interval)
+            try:
+                _last_audio_stream_sweep = time.time()
+                removed = cleanup_abandoned_audio_streams()
+                if removed:
+                    print(f"✓ Removed {removed} abandoned partial recordings")
+            except Exception as e:
+                print(f"⚠ Abandoned recording sweep failed: {e}")
+
+    socketio.start_background_task(run)
+
+def get_recording_extension(mime_type):
+    """Return the audio extension for a MediaRecorder MIME type such as 'audio/mp4;codecs=mp4a.40.2', or None"""
+    base_type = (mime_type or '').split(';', 1)[0].strip().lower()
+    for ext, audio_mime_type in AUDIO_MIME_TYPES.items():
+        if audio_mime_type == base_type:
+            return ext
+    return None
+
+@uploads_bp.route('/upload_audio/stream', methods=['POST'])
+@login_required
+def start_audio_stream():
+    """Start a voice message upload that receives chunks while recording"""
+    _maybe_cleanup_audio_streams()
+    
+    stream_id = secrets.token_hex(16)
+    stream_path = get_audio_stream_path(current_user.id, stream_id)
+    
+    try:
+        os.makedirs(AUDIO_STREAM_FOLDER, exist_ok=True)
+        open(stream_path, 'wb').close()
+        return jsonify({'success': True, 'stream_id': stream_id}), 200
+    except Exception as e:
+        print(f"Error starting audio stream: {e}")
+        return jsonify({'error': f'Failed to start upload: {str(e)}'}), 500
+
+@uploads_bp.route('/upload_audio/stream/<stream_id>', methods=['PUT'])
+@login_required
+def append_audio_stream(stream_id):
+    """Append a recorded chunk to a streamed voice message"""
+    stream_path = get_audio_stream_path(current_user.id, stream_id)
+    if not stream_path or not os.path.exists(stream_path):
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    # The client sends the byte offset it expects the chunk to start at so that
+    # lost or reordered chunks are detected instead of corrupting the file
+    current_size = os.path.getsize(stream_path)
+    offset = request.args.get('offset', current_size, type=int)
+    if offset != current_size:
+        return jsonify({'error': 'Chunk offset mismatch', 'size': current_size}), 409
+    
+    chunk_size = request.content_length or 0
+    if current_size + chunk_size > MAX_AUDIO_SIZE:
+        os.remove(stream_path)
+        return jsonify({'error': 'File too large. Maximum size: 10MB'}), 400
+    
+    try:
+        written = 0
+        with open(stream_path, 'ab') as f:
+            while True:
+                block = request.stream.read(64 * 1024)
+                if not block:
+                    break
+                written += len(block)
+                if current_size + written > MAX_AUDIO_SIZE:
+                    break
+                f.write(block)
+        if current_size + written > MAX_AUDIO_SIZE:
+            os.remove(stream_path)
+            return jsonify({'error': 'File too large. Maximum size: 10MB'}), 400
+        return jsonify({'success': True, 'size': current_size + written}), 200
+    except Exception as e:
+        print(f"Error appending audio chunk: {e}")
+        return jsonify({'error': f'Failed to save chunk: {str(e)}'}), 500
+
+@uploads_bp.route('/upload_audio/stream/<stream_id>/finish', methods=['POST'])
+@login_required
+def finish_audio_stream(stream_id):
+    """Finalize a streamed voice message so it can be sent"""
+    stream_path = get_audio_stream_path(current_user.id, stream_id)
+    if not stream_path or not os.path.exists(stream_path):
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    if os.path.getsize(stream_path) == 0:
+        os.remove(stream_path)
+        return jsonify({'error': 'No audio received'}), 400
+    
+    # The recorder's MIME type: webm/Opus in Chrome and Firefox, mp4/AAC in Safari.
+    # Clients that do not send one recorded webm.
+    data = request.get_json(silent=True) or {}
+    ext = get_recording_extension(data.get('mime_type') or AUDIO_MIME_TYPES['webm'])
+    if not ext:
+        return jsonify({'error': 'Invalid audio type. Allowed: mp3, wav, ogg, webm, m4a'}), 400
+    
+    try:
+        # Same filesystem, so storing is an atomic rename rather than a copy
+        sha256, size = hash_file(stream_path)
+        filename, url = store_content_addressed(
+            stream_path, sha256, size, '/uploads/audio', ext,
+            mime_type=AUDIO_MIME_TYPES[ext], original_name=f'voice-message.{ext}'
+        )
+        submit_voice_note(current_app._get_current_object(), url)
+        return jsonify({
+            'success': True,
+            'url': url,
+            'filename': filename
+        }), 200
+    except Exception as e:
+        print(f"Error finishing audio stream: {e}")
+        return jsonify({'error': f'Failed to save file: {str(e)}'}), 500
+
+@uploads_bp.route('/upload_audio/stream/<stream_id>', methods=['DELETE'])
+@login_required
+def cancel_audio_stream(stream_id):
+    """Discard a streamed voice message that will not be sent"""
+    stream_path = get_audio_stream_path(current_user.id, stream_id)
+    if stream_path and os.path.exists(stream_path):
+        try:
+            os.remove(stream_path)
+        except OSError as e:
+            print(f"Warning: Could not delete partial recording: {e}")
+    return jsonify({'success': True}), 200
+
 @uploads_bp.route('/uploads/audio/<filename>')
 def serve_audio(filename):
     """Serve audio files with proper headers for audio playback"""
@@ -101,29 +547,25 @@ def serve_audio(filename):
         if '..' in filename or '/' in filename:
             return jsonify({'error': 'Invalid filename'}), 400
         
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        
-        # Check if file exists
-        if not os.path.exists(file_path):
-            return jsonify({'error': 'File not found'}), 404
-        
-        # Determine MIME type based on extension
+        # Determine MIME type based on extension (stored metadata takes precedence)
         ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
-        mime_types = {
-            'mp3': 'audio/mpeg',
-            'wav': 'audio/wav',
-            'ogg': 'audio/ogg',
-            'webm': 'audio/webm',
-            'm4a': 'audio/mp4'
-        }
-        mime_type = mime_types.get(ext, 'audio/mpeg')
+        mime_type = AUDIO_MIME_TYPES.get(ext, 'audio/mpeg')
+        
+        # Original replaced by its Opus transcode; point old links at the new file
+        metadata = get_attachment_metadata(f"/uploads/audio/{filename}")
+        if metadata and metadata['media_info'] and metadata['media_info'].get('url'):
+            return redirect(metadata['media_info']['url'], code=301)
         
         # Create response with proper headers for audio streaming
-        response = make_response(send_from_directory(UPLOAD_FOLDER, filename, mimetype=mime_type))
+        response = serve_upload(f"audio/{filename}", mimetype=mime_type)
+        if response is None:
+            return jsonify({'error': 'File not found'}), 404
+        if response.status_code == 302:
+            # Redirected to the object store, which sets its own headers
+            return response
         
         # Enable range requests for audio playback (important for seeking)
         response.headers['Accept-Ranges'] = 'bytes'
-        response.headers['Content-Type'] = mime_type
         
         # Add CORS headers if needed
         response.headers['Access-Control-Allow-Origin'] = '*'
@@ -131,6 +573,9 @@ def serve_audio(filename):
         response.headers['Access-Control-Allow-Headers'] = 'Range'
         
         return response
+    except HTTPException:
+        # e.g. 416 for a Range outside the file
+        raise
     except Exception as e:
         print(f"Error serving audio file: {e}")
         return jsonify({'error': str(e)}), 500
@@ -160,25 +605,20 @@ def upload_attachment():
         return jsonify({'error': f'File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB'}), 400
     
     try:
-        # Generate secure filename
-        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
         original_filename = secure_filename(file.filename)
         file_ext = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
-        filename = f"{current_user.id}_{timestamp}_{original_filename}"
-        filepath = os.path.join(ATTACHMENTS_FOLDER, filename)
-        
-        # Ensure directory exists
-        os.makedirs(ATTACHMENTS_FOLDER, exist_ok=True)
-        file.save(filepath)
-        
-        # Verify file was saved
-        if not os.path.exists(filepath):
-            return jsonify({'error': 'File was not saved correctly'}), 500
         
+        # Store under the content hash; the original name travels with the message
         file_type = get_file_type(original_filename)
+        temp_path, sha256, size = save_stream_hashed(file.stream, ATTACHMENTS_FOLDER)
+        filename, url = store_content_addressed(
+            temp_path, sha256, size, '/uploads/attachments', file_ext,
+            mime_type=guess_mime_type(file_ext, file_type), original_name=original_filename
+        )
+        
+        if file_type == 'image':
+            submit_thumbnails(current_app._get_current_object(), url)
         
-        # Return URL path
-        url = f"/uploads/attachments/{filename}"
         return jsonify({
             'success': True,
             'url': url,
@@ -192,6 +632,45 @@ def upload_attachment():
         return jsonify({'error': f'Failed to save file: {str(e)}'}), 500
 
 
+@uploads_bp.route('/upload_attachment/lookup', methods=['POST'])
+@login_required
+def lookup_attachment():
+    """Check whether the caller already uploaded this content so the client can skip uploading it.
+    
+    Only the caller's own uploads are found: answering for any stored file would
+    tell users whether someone else holds a given file. Everything else is a 404,
+    and a repeated upload is still stored once (see store_content_addressed).
+    """
+    data = request.get_json(silent=True) or {}
+    sha256 = (data.get('sha256') or '').lower()
+    original_filename = secure_filename(data.get('filename') or '')
+    
+    if len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+        return jsonify({'error': 'Invalid sha256'}), 400
+    
+    if not original_filename or not allowed_file(original_filename):
+        return jsonify({'error': 'Invalid file type. Allowed: images, videos, documents, audio files'}), 400
+    
+    file_ext = original_filename.rsplit('.', 1)[1].lower()
+    filename = f"{sha256}.{file_ext}"
+    url = f"/uploads/attachments/{filename}"
+    
+    stored_file = StoredFile.query.filter_by(path=url).first()
+    if not stored_file or not db.session.get(UploadOwner, (stored_file.id, current_user.id)) \
+            or not get_storage().exists(key_from_url(url)):
+        return jsonify({'exists': False}), 404
+    
+    return jsonify({
+        'success': True,
+        'exists': True,
+        'url': url,
+        'filename': filename,
+        'original_filename': original_filename,
+        'file_type': get_file_type(original_filename),
+        'file_size': stored_file.size
+    }), 200
+
+
 @uploads_bp.route('/uploads/attachments/<filename>')
 def serve_attachment(filename):
     """Serve attachment files with proper MIME types"""
@@ -200,33 +679,22 @@ def serve_attachment(filename):
         if '..' in filename or '/' in filename:
             return jsonify({'error': 'Invalid filename'}), 400
         
-        file_path = os.path.join(ATTACHMENTS_FOLDER, filename)
+        # Resized preview for images, when one has been generated
+        thumbnail_response = serve_thumbnail(f"attachments/{filename}")
+        if thumbnail_response:
+            thumbnail_response.headers['Access-Control-Allow-Origin'] = '*'
+            return thumbnail_response
         
-        # Check if file exists
-        if not os.path.exists(file_path):
-            return jsonify({'error': 'File not found'}), 404
-        
-        # Determine MIME type based on extension
+        # Determine MIME type based on extension (stored metadata takes precedence)
         ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
-        mime_types = {
-            # Images
-            'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png',
-            'gif': 'image/gif', 'webp': 'image/webp', 'bmp': 'image/bmp', 'svg': 'image/svg+xml',
-            # Videos
-            'mp4': 'video/mp4', 'webm': 'video/webm', 'ogg': 'video/ogg',
-            'mov': 'video/quicktime', 'avi': 'video/x-msvideo', 'mkv': 'video/x-matroska',
-            # Documents
-            'pdf': 'application/pdf',
-            'doc': 'application/msword', 'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'xls': 'application/vnd.ms-excel', 'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            'ppt': 'application/vnd.ms-powerpoint', 'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-            'txt': 'text/plain', 'rtf': 'application/rtf', 'csv': 'text/csv',
-            # Audio (for attachments)
-            'mp3': 'audio/mpeg', 'wav': 'audio/wav', 'ogg': 'audio/ogg', 'webm': 'audio/webm', 'm4a': 'audio/mp4'
-        }
-        mime_type = mime_types.get(ext, 'application/octet-stream')
+        mime_type = ATTACHMENT_MIME_TYPES.get(ext, 'application/octet-stream')
         
-        response = make_response(send_from_directory(ATTACHMENTS_FOLDER, filename, mimetype=mime_type))
+        response = serve_upload(f"attachments/{filename}", mimetype=mime_type)
+        if response is None:
+            return jsonify({'error': 'File not found'}), 404
+        if response.status_code == 302:
+            # Redirected to the object store, which sets its own headers
+            return response
         response.headers['Access-Control-Allow-Origin'] = '*'
         
         # For videos, enable range requests for seeking
@@ -234,6 +702,9 @@ def serve_attachment(filename):
             response.headers['Accept-Ranges'] = 'bytes'
         
         return response
+    except HTTPException:
+        # e.g. 416 for a Range outside the file
+        raise
     except Exception as e:
         print(f"Error serving attachment file: {e}")
         return jsonify({'error': str(e)}), 500
@@ -3,12 +3,19 @@ SocketIO Event Handlers
 Handles real-time communication events
 """
 
-from flask import request
+from flask import request, current_app
 from flask_login import current_user
 from flask_socketio import emit, join_room, leave_room, disconnect
-from app.models import db, Message, Room, User
+from app.models import db, Message, MessageClientId, Room, User
+from app.routes.uploads import retain_file, release_file
+from app.upload_gc import MEDIA_MESSAGE_TYPES
+from app.routes.gifs import mirror_url
+from app.batching import broadcast
+from app.dedup import parse_client_id, message_ack, recent_sends, forget_client_ids
+from app.wire import FRAME_FIELDS, WIRE_MSGPACK, negotiate, wire_of, forget, wire_room, emit_frame, reply_frame
 from datetime import datetime
 from functools import wraps
+from sqlalchemy.exc import IntegrityError
 
 # Store typing users per room: {room_id: {user_id: timestamp}}
 typing_users = {}
@@ -37,13 +44,16 @@ def register_socketio_events(socketio):
     """Register all SocketIO event handlers"""
     
     @socketio.on('connect')
-    def handle_connect():
+    def handle_connect(auth=None):
         """Handle client connection"""
         # Check authentication
         if not current_user.is_authenticated:
             print("Unauthenticated connection attempt")
             return False
         
+        # Wire format the client asked for (see app/wire.py)
+        wire = negotiate(current_app, request.sid, auth)
+        
         # Update user online status
         current_user.is_online = True
         current_user.last_seen = datetime.utcnow()
@@ -52,11 +62,15 @@ def register_socketio_events(socketio):
         # Join user to their personal room for notifications
         join_room(f"user_{current_user.id}")
         
-        # Send current user info
-        emit('connected', {
+        # Send current user info (and the compact frame layout to MessagePack clients)
+        connected = {
             'user_id': current_user.id,
-            'username': current_user.username
-        })
+            'username': current_user.username,
+            'wire': wire
+        }
+        if wire == WIRE_MSGPACK:
+            connected['frames'] = FRAME_FIELDS
+        emit('connected', connected)
         
         print(f"User {current_user.username} connected")
     
@@ -64,6 +78,8 @@ def register_socketio_events(socketio):
     @socketio.on('disconnect')
     def handle_disconnect():
         """Handle client disconnection"""
+        forget(request.sid)
+        
         # Check authentication
         if not current_user.is_authenticated:
             return
@@ -103,8 +119,9 @@ def register_socketio_events(socketio):
             emit('error', {'message': 'Room not found'})
             return
         
-        # Join the SocketIO room
+        # Join the SocketIO room, and its sub-room for this connection's wire format
         join_room(f"room_{room_id}")
+        join_room(wire_room(f"room_{room_id}", wire_of(request.sid)))
         
         # Track room membership
         if room_id not in room_members:
@@ -131,10 +148,10 @@ def register_socketio_events(socketio):
         })
         
         # Broadcast updated room members to all room members
-        emit('room_members_update', {
+        emit_frame('room_members_update', {
             'room_id': room_id,
             'members': [user.to_dict() for user in room_users]
-        }, room=f"room_{room_id}")
+        }, f"room_{room_id}")
         
         print(f"User {current_user.username} joined room {room.name}")
     
@@ -156,6 +173,7 @@ def register_socketio_events(socketio):
         
         # Leave the SocketIO room
         leave_room(f"room_{room_id}")
+        leave_room(wire_room(f"room_{room_id}", wire_of(request.sid)))
         
         # Remove from room members tracking
         if room_id in room_members:
@@ -186,10 +204,10 @@ def register_socketio_events(socketio):
         if room_id in room_members:
             room_user_ids = list(room_members[room_id])
             room_users = User.query.filter(User.id.in_(room_user_ids), User.is_online == True).all()
-            emit('room_members_update', {
+            emit_frame('room_members_update', {
                 'room_id': room_id,
                 'members': [user.to_dict() for user in room_users]
-            }, room=f"room_{room_id}")
+            }, f"room_{room_id}")
         
         print(f"User {current_user.username} left room {room.name}")
     
@@ -197,29 +215,45 @@ def register_socketio_events(socketio):
     @socketio.on('send_message')
     @authenticated_only
     def handle_send_message(data):
-        """Handle sending a chat message (text, GIF, audio, or file attachment)"""
+        """Handle sending a chat message (text, GIF, audio, or file attachment).
+        
+        Returns the ack: the stored message's id and timestamp, or the error.
+        A resend with the same client_id is acked again without storing or
+        broadcasting the message twice.
+        """
         content = data.get('content', '').strip()
         room_id = data.get('room_id')
         message_type = data.get('message_type', 'text')
         file_name = data.get('file_name', None)
+        client_id = parse_client_id(data.get('client_id'))
+        
+        def rejected(error):
+            emit('error', {'message': error})
+            return {'ok': False, 'error': error}
         
         if not content:
-            emit('error', {'message': 'Message content cannot be empty'})
-            return
+            return rejected('Message content cannot be empty')
         
         if not room_id:
-            emit('error', {'message': 'Room ID is required'})
-            return
+            return rejected('Room ID is required')
+        
+        if client_id:
+            ack = recent_sends().get(current_user.id, client_id)
+            if ack:
+                return dict(ack, duplicate=True)
         
         # Validate message type
         valid_types = ['text', 'gif', 'audio', 'image', 'video', 'file']
         if message_type not in valid_types:
             message_type = 'text'
         
+        if message_type == 'gif':
+            # Serve from the local GIF mirror when it is enabled
+            content = mirror_url(content)
+        
         room = Room.query.get(room_id)
         if not room:
-            emit('error', {'message': 'Room not found'})
-            return
+            return rejected('Room not found')
         
         # Create and save message
         try:
@@ -229,9 +263,24 @@ def register_socketio_events(socketio):
                 room_id=room_id,
                 message_type=message_type,
                 file_name=file_name,
-                timestamp=datetime.utcnow()
+                timestamp=datetime.utcnow(),
+                client_id=client_id
             )
             db.session.add(message)
+            if client_id:
+                # Fails the commit with an IntegrityError if this send was already stored
+                db.session.flush()
+                db.session.add(MessageClientId(user_id=current_user.id, client_id=client_id, message_id=message.id))
+            if message_type in MEDIA_MESSAGE_TYPES:
+                stored_file = retain_file(content)
+                if stored_file is None:
+                    # Only uploads hold a reference count; deleting a message pointing elsewhere would
+                    # release someone else's file
+                    db.session.rollback()
+                    return rejected('Attachment not found')
+                if stored_file.media_info:
+                    # Voice note already processed (e.g. sent after the worker finished)
+                    message.media_info = stored_file.media_info
             db.session.commit()
             
             # Clear typing indicator
@@ -243,18 +292,34 @@ def register_socketio_events(socketio):
             # Ensure file_name is included in the response
             if file_name:
                 message_data['file_name'] = file_name
-            emit('new_message', message_data, room=f"room_{room_id}")
+            broadcast('new_message', message_data, f"room_{room_id}")
             
             # Clear typing indicators
-            emit('stop_typing', {
+            broadcast('stop_typing', {
                 'user_id': current_user.id,
-                'username': current_user.username
-            }, room=f"room_{room_id}", include_self=False)
+                'username': current_user.username,
+                'room_id': room_id
+            }, f"room_{room_id}", include_self=False)
             
+            ack = message_ack(message_data)
+            if client_id:
+                recent_sends().add(current_user.id, client_id, ack)
+            return ack
+            
+        except IntegrityError:
+            db.session.rollback()
+            # A resend that missed the in-memory window: the first copy is already stored
+            key = db.session.get(MessageClientId, (current_user.id, client_id)) if client_id else None
+            existing = db.session.get(Message, key.message_id) if key else None
+            if existing is None:
+                return rejected('Failed to send message')
+            ack = message_ack(existing.to_dict())
+            recent_sends().add(current_user.id, client_id, ack)
+            return dict(ack, duplicate=True)
         except Exception as e:
             db.session.rollback()
-            emit('error', {'message': 'Failed to send message'})
             print(f"Error sending message: {e}")
+            return rejected('Failed to send message')
     
     
     @socketio.on('typing')
@@ -273,11 +338,11 @@ def register_socketio_events(socketio):
         typing_users[room_id][current_user.id] = datetime.utcnow()
         
         # Broadcast typing indicator (exclude sender)
-        emit('user_typing', {
+        broadcast('user_typing', {
             'user_id': current_user.id,
             'username': current_user.username,
             'room_id': room_id
-        }, room=f"room_{room_id}", include_self=False)
+        }, f"room_{room_id}", include_self=False)
     
     
     @socketio.on('stop_typing')
@@ -294,11 +359,11 @@ def register_socketio_events(socketio):
             del typing_users[room_id][current_user.id]
         
         # Broadcast stop typing
-        emit('stop_typing', {
+        broadcast('stop_typing', {
             'user_id': current_user.id,
             'username': current_user.username,
             'room_id': room_id
-        }, room=f"room_{room_id}", include_self=False)
+        }, f"room_{room_id}", include_self=False)
     
     
     @socketio.on('request_online_users')
@@ -315,19 +380,19 @@ def register_socketio_events(socketio):
                     User.id.in_(room_user_ids),
                     User.is_online == True
                 ).all()
-                emit('online_users', {
+                reply_frame('online_users', {
                     'room_id': room_id,
                     'users': [user.to_dict() for user in room_users]
                 })
             else:
-                emit('online_users', {
+                reply_frame('online_users', {
                     'room_id': room_id,
                     'users': []
                 })
         else:
             # Return all online users (fallback)
             online_users = User.query.filter_by(is_online=True).all()
-            emit('online_users', {
+            reply_frame('online_users', {
                 'room_id': None,
                 'users': [user.to_dict() for user in online_users]
             })
@@ -357,18 +422,9 @@ def register_socketio_events(socketio):
             
             room_id = message.room_id
             
-            # Delete associated audio file if it's an audio message
-            if message.message_type == 'audio' and message.content:
-                import os
-                audio_path = message.content
-                if audio_path.startswith('/'):
-                    audio_path = audio_path[1:]
-                full_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), audio_path)
-                if os.path.exists(full_path):
-                    try:
-                        os.remove(full_path)
-                    except Exception as e:
-                        print(f"Warning: Could not delete audio file: {e}")
+            # Release the message's uploaded file (deleted once no other message uses it)
+            release_file(message.content, message.message_type)
+            forget_client_ids([message.id])
             
             db.session.delete(message)
             db.session.commit()
@@ -414,20 +470,11 @@ def register_socketio_events(socketio):
             
             room_name = room.name
             
-            # Delete all messages in the room (cascade will handle this, but we'll also clean up audio files)
+            # Delete all messages in the room (cascade will handle this, but we'll also release their uploaded files)
             messages = Message.query.filter_by(room_id=room_id).all()
-            import os
             for msg in messages:
-                if msg.message_type == 'audio' and msg.content:
-                    audio_path = msg.content
-                    if audio_path.startswith('/'):
-                        audio_path = audio_path[1:]
-                    full_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), audio_path)
-                    if os.path.exists(full_path):
-                        try:
-                            os.remove(full_path)
-                        except Exception as e:
-                            print(f"Warning: Could not delete audio file: {e}")
+                release_file(msg.content, msg.message_type)
+            forget_client_ids([msg.id for msg in messages])
             
             db.session.delete(room)
             db.session.commit()
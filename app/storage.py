@@ -0,0 +1,215 @@
+"""
+Upload Storage
+Backends for uploaded media: a hash-sharded local directory layout and an
+S3-compatible object store (AWS S3, MinIO, R2, ...)
+
+Files are addressed by keys such as 'attachments/<filename>' that mirror the
+public /uploads/<key> URLs, so switching backends never changes message content.
+"""
+
+import os
+import shutil
+import hashlib
+from flask import current_app
+
+STORAGE_COPY_CHUNK_SIZE = 64 * 1024
+
+
+def key_from_url(url):
+    """Map an /uploads/<key> URL to its storage key, or None for anything else"""
+    if not url or not url.startswith('/uploads/'):
+        return None
+    key = url[len('/uploads/'):].split('?', 1)[0]
+    if '..' in key.split('/'):
+        return None
+    return key
+
+
+def url_from_key(key):
+    """Map a storage key back to the public URL it is served from"""
+    return f"/uploads/{key}"
+
+
+class LocalStorage:
+    """Uploads on local disk, spread over hash-prefixed subdirectories.
+
+    'attachments/<name>' lives at <root>/attachments/ab/cd/<name>, where ab/cd
+    come from the content hash in the name (or a hash of the name), so no
+    directory grows past a few thousand entries. Files written before sharding
+    are still found at their flat path.
+    """
+
+    presigned = False
+
+    def __init__(self, root, shard_depth=2):
+        self.root = root
+        self.shard_depth = shard_depth
+
+    def _shard_path(self, key):
+        directory, _, name = key.rpartition('/')
+        stem = name.rsplit('.', 1)[0]
+        digest = stem if len(stem) == 64 else hashlib.sha256(name.encode('utf-8')).hexdigest()
+        shards = [digest[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+        return os.path.join(self.root, directory, *shards, name)
+
+    def local_path(self, key):
+        """Absolute path of a key on disk (the sharded location unless a legacy flat file exists)"""
+        sharded = self._shard_path(key)
+        if self.shard_depth and not os.path.exists(sharded):
+            flat = os.path.join(self.root, key)
+            if os.path.exists(flat):
+                return flat
+        return sharded
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def size(self, key):
+        return os.path.getsize(self.local_path(key))
+
+    def save_file(self, key, src_path):
+        """Move a finished local file into storage (a rename on the same filesystem)"""
+        dest = self._shard_path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(src_path, dest)
+
+    def save_stream(self, key, stream):
+        """Write a file-like object into storage without loading it into memory"""
+        dest = self._shard_path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        temp_path = f"{dest}.tmp"
+        with open(temp_path, 'wb') as f:
+            shutil.copyfileobj(stream, f, STORAGE_COPY_CHUNK_SIZE)
+        os.replace(temp_path, dest)
+
+    def open(self, key):
+        """Open a stored file for streaming reads"""
+        return open(self.local_path(key), 'rb')
+
+    def download(self, key, dest_path):
+        shutil.copyfile(self.local_path(key), dest_path)
+
+    def delete(self, key):
+        path = self.local_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def presigned_url(self, key, mimetype=None):
+        return None
+    
+    def iter_files(self):
+        """Yield (key, size, mtime) for every stored file, skipping hidden scratch directories"""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for name in filenames:
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, name)
+                parts = os.path.relpath(path, self.root).split(os.sep)
+                key = '/'.join(parts)
+                if self.shard_depth and len(parts) > self.shard_depth + 1:
+                    # Drop the shard directories if this is where the key would be sharded to
+                    candidate = '/'.join(parts[:-self.shard_depth - 1] + parts[-1:])
+                    if self._shard_path(candidate) == path:
+                        key = candidate
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield key, stat.st_size, stat.st_mtime
+
+
+class S3Storage:
+    """Uploads in an S3-compatible bucket, served to browsers through presigned URLs"""
+
+    presigned = True
+
+    def __init__(self, bucket, endpoint_url=None, region=None, prefix='uploads', presign_expires=3600):
+        # boto3 is optional and slow to import - only load it when S3 is actually used
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        self.ClientError = ClientError
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.presign_expires = presign_expires
+        # Credentials come from the usual AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY variables
+        self.client = boto3.client('s3', endpoint_url=endpoint_url or None, region_name=region or None)
+
+    def _object_key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def local_path(self, key):
+        return None
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except self.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def size(self, key):
+        head = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        return head['ContentLength']
+
+    def save_file(self, key, src_path):
+        """Upload a finished local file (multipart for large files) and remove the local copy"""
+        self.client.upload_file(src_path, self.bucket, self._object_key(key))
+        os.remove(src_path)
+
+    def save_stream(self, key, stream):
+        """Upload a file-like object in parts without buffering it whole"""
+        self.client.upload_fileobj(stream, self.bucket, self._object_key(key))
+
+    def open(self, key):
+        """Return the object body as a streaming file-like object"""
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))['Body']
+
+    def download(self, key, dest_path):
+        self.client.download_file(self.bucket, self._object_key(key), dest_path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def presigned_url(self, key, mimetype=None):
+        """Time-limited URL that lets the browser fetch the object straight from the bucket"""
+        params = {'Bucket': self.bucket, 'Key': self._object_key(key)}
+        if mimetype:
+            params['ResponseContentType'] = mimetype
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.presign_expires)
+    
+    def iter_files(self):
+        """Yield (key, size, mtime) for every object under the prefix, a listing page at a time"""
+        prefix = f"{self.prefix}/" if self.prefix else ''
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key'][len(prefix):], obj['Size'], obj['LastModified'].timestamp()
+
+
+def create_storage(config):
+    """Build the storage backend selected by STORAGE_BACKEND"""
+    backend = config.get('STORAGE_BACKEND', 'local')
+    if backend == 's3':
+        return S3Storage(
+            bucket=config['S3_BUCKET'],
+            endpoint_url=config.get('S3_ENDPOINT_URL'),
+            region=config.get('S3_REGION'),
+            prefix=config.get('S3_PREFIX', 'uploads'),
+            presign_expires=config.get('S3_PRESIGN_EXPIRES', 3600)
+        )
+    return LocalStorage(config['UPLOADS_ROOT'], shard_depth=config.get('STORAGE_SHARD_DEPTH', 2))
+
+
+def get_storage():
+    """Return the current app's storage backend, creating it on first use"""
+    storage = current_app.extensions.get('storage')
+    if storage is None:
+        storage = create_storage(current_app.config)
+        current_app.extensions['storage'] = storage
+    return storage
@@ -0,0 +1,200 @@
+"""
+Image Thumbnails
+Generates resized WebP/JPEG previews of image attachments and profile pictures
+in a background process pool
+"""
+
+import os
+import shutil
+import tempfile
+from app.models import db, MediaDerivative
+from app.storage import get_storage, key_from_url, url_from_key
+from app.workers import workers_enabled, submit_job
+
+# Pillow is optional - without it images are always served at full size
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+# Longest edge in pixels for each size served via ?size=<name>
+THUMBNAIL_SIZES = {
+    'sm': 96,    # Avatars in the member list and message headers
+    'md': 480,   # Inline image previews in the chat view
+}
+THUMBNAIL_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+THUMBNAIL_MIME_TYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_FOLDER_NAME = 'thumbs'
+THUMBNAIL_FORMAT_PREFERENCE = ['webp', 'jpg']
+# Animated GIFs and vector SVGs would lose what makes them useful if flattened
+THUMBNAIL_SOURCE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp', 'bmp'}
+
+
+def thumbnails_enabled():
+    """Thumbnails need Pillow and the media worker pool (MEDIA_WORKERS > 0)"""
+    return Image is not None and workers_enabled()
+
+
+def read_image_size(path):
+    """Return (width, height) from an image header without decoding it, or None"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def get_thumbnail_key(key, size, fmt):
+    """Return the storage key of the derivative of key at size/fmt"""
+    directory, _, name = key.rpartition('/')
+    stem = name.rsplit('.', 1)[0]
+    return f"{directory}/{THUMBNAIL_FOLDER_NAME}/{stem}_{size}.{fmt}"
+
+
+def generate_thumbnails(source_path, output_dir, stem):
+    """Write every size/format derivative of an image into output_dir (runs in a worker process).
+
+    Returns a list of dicts with size, format, path, width and height.
+    """
+    results = []
+
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        for size, max_edge in THUMBNAIL_SIZES.items():
+            thumb = image.copy()
+            # Never upscales, so small originals keep their size
+            thumb.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+            for fmt, pil_format in THUMBNAIL_FORMATS.items():
+                out = thumb
+                if pil_format == 'JPEG' and out.mode == 'RGBA':
+                    # JPEG has no alpha channel - flatten onto white
+                    background = Image.new('RGB', out.size, (255, 255, 255))
+                    background.paste(out, mask=out.split()[3])
+                    out = background
+
+                thumb_path = os.path.join(output_dir, f"{stem}_{size}.{fmt}")
+                out.save(thumb_path, pil_format, quality=THUMBNAIL_QUALITY)
+
+                results.append({
+                    'size': size,
+                    'format': fmt,
+                    'path': thumb_path,
+                    'width': out.width,
+                    'height': out.height
+                })
+
+    return results
+
+
+def _record_thumbnails(app, source_url, output_dir, temp_source, future):
+    """Move finished derivatives into storage and store their dimensions (runs when the worker completes)"""
+    try:
+        results = future.result()
+    except Exception as e:
+        print(f"Warning: Could not generate thumbnails for {source_url}: {e}")
+        results = []
+
+    with app.app_context():
+        try:
+            storage = get_storage()
+            key = key_from_url(source_url)
+            for result in results:
+                thumb_key = get_thumbnail_key(key, result['size'], result['format'])
+                storage.save_file(thumb_key, result['path'])
+
+                derivative = MediaDerivative.query.filter_by(
+                    source_path=source_url,
+                    size=result['size'],
+                    format=result['format']
+                ).first()
+                if not derivative:
+                    derivative = MediaDerivative(
+                        source_path=source_url,
+                        size=result['size'],
+                        format=result['format']
+                    )
+                    db.session.add(derivative)
+                derivative.path = url_from_key(thumb_key)
+                derivative.width = result['width']
+                derivative.height = result['height']
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Warning: Could not record thumbnails for {source_url}: {e}")
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+            if temp_source and os.path.exists(temp_source):
+                os.remove(temp_source)
+
+
+def submit_thumbnails(app, source_url):
+    """Queue derivative generation for an uploaded image; returns the future or None"""
+    key = key_from_url(source_url)
+    ext = key.rsplit('.', 1)[-1].lower() if key and '.' in key else ''
+    if not thumbnails_enabled() or ext not in THUMBNAIL_SOURCE_EXTENSIONS:
+        return None
+
+    # Content-addressed uploads may already have their derivatives
+    expected = len(THUMBNAIL_SIZES) * len(THUMBNAIL_FORMATS)
+    if MediaDerivative.query.filter_by(source_path=source_url).count() >= expected:
+        return None
+
+    # Scratch space inside the uploads root so moving results into local storage is a rename
+    scratch_root = app.config['UPLOADS_ROOT']
+    os.makedirs(scratch_root, exist_ok=True)
+    output_dir = tempfile.mkdtemp(prefix='.thumbs-', dir=scratch_root)
+    temp_source = None
+    try:
+        storage = get_storage()
+        source_path = storage.local_path(key)
+        if source_path is None:
+            # Remote storage: the worker needs a local copy to read
+            fd, temp_source = tempfile.mkstemp(prefix='.source-', dir=output_dir)
+            os.close(fd)
+            storage.download(key, temp_source)
+            source_path = temp_source
+
+        stem = key.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+        future = submit_job(generate_thumbnails, source_path, output_dir, stem)
+        future.add_done_callback(lambda f: _record_thumbnails(app, source_url, output_dir, temp_source, f))
+        return future
+    except Exception as e:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        print(f"Warning: Could not queue thumbnails for {source_url}: {e}")
+        return None
+
+
+def find_thumbnail(source_url, size, accept_webp=True):
+    """Return (storage key, mimetype) of a generated derivative, or None if there is none yet"""
+    if size not in THUMBNAIL_SIZES:
+        return None
+    formats = THUMBNAIL_FORMAT_PREFERENCE if accept_webp else ['jpg']
+    derivatives = {
+        d.format: d for d in MediaDerivative.query.filter_by(source_path=source_url, size=size).all()
+    }
+    for fmt in formats:
+        derivative = derivatives.get(fmt)
+        if derivative and derivative.path:
+            return key_from_url(derivative.path), THUMBNAIL_MIME_TYPES[fmt]
+    return None
+
+
+def delete_thumbnails(source_url):
+    """Remove every derivative of an image along with its metadata rows (caller commits)"""
+    storage = get_storage()
+    for derivative in MediaDerivative.query.filter_by(source_path=source_url).all():
+        thumb_key = key_from_url(derivative.path) if derivative.path else None
+        if thumb_key:
+            try:
+                storage.delete(thumb_key)
+            except Exception as e:
+                print(f"Warning: Could not delete thumbnail {derivative.path}: {e}")
+        db.session.delete(derivative)
@@ -0,0 +1,166 @@
+"""
+Upload Garbage Collector
+Finds uploaded files that nothing in the database refers to any more (unsent
+uploads, failed deletions, stale derivatives) and deletes them in small batches
+"""
+
+import time
+from datetime import datetime
+from app.models import db, User, Message, StoredFile, MediaDerivative, load_media_info
+from app.storage import get_storage, url_from_key
+from app.attachments import invalidate_attachment_metadata
+
+UPLOAD_GC_GRACE_PERIOD = 24 * 60 * 60  # Files younger than this may still be about to be sent
+UPLOAD_GC_BATCH_SIZE = 500  # Files deleted (and rows committed) per batch
+UPLOAD_GC_BATCH_PAUSE = 0.5  # Seconds yielded to the chat worker between batches
+UPLOAD_GC_STREAM_CHUNK = 1000  # Rows fetched at a time while collecting references
+# Partial recordings have their own sweeper in routes/uploads.py
+UPLOAD_GC_SKIP_PREFIXES = ('audio/partial/',)
+MEDIA_MESSAGE_TYPES = ('audio', 'image', 'video', 'file')
+
+
+def collect_referenced_urls(chunk_size=UPLOAD_GC_STREAM_CHUNK):
+    """Return (URLs still in use, {transcoded URL: source URL}), streaming rows instead of loading whole tables.
+
+    A voice note replaced by its Opus transcode has no file of its own left;
+    the second dict lets the sweep delete its stored_files row with the transcode.
+    """
+    referenced = set()
+
+    messages = db.session.query(Message.content).filter(
+        Message.message_type.in_(MEDIA_MESSAGE_TYPES),
+        Message.content.like('/uploads/%')
+    ).yield_per(chunk_size)
+    for (content,) in messages:
+        referenced.add(content.split('?', 1)[0])
+
+    profiles = db.session.query(User.profile_picture).filter(
+        User.profile_picture.like('/uploads/%')
+    ).yield_per(chunk_size)
+    for (picture,) in profiles:
+        referenced.add(picture.split('?', 1)[0])
+
+    # Derived files live as long as their source does
+    derived = set()
+    sources = {}
+    transcoded = db.session.query(StoredFile.path, StoredFile.media_info).filter(
+        StoredFile.media_info.isnot(None)
+    ).yield_per(chunk_size)
+    for path, media_info in transcoded:
+        info = load_media_info(media_info)
+        if info and info.get('url'):
+            sources[info['url']] = path
+            if path in referenced:
+                derived.add(info['url'])
+
+    thumbnails = db.session.query(MediaDerivative.source_path, MediaDerivative.path).yield_per(chunk_size)
+    for source_path, path in thumbnails:
+        if source_path in referenced and path:
+            derived.add(path)
+
+    return referenced | derived, sources
+
+
+def _delete_batch(storage, batch, cutoff, stats, dry_run, sources=None):
+    """Delete a batch of (key, size) candidates after re-checking that none was re-uploaded meanwhile.
+
+    A transcoded file is checked and deleted together with its source's stored_files
+    row; otherwise the row would outlive it and a re-upload of the same bytes
+    would be taken for a duplicate of a file that no longer exists.
+    """
+    sources = sources or {}
+    urls = [url_from_key(key) for key, _ in batch]
+    row_urls = urls + [sources[url] for url in urls if url in sources]
+    rows = {row.path: row for row in StoredFile.query.filter(StoredFile.path.in_(row_urls)).all()}
+    cutoff_time = datetime.utcfromtimestamp(cutoff)  # created_at is naive UTC
+
+    for key, size in batch:
+        url = url_from_key(key)
+        row = rows.get(url) or rows.get(sources.get(url))
+        if row and ((row.ref_count or 0) > 0 or (row.created_at and row.created_at >= cutoff_time)):
+            # Sent or uploaded again since references were collected
+            stats['kept'] += 1
+            continue
+        if not dry_run:
+            try:
+                storage.delete(key)
+            except Exception as e:
+                print(f"Warning: Upload GC could not delete {url}: {e}")
+                stats['errors'] += 1
+                continue
+            if row:
+                db.session.delete(row)
+                invalidate_attachment_metadata(row.path)
+            MediaDerivative.query.filter(MediaDerivative.path == url).delete(synchronize_session=False)
+        stats['deleted'] += 1
+        stats['reclaimed_bytes'] += size
+
+    if not dry_run:
+        db.session.commit()
+
+
+def sweep_orphaned_uploads(grace_period=UPLOAD_GC_GRACE_PERIOD, batch_size=UPLOAD_GC_BATCH_SIZE,
+                           dry_run=False, pause=None):
+    """Delete stored files older than grace_period that no message, profile or derivative refers to.
+
+    pause, if given, is called between batches so a long sweep does not starve
+    other greenlets. Returns a dict of counters including reclaimed_bytes.
+    """
+    started = time.time()
+    cutoff = started - grace_period
+    stats = {'scanned': 0, 'deleted': 0, 'kept': 0, 'errors': 0, 'reclaimed_bytes': 0}
+
+    referenced, sources = collect_referenced_urls()
+    # Release the read transaction so SQLite writers are not held up during the walk
+    db.session.commit()
+
+    storage = get_storage()
+    batch = []
+    for key, size, mtime in storage.iter_files():
+        stats['scanned'] += 1
+        if key.startswith(UPLOAD_GC_SKIP_PREFIXES) or mtime >= cutoff:
+            continue
+        if url_from_key(key) in referenced:
+            continue
+        batch.append((key, size))
+        if len(batch) >= batch_size:
+            _delete_batch(storage, batch, cutoff, stats, dry_run, sources)
+            batch = []
+            if pause:
+                pause()
+    if batch:
+        _delete_batch(storage, batch, cutoff, stats, dry_run, sources)
+
+    stats['referenced'] = len(referenced)
+    stats['seconds'] = round(time.time() - started, 2)
+    return stats
+
+
+def start_upload_gc(app):
+    """Run the sweeper every UPLOAD_GC_INTERVAL seconds as a Socket.IO background task"""
+    interval = app.config.get('UPLOAD_GC_INTERVAL', 0)
+    if interval <= 0 or app.extensions.get('upload_gc'):
+        return
+    app.extensions['upload_gc'] = True
+
+    from app import socketio
+
+    def run():
+        while True:
+            socketio.sleep(interval)
+            with app.app_context():
+                try:
+                    stats = sweep_orphaned_uploads(
+                        grace_period=app.config.get('UPLOAD_GC_GRACE_PERIOD', UPLOAD_GC_GRACE_PERIOD),
+                        pause=lambda: socketio.sleep(UPLOAD_GC_BATCH_PAUSE)
+                    )
+                    if stats['deleted']:
+                        print(f"✓ Upload GC: removed {stats['deleted']} orphaned files, "
+                              f"reclaimed {stats['reclaimed_bytes'] / (1024 * 1024):.1f} MB")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠ Upload GC failed: {e}")
+                finally:
+                    db.session.remove()
+
+    socketio.start_background_task(run)
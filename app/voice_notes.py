@@ -0,0 +1,165 @@
+"""
+Voice Note Processing
+Transcodes uploaded voice notes to low-bitrate Opus/Ogg and precomputes their
+duration and waveform peaks in the background media worker pool
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+from array import array
+from app.models import db, Message, StoredFile
+from app.storage import get_storage, key_from_url, url_from_key
+from app.attachments import invalidate_attachment_metadata
+from app.workers import workers_enabled, submit_job
+
+# ffmpeg is optional - without it voice notes are kept exactly as recorded
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY') or shutil.which('ffmpeg')
+VOICE_TRANSCODE = os.environ.get('VOICE_TRANSCODE', '1') != '0'
+VOICE_OPUS_BITRATE = os.environ.get('VOICE_OPUS_BITRATE', '24k')  # Mono speech stays clear at 16-32k
+VOICE_TRANSCODE_TIMEOUT = 120  # Seconds before a stuck ffmpeg is killed
+WAVEFORM_PEAKS = 64  # Bars drawn by the client
+WAVEFORM_SAMPLE_RATE = 8000  # Decoding rate for peak analysis; plenty for an envelope
+TRANSCODED_SUFFIX = '.opus.ogg'
+TRANSCODED_MIME_TYPE = 'audio/ogg'
+
+
+def voice_processing_enabled():
+    return VOICE_TRANSCODE and FFMPEG_BINARY is not None and workers_enabled()
+
+
+def get_transcoded_key(key):
+    """Storage key of the Opus version of a voice note"""
+    return f"{key.rsplit('.', 1)[0]}{TRANSCODED_SUFFIX}"
+
+
+def compute_peaks(samples, count=WAVEFORM_PEAKS):
+    """Reduce 16-bit PCM samples to count peak levels scaled to 0-100"""
+    if not samples:
+        return [0] * count
+    bucket = max(1, len(samples) // count)
+    peaks = []
+    for i in range(count):
+        segment = samples[i * bucket:(i + 1) * bucket]
+        peaks.append(max(max(segment), -min(segment)) if segment else 0)
+    loudest = max(peaks) or 1
+    return [round(peak * 100 / loudest) for peak in peaks]
+
+
+def process_voice_note(ffmpeg, source_path, output_path):
+    """Transcode to Opus/Ogg and measure the result (runs in a worker process).
+
+    Returns a dict with duration (seconds), peaks and size (bytes of the Opus file).
+    """
+    subprocess.run([
+        ffmpeg, '-nostdin', '-loglevel', 'error', '-y',
+        '-i', source_path,
+        '-vn', '-ac', '1', '-ar', '48000',
+        '-c:a', 'libopus', '-b:a', VOICE_OPUS_BITRATE, '-application', 'voip',
+        '-f', 'ogg', output_path
+    ], check=True, capture_output=True, timeout=VOICE_TRANSCODE_TIMEOUT)
+
+    # Decode the small Opus file back to low-rate mono PCM for the waveform
+    decoded = subprocess.run([
+        ffmpeg, '-nostdin', '-loglevel', 'error',
+        '-i', output_path,
+        '-ac', '1', '-ar', str(WAVEFORM_SAMPLE_RATE), '-f', 's16le', '-'
+    ], check=True, capture_output=True, timeout=VOICE_TRANSCODE_TIMEOUT)
+
+    samples = array('h')
+    samples.frombytes(decoded.stdout[:len(decoded.stdout) // 2 * 2])
+
+    return {
+        'duration': round(len(samples) / WAVEFORM_SAMPLE_RATE, 2),
+        'peaks': compute_peaks(samples),
+        'size': os.path.getsize(output_path)
+    }
+
+
+def _record_voice_note(app, source_url, output_dir, future):
+    """Store the Opus file and metadata, then push it to messages already sent (runs when the worker completes)"""
+    try:
+        result = future.result()
+    except Exception as e:
+        print(f"Warning: Could not process voice note {source_url}: {e}")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return
+
+    with app.app_context():
+        try:
+            stored_file = StoredFile.query.filter_by(path=source_url).first()
+            if not stored_file:
+                # Released while processing
+                return
+
+            storage = get_storage()
+            key = key_from_url(source_url)
+            media_info = {'duration': result['duration'], 'peaks': result['peaks']}
+
+            # Only switch to the Opus file when it actually saves space
+            if result['size'] < (stored_file.size or 0):
+                transcoded_key = get_transcoded_key(key)
+                storage.save_file(transcoded_key, os.path.join(output_dir, 'voice.ogg'))
+                media_info['url'] = url_from_key(transcoded_key)
+                media_info['mime'] = TRANSCODED_MIME_TYPE
+                storage.delete(key)
+
+            stored_file.media_info = json.dumps(media_info)
+            stored_file.duration = result['duration']
+
+            # Messages sent before processing finished; the timestamp bound keeps this on the index
+            messages = Message.query.filter(
+                Message.timestamp >= stored_file.created_at,
+                Message.content == source_url
+            ).all()
+            for message in messages:
+                message.media_info = stored_file.media_info
+            db.session.commit()
+            invalidate_attachment_metadata(source_url)
+
+            from app import socketio
+            for message in messages:
+                socketio.emit('message_media_ready', {
+                    'message_id': message.id,
+                    'room_id': message.room_id,
+                    'media_info': media_info
+                }, room=f"room_{message.room_id}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Warning: Could not record voice note {source_url}: {e}")
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def submit_voice_note(app, source_url):
+    """Queue transcoding and waveform extraction for an uploaded voice note; returns the future or None"""
+    if not voice_processing_enabled():
+        return None
+
+    stored_file = StoredFile.query.filter_by(path=source_url).first()
+    if not stored_file or stored_file.media_info:
+        # Unknown upload, or a duplicate of one already processed
+        return None
+
+    # Scratch space inside the uploads root so moving the result into local storage is a rename
+    key = key_from_url(source_url)
+    scratch_root = app.config['UPLOADS_ROOT']
+    os.makedirs(scratch_root, exist_ok=True)
+    output_dir = tempfile.mkdtemp(prefix='.voice-', dir=scratch_root)
+    try:
+        storage = get_storage()
+        source_path = storage.local_path(key)
+        if source_path is None:
+            # Remote storage: the worker needs a local copy to read
+            source_path = os.path.join(output_dir, 'source')
+            storage.download(key, source_path)
+
+        future = submit_job(process_voice_note, FFMPEG_BINARY, source_path, os.path.join(output_dir, 'voice.ogg'))
+        future.add_done_callback(lambda f: _record_voice_note(app, source_url, output_dir, f))
+        return future
+    except Exception as e:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        print(f"Warning: Could not queue voice note {source_url}: {e}")
+        return None
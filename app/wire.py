@@ -0,0 +1,117 @@
+"""
+Wire Format
+Opt-in MessagePack encoding of the hot Socket.IO frames, negotiated per
+connection. JSON clients keep receiving the usual objects; MessagePack
+clients receive the values as positional arrays (field names are sent once,
+in the 'connected' event) packed into a single binary attachment, or for the
+smallest frames as a plain JSON array
+"""
+
+from flask import request
+from flask_socketio import emit
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+WIRE_JSON = 'json'
+WIRE_MSGPACK = 'msgpack'
+
+# Field order of the compact frames; a (name, fields) pair is a list of records.
+# room_name and formatted_date are left out: chat.js never reads them from a live message
+MESSAGE_FIELDS = ('id', 'content', 'user_id', 'username', 'display_name', 'profile_picture', 'room_id',
+                  'message_type', 'file_name', 'media_info', 'attachment', 'timestamp', 'formatted_time',
+                  'client_id')
+MEMBER_FIELDS = ('id', 'username', 'display_name', 'profile_picture', 'is_online')
+TYPING_FIELDS = ('user_id', 'username', 'room_id')
+
+FRAME_FIELDS = {
+    'new_message': MESSAGE_FIELDS,
+    'room_members_update': ('room_id', ('members', MEMBER_FIELDS)),
+    'online_users': ('room_id', ('users', MEMBER_FIELDS)),
+    'user_typing': TYPING_FIELDS,
+    'stop_typing': TYPING_FIELDS,
+}
+
+# A busy room's events collected over one tick (see app/batching.py): [[event, payload], ...]
+BATCH_EVENT = 'message_batch'
+
+# Frames this small save less by MessagePack than the second WebSocket frame
+# a binary attachment costs, so they go out as compact JSON arrays
+TEXT_FRAMES = ('user_typing', 'stop_typing')
+
+# Negotiated format per Socket.IO session id: {sid: 'json' | 'msgpack'}
+connection_formats = {}
+
+
+def msgpack_enabled(app):
+    return msgpack is not None and app.config.get('SOCKETIO_MSGPACK', True)
+
+
+def negotiate(app, sid, auth):
+    """Record the format a connecting client asked for in its auth payload; returns the format used"""
+    requested = auth.get('wire') if isinstance(auth, dict) else None
+    wire = WIRE_MSGPACK if requested == WIRE_MSGPACK and msgpack_enabled(app) else WIRE_JSON
+    connection_formats[sid] = wire
+    return wire
+
+
+def wire_of(sid):
+    return connection_formats.get(sid, WIRE_JSON)
+
+
+def forget(sid):
+    connection_formats.pop(sid, None)
+
+
+def wire_room(room, wire):
+    """Name of the Socket.IO room holding room's members that use a wire format"""
+    return f"{room}/{wire}"
+
+
+def compact(data, fields):
+    """Turn a payload dict into a list of values in fields order"""
+    values = []
+    for field in fields:
+        if isinstance(field, tuple):
+            name, record_fields = field
+            values.append([compact(record, record_fields) for record in data.get(name) or []])
+        else:
+            values.append(data.get(field))
+    return values
+
+
+def encode(event, data):
+    """Compact payload of a hot frame: MessagePack bytes, or the value list for TEXT_FRAMES"""
+    if event == BATCH_EVENT:
+        return msgpack.packb([[name, compact(payload, FRAME_FIELDS[name])] for name, payload in data],
+                             use_bin_type=True)
+    values = compact(data, FRAME_FIELDS[event])
+    return values if event in TEXT_FRAMES else msgpack.packb(values, use_bin_type=True)
+
+
+def _has_members(socketio, room):
+    return bool(socketio.server.manager.rooms.get('/', {}).get(room))
+
+
+def emit_frame(event, data, room, include_self=True):
+    """Broadcast a hot frame to a room: JSON to JSON clients, one MessagePack encoding shared by the rest"""
+    from app import socketio
+
+    skip_sid = None if include_self else request.sid
+    for wire in (WIRE_JSON, WIRE_MSGPACK):
+        target = wire_room(room, wire)
+        # The server encodes a packet even when nobody would receive it
+        if not _has_members(socketio, target):
+            continue
+        payload = encode(event, data) if wire == WIRE_MSGPACK else data
+        socketio.emit(event, payload, room=target, skip_sid=skip_sid)
+
+
+def reply_frame(event, data):
+    """Send a hot frame to the client that sent the current event, in its format"""
+    if wire_of(request.sid) == WIRE_MSGPACK:
+        emit(event, encode(event, data))
+    else:
+        emit(event, data)
@@ -0,0 +1,41 @@
+"""
+Background Workers
+Shared process pool for CPU-heavy media jobs (thumbnails, voice note transcoding)
+"""
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# MEDIA_WORKERS=0 disables background media processing entirely
+MEDIA_WORKERS = int(os.environ.get('MEDIA_WORKERS', os.environ.get('THUMBNAIL_WORKERS', 2)))
+
+_executor = None
+
+
+def workers_enabled():
+    return MEDIA_WORKERS > 0
+
+
+def _get_executor():
+    """Create the process pool on first use"""
+    global _executor
+    if _executor is None:
+        # Spawn rather than fork so workers don't inherit the eventlet hub or DB connections
+        _executor = ProcessPoolExecutor(
+            max_workers=MEDIA_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+
+def submit_job(fn, *args):
+    """Run fn(*args) in the media process pool and return its future"""
+    global _executor
+    try:
+        return _get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool
+        _executor = None
+        return _get_executor().submit(fn, *args)
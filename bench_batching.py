@@ -0,0 +1,107 @@
+"""
+Broadcast Batching Benchmark
+Drives a room at a steady message rate (each message followed by its
+stop_typing, as send_message does) and compares immediate broadcasts with
+per-tick batching (see app/batching.py): WebSocket frames per client per
+second, bytes per client, server CPU per message and the latency batching adds
+
+Usage: python bench_batching.py [--rate 200] [--seconds 3] [--recipients 50] [--tick-ms 40]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+ROOM = 'room_1'
+
+
+def run(app, socketio, batcher, rate, seconds, recipients):
+    """Broadcast rate messages a second for seconds; returns the measurements for one client"""
+    from app.batching import broadcast
+    from app.wire import WIRE_JSON, wire_room
+
+    app.extensions.pop('broadcast_batcher', None)
+    if batcher is not None:
+        app.extensions['broadcast_batcher'] = batcher
+
+    manager = socketio.server.manager
+    manager.initialize()
+    for i in range(recipients):
+        sid = manager.connect(f'eio{i}', '/')
+        manager.enter_room(sid, '/', wire_room(ROOM, WIRE_JSON))
+
+    sent_at = {}
+    delays = []
+    observed = {'frames': 0, 'bytes': 0}
+
+    def send(eio_sid, pkt):
+        data = pkt.encode()
+        if eio_sid != 'eio0':
+            return
+        # Every message id in the frame was delayed from its broadcast until now
+        now = time.perf_counter()
+        observed['frames'] += 1
+        observed['bytes'] += len(data.encode() if isinstance(data, str) else data)
+        for message_id in [int(part.split(',')[0]) for part in str(data).split('"id":')[1:]]:
+            if message_id in sent_at:
+                delays.append((now - sent_at.pop(message_id)) * 1000)
+
+    socketio.server._send_eio_packet = send
+    now = datetime.utcnow()
+    interval = 1 / rate
+    cpu_started = time.process_time()
+    with app.app_context():
+        started = time.perf_counter()
+        for i in range(int(rate * seconds)):
+            # Pace the sender like clients arriving at a steady rate
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sent_at[i] = time.perf_counter()
+            broadcast('new_message', {'id': i, 'content': f'message {i}', 'user_id': 1 + i % 25, 'username': 'user',
+                                      'room_id': 1, 'message_type': 'text', 'timestamp': now.isoformat()}, ROOM)
+            broadcast('stop_typing', {'user_id': 1 + i % 25, 'username': 'user', 'room_id': 1}, ROOM)
+        time.sleep(0.2)  # Let the last tick flush
+    cpu = time.process_time() - cpu_started
+
+    for i in range(recipients):
+        manager.disconnect(manager.sid_from_eio_sid(f'eio{i}', '/'), '/')
+    delays.sort()
+    return {
+        'frames_per_second': observed['frames'] / seconds,
+        'bytes_per_second': observed['bytes'] / seconds,
+        'cpu_us_per_message': cpu / (rate * seconds) * 1e6,
+        'p50_ms': statistics.median(delays) if delays else 0,
+        'p99_ms': delays[int(len(delays) * 0.99) - 1] if delays else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare immediate and per-tick batched room broadcasts')
+    parser.add_argument('--rate', type=int, default=200, help='Messages per second sent to the room')
+    parser.add_argument('--seconds', type=float, default=3, help='Duration of each run')
+    parser.add_argument('--recipients', type=int, default=50, help='Connections in the room')
+    parser.add_argument('--tick-ms', type=int, default=40, help='Batching tick')
+    args = parser.parse_args()
+
+    # A throwaway SQLite database so the benchmark never touches real data
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-batching-'), 'bench.db')}"
+    from app import create_app, socketio
+    from app.batching import RoomBatcher
+    app = create_app()
+
+    print(f"{args.rate} messages/s to {args.recipients} recipients for {args.seconds}s")
+    print(f"{'Mode':<22}{'Frames/s':>10}{'KB/s':>9}{'CPU us/msg':>12}{'Added p50':>11}{'p99 ms':>9}")
+    print("-" * 73)
+    for label, batcher in (('immediate', None),
+                           (f'batched ({args.tick_ms} ms)', RoomBatcher(20, args.tick_ms / 1000))):
+        result = run(app, socketio, batcher, args.rate, args.seconds, args.recipients)
+        print(f"{label:<22}{result['frames_per_second']:>10.0f}{result['bytes_per_second'] / 1024:>9.1f}"
+              f"{result['cpu_us_per_message']:>12.0f}{result['p50_ms']:>11.1f}{result['p99_ms']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Compression Benchmark
+Bandwidth and CPU trade-offs of the response compression in app/compression.py:
+static assets and a room history response at each encoding, and WebSocket
+permessage-deflate (context takeover, as browsers negotiate it) over a stream
+of chat frames at several size thresholds
+
+Usage: python bench_compression.py [--frames 2000] [--repeat 20]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+import zlib
+from datetime import datetime, timedelta
+from app.compression import brotli, GZIP_LEVEL, BROTLI_QUALITY
+
+BROTLI_MAX_QUALITY = 11  # Only affordable offline; shown for comparison
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def sample_history(count=50):
+    """JSON body shaped like GET /api/messages/<room_id>"""
+    started = datetime.utcnow() - timedelta(hours=2)
+    messages = []
+    for i in range(count):
+        timestamp = started + timedelta(seconds=37 * i)
+        messages.append({
+            'id': 5000 + i, 'content': f'Message {i}: see you at the station at {i % 12 + 1} pm?',
+            'user_id': 1 + i % 6, 'username': f'user{i % 6}', 'display_name': f'User {i % 6}',
+            'profile_picture': f'/uploads/profiles/user{i % 6}.jpg', 'room_id': 3, 'room_name': 'general',
+            'message_type': 'text', 'file_name': None, 'media_info': None, 'attachment': None,
+            'timestamp': timestamp.isoformat(), 'formatted_time': timestamp.strftime('%I:%M %p'),
+            'formatted_date': timestamp.strftime('%B %d, %Y'),
+        })
+    return json.dumps({'messages': messages, 'has_more': True}).encode()
+
+
+def time_us(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - started) / repeat * 1e6
+
+
+def http_rows(repeat):
+    bodies = [(name, open(os.path.join(ROOT_DIR, 'static', name), 'rb').read())
+              for name in ('js/chat.js', 'css/style.css')]
+    bodies.append(('/api/messages (50)', sample_history()))
+    encoders = [('gzip', lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0))]
+    if brotli is not None:
+        encoders.append((f'br q{BROTLI_QUALITY}', lambda data: brotli.compress(data, quality=BROTLI_QUALITY)))
+        encoders.append((f'br q{BROTLI_MAX_QUALITY}', lambda data: brotli.compress(data, quality=BROTLI_MAX_QUALITY)))
+
+    print(f"{'Body':<22}{'Encoding':<10}{'Bytes':>9}{'Ratio':>8}{'Compress us':>13}")
+    print("-" * 62)
+    for name, data in bodies:
+        print(f"{name:<22}{'identity':<10}{len(data):>9}{'':>8}{'':>13}")
+        for label, encode in encoders:
+            compressed, us = time_us(lambda: encode(data), 1 if label.endswith(str(BROTLI_MAX_QUALITY)) else repeat)
+            print(f"{'':<22}{label:<10}{len(compressed):>9}{len(data) / len(compressed):>7.1f}x{us:>13.0f}")
+
+
+def socket_frames(count):
+    """Engine.IO/Socket.IO text frames as a busy room sends them: messages and typing events"""
+    frames = []
+    for i in range(count):
+        if i % 3 == 0:
+            message = json.loads(sample_history(1))['messages'][0]
+            message.update(id=9000 + i, content=f'reply {i} about the meeting notes', user_id=1 + i % 6)
+            frames.append('42' + json.dumps(['new_message', message]))
+        else:
+            frames.append('42' + json.dumps(['user_typing', {'user_id': 1 + i % 6, 'username': f'user{i % 6}',
+                                                             'room_id': 3}]))
+    return [frame.encode() for frame in frames]
+
+
+def deflate_stream(frames, threshold):
+    """Bytes on the wire and CPU for one connection's outbound frames with permessage-deflate"""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    total = 0
+    started = time.process_time()
+    for frame in frames:
+        if threshold is not None and len(frame) >= threshold:
+            frame = (compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+        total += len(frame) + (2 if len(frame) <= 125 else 4)  # WebSocket frame header
+    return total, (time.process_time() - started) / len(frames) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure HTTP and WebSocket compression trade-offs')
+    parser.add_argument('--frames', type=int, default=2000, help='Socket.IO frames in the WebSocket stream')
+    parser.add_argument('--repeat', type=int, default=20, help='Timing repetitions per HTTP body')
+    args = parser.parse_args()
+
+    http_rows(args.repeat)
+    print()
+
+    frames = socket_frames(args.frames)
+    raw, _ = deflate_stream(frames, None)
+    print(f"WebSocket stream: {args.frames} frames, {raw} bytes uncompressed")
+    print(f"{'Threshold':<22}{'Bytes':>9}{'Saved':>8}{'CPU us/frame':>14}")
+    print("-" * 53)
+    for threshold in (None, 0, 128, 256, 1024):
+        total, us = deflate_stream(frames, threshold)
+        label = 'off' if threshold is None else f'{threshold} bytes'
+        print(f"{label:<22}{total:>9}{(1 - total / raw) * 100:>7.0f}%{us:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Media Offload Benchmark
+Measures worker CPU time per GB of uploaded media served, with the worker
+streaming the file itself versus handing it to a front proxy via X-Accel-Redirect
+
+Usage: python bench_media_offload.py [--size-mb 64] [--requests 16]
+
+Only the application side is measured here (the part that occupies the
+eventlet worker). To measure end to end, run gunicorn behind nginx with the
+location block from README.md and compare `ps -o time` of the worker before
+and after downloading the same files.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+
+def build_app(offload):
+    """Create the app with the given MEDIA_OFFLOAD mode against a throwaway database"""
+    os.environ['MEDIA_OFFLOAD'] = offload
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bench_media.db')}")
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+def serve_repeatedly(app, url, requests):
+    """Request url repeatedly, draining every body chunk; returns (cpu_seconds, bytes_sent)"""
+    client = app.test_client()
+    sent = 0
+    start = time.process_time()
+    for _ in range(requests):
+        response = client.get(url, buffered=False)
+        for chunk in response.response:
+            sent += len(chunk)
+        response.close()
+    return time.process_time() - start, sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare worker CPU per GB for media offload modes')
+    parser.add_argument('--size-mb', type=int, default=64, help='Size of the test file in MB')
+    parser.add_argument('--requests', type=int, default=16, help='Downloads per mode')
+    args = parser.parse_args()
+
+    from app.routes.uploads import ATTACHMENTS_FOLDER
+    filename = f"bench_{os.getpid()}.mp4"
+    file_path = os.path.join(ATTACHMENTS_FOLDER, filename)
+    os.makedirs(ATTACHMENTS_FOLDER, exist_ok=True)
+    with open(file_path, 'wb') as f:
+        f.write(os.urandom(args.size_mb * 1024 * 1024))
+
+    url = f"/uploads/attachments/{filename}"
+    served_gb = args.size_mb * args.requests / 1024
+
+    try:
+        print(f"Serving {args.size_mb} MB x {args.requests} requests ({served_gb:.2f} GB) per mode")
+        print("-" * 60)
+        results = {}
+        for offload in ('', 'x-accel'):
+            app = build_app(offload)
+            cpu, sent = serve_repeatedly(app, url, args.requests)
+            label = offload or 'direct'
+            results[label] = cpu / served_gb
+            print(f"{label:<10} worker CPU {cpu:8.3f}s  body bytes {sent:>12}  "
+                  f"CPU/GB {results[label]:.4f}s")
+        print("-" * 60)
+        saved = results['direct'] - results['x-accel']
+        print(f"Offload saves {saved:.4f}s of worker CPU per GB served")
+    finally:
+        os.remove(file_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Message Partitioning Benchmark (PostgreSQL)
+Seeds the same synthetic history into a plain table and a monthly partitioned
+table in scratch schemas, then compares room history query latency, the
+partitions each query touches, and index sizes
+
+Usage: DATABASE_URL=postgresql://... python bench_partitions.py [--messages 2000000] [--months 24]
+       [--rooms 500] [--queries 500] [--keep]
+
+Only the bench_plain and bench_partitioned schemas are written; they are
+dropped afterwards unless --keep is given.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+from app.partitions import month_start, add_months
+
+HISTORY_LIMIT = 50
+
+
+def seed(conn, messages, months, rooms):
+    """Create both schemas and fill them with identical rows spread evenly over the last months"""
+    start = add_months(month_start(datetime.utcnow()), -(months - 1))
+    end = datetime.utcnow()
+    conn.execute(text("DROP SCHEMA IF EXISTS bench_plain CASCADE"))
+    conn.execute(text("DROP SCHEMA IF EXISTS bench_partitioned CASCADE"))
+    conn.execute(text("CREATE SCHEMA bench_plain"))
+    conn.execute(text("CREATE SCHEMA bench_partitioned"))
+
+    columns = ('id BIGINT NOT NULL, content TEXT NOT NULL, user_id INTEGER NOT NULL, room_id INTEGER NOT NULL, '
+               'message_type VARCHAR(20) NOT NULL, "timestamp" TIMESTAMP NOT NULL')
+    conn.execute(text(f"CREATE TABLE bench_plain.messages ({columns}, PRIMARY KEY (id))"))
+    conn.execute(text(
+        f'CREATE TABLE bench_partitioned.messages ({columns}, PRIMARY KEY (id, "timestamp")) '
+        'PARTITION BY RANGE ("timestamp")'
+    ))
+    month = start
+    while month <= month_start(end):
+        conn.execute(text(
+            f"CREATE TABLE bench_partitioned.messages_y{month:%Y}m{month:%m} PARTITION OF bench_partitioned.messages "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+        ))
+        month = add_months(month, 1)
+
+    conn.execute(text(
+        "INSERT INTO bench_plain.messages "
+        "SELECT g, 'message ' || g, 1 + g % 1000, 1 + (g::bigint * 7919) % :rooms, 'text', "
+        "       :start + (g::float8 / :messages) * (:end - :start) "
+        "FROM generate_series(1, :messages) AS g"
+    ), {'rooms': rooms, 'messages': messages, 'start': start, 'end': end})
+    conn.execute(text("INSERT INTO bench_partitioned.messages SELECT * FROM bench_plain.messages"))
+    for schema in ('bench_plain', 'bench_partitioned'):
+        conn.execute(text(f'CREATE INDEX ON {schema}.messages (room_id, "timestamp")'))
+        conn.execute(text(f"ANALYZE {schema}.messages"))
+
+
+def history_query(schema, recent_days):
+    """Room history as get_messages issues it: newest first, optionally bounded to a recent window"""
+    window = 'AND "timestamp" >= :cutoff ' if recent_days else ''
+    return text(
+        f"SELECT id, content, user_id, message_type, \"timestamp\" FROM {schema}.messages "
+        f"WHERE room_id = :room {window}ORDER BY \"timestamp\" DESC LIMIT {HISTORY_LIMIT}"
+    )
+
+
+def time_queries(conn, query, rooms, queries, recent_days):
+    """Return sorted latencies in ms for random rooms"""
+    cutoff = datetime.utcnow() - timedelta(days=recent_days or 0)
+    latencies = []
+    for _ in range(queries):
+        params = {'room': random.randint(1, rooms), 'cutoff': cutoff}
+        started = time.perf_counter()
+        conn.execute(query, params).all()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return sorted(latencies)
+
+
+def partitions_scanned(conn, query, recent_days):
+    """Count the relations a plan reads (pruned partitions do not appear)"""
+    cutoff = datetime.utcnow() - timedelta(days=recent_days or 0)
+    plan = conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {query.text}"), {'room': 1, 'cutoff': cutoff}).scalar()
+    relations = set()
+
+    def walk(node):
+        if node.get('Actual Loops', 1) and 'Relation Name' in node:
+            relations.add(node['Relation Name'])
+        for child in node.get('Plans', []):
+            walk(child)
+
+    walk(plan[0]['Plan'])
+    return len(relations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare history latency on plain vs monthly partitioned messages')
+    parser.add_argument('--messages', type=int, default=2000000, help='Rows to seed')
+    parser.add_argument('--months', type=int, default=24, help='Months of history the rows span')
+    parser.add_argument('--rooms', type=int, default=500, help='Rooms the rows are spread over')
+    parser.add_argument('--queries', type=int, default=500, help='History queries timed per variant')
+    parser.add_argument('--recent-days', type=int, default=31, help='Window get_messages searches first')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch schemas afterwards')
+    args = parser.parse_args()
+
+    url = os.environ.get('DATABASE_URL', '')
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    if not url.startswith('postgresql'):
+        print("✗ Set DATABASE_URL to a PostgreSQL database")
+        sys.exit(1)
+    engine = create_engine(url)
+
+    print(f"Seeding {args.messages} messages over {args.months} months in {args.rooms} rooms...")
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        seed(conn, args.messages, args.months, args.rooms)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+    print()
+
+    try:
+        with engine.connect() as conn:
+            print(f"{'Table':<20}{'Query':<16}{'p50 ms':>9}{'p99 ms':>9}{'Relations read':>16}")
+            print("-" * 70)
+            for schema in ('bench_plain', 'bench_partitioned'):
+                for label, recent_days in (('latest 50', None), (f'last {args.recent_days} days', args.recent_days)):
+                    query = history_query(schema, recent_days)
+                    time_queries(conn, query, args.rooms, 20, recent_days)  # Warm the cache
+                    latencies = time_queries(conn, query, args.rooms, args.queries, recent_days)
+                    p99 = latencies[int(len(latencies) * 0.99) - 1]
+                    print(f"{schema.split('_')[1]:<20}{label:<16}{statistics.median(latencies):>9.2f}{p99:>9.2f}"
+                          f"{partitions_scanned(conn, query, recent_days):>16}")
+            print()
+            for schema in ('bench_plain', 'bench_partitioned'):
+                size = conn.execute(text(
+                    "SELECT pg_size_pretty(SUM(pg_indexes_size(c.oid))) FROM pg_class c "
+                    "JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = :schema AND c.relkind = 'r'"
+                ), {'schema': schema}).scalar()
+                print(f"{schema:<20} index size {size} (a month's partition index is what recent traffic touches)")
+    finally:
+        if not args.keep:
+            with engine.begin() as conn:
+                conn.execute(text("DROP SCHEMA IF EXISTS bench_plain CASCADE"))
+                conn.execute(text("DROP SCHEMA IF EXISTS bench_partitioned CASCADE"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+SQLite Write Concurrency Benchmark
+Compares message inserts (one commit per message, like chat sends) from several
+threads while others read room history, under each SQLITE_PROFILE
+
+Usage: python bench_sqlite_writes.py [--writers 8] [--readers 4] [--messages 200]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+
+def build_app(profile, db_path):
+    """Create the app on a fresh SQLite file with the given profile"""
+    os.environ['SQLITE_PROFILE'] = profile
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+    from app import create_app
+    from app.models import db, User, Room
+    app = create_app()
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('bench-password')
+        db.session.add(user)
+        db.session.commit()
+        room = Room(name='bench', created_by=user.id)
+        db.session.add(room)
+        db.session.commit()
+        return app, user.id, room.id
+
+
+def run_profile(profile, writers, readers, messages):
+    """Return (seconds, commit latencies in ms, errors, reads) for one profile"""
+    from app.models import db, Message
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bench-sqlite-'), 'bench.db')
+    app, user_id, room_id = build_app(profile, db_path)
+    latencies = []
+    errors = []
+    reads = [0]
+    stop = threading.Event()
+    lock = threading.Lock()
+
+    def write():
+        with app.app_context():
+            for i in range(messages):
+                start = time.perf_counter()
+                try:
+                    db.session.add(Message(content=f"message {i}", user_id=user_id, room_id=room_id))
+                    db.session.commit()
+                    with lock:
+                        latencies.append((time.perf_counter() - start) * 1000)
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        errors.append(str(e).splitlines()[0])
+            db.session.remove()
+
+    def read():
+        with app.app_context():
+            while not stop.is_set():
+                Message.query.filter_by(room_id=room_id).order_by(Message.timestamp.desc()).limit(50).all()
+                db.session.commit()
+                with lock:
+                    reads[0] += 1
+            db.session.remove()
+
+    reader_threads = [threading.Thread(target=read) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=write) for _ in range(writers)]
+    for thread in reader_threads:
+        thread.start()
+    started = time.perf_counter()
+    for thread in writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in reader_threads:
+        thread.join()
+
+    with app.app_context():
+        db.engine.dispose()
+    return elapsed, latencies, errors, reads[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare SQLite write concurrency per SQLITE_PROFILE')
+    parser.add_argument('--writers', type=int, default=8, help='Threads inserting messages')
+    parser.add_argument('--readers', type=int, default=4, help='Threads reading room history meanwhile')
+    parser.add_argument('--messages', type=int, default=200, help='Messages per writer')
+    args = parser.parse_args()
+
+    total = args.writers * args.messages
+    print(f"{args.writers} writers x {args.messages} messages, {args.readers} concurrent history readers")
+    print("-" * 78)
+    for profile in ('default', 'wal'):
+        elapsed, latencies, errors, reads = run_profile(profile, args.writers, args.readers, args.messages)
+        latencies.sort()
+        p50 = statistics.median(latencies) if latencies else 0
+        p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+        print(f"{profile:<8} {len(latencies) / elapsed:8.0f} commits/s  p50 {p50:6.1f} ms  p99 {p99:7.1f} ms  "
+              f"errors {len(errors):>4}/{total}  reads {reads}")
+        if errors:
+            print(f"         first error: {errors[0]}")
+
+
+if __name__ == '__main__':
+    main()
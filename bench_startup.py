@@ -0,0 +1,107 @@
+"""
+Startup Benchmark
+Measures a cold start the way a free-tier host sees it: a fresh interpreter
+importing the package, building the app once and serving its first request.
+Also breaks import time down by package using `python -X importtime`.
+
+Usage: python bench_startup.py [--runs 5] [--top 12] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in a fresh interpreter per sample
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+response = application.test_client().get('/auth/login')
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'status': response.status_code,
+}))
+"""
+
+
+def run_probe(env, importtime=False):
+    """Return (probe timings, process wall time in ms, stderr) for one fresh interpreter"""
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', PROBE]
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT_DIR, env=env, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{result.stderr}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    return timings, wall_ms, result.stderr
+
+
+def import_breakdown(stderr):
+    """Sum -X importtime self times (ms) per top-level package"""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line.replace('import time:', '').split('|')
+        package = name.strip().split('.')[0]
+        totals[package] = totals.get(package, 0) + int(self_us) / 1000
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import, app build and time to first request')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to time (median reported)')
+    parser.add_argument('--top', type=int, default=12, help='Packages to show in the import breakdown')
+    parser.add_argument('--json', action='store_true', help='Print one JSON line for tracking over time')
+    args = parser.parse_args()
+
+    # A throwaway SQLite database so the benchmark never touches real data
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-startup-'), 'bench.db')}")
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+    # Warm-up: creates the schema and byte-compiles modules, as a deployed host would have
+    run_probe(env)
+
+    samples = [run_probe(env) for _ in range(args.runs)]
+    _, _, stderr = run_probe(env, importtime=True)
+
+    result = {
+        'runs': args.runs,
+        'import_ms': statistics.median(timings['import_ms'] for timings, _, _ in samples),
+        'create_app_ms': statistics.median(timings['create_app_ms'] for timings, _, _ in samples),
+        'first_request_ms': statistics.median(timings['first_request_ms'] for timings, _, _ in samples),
+        'process_ms': statistics.median(wall_ms for _, wall_ms, _ in samples),
+    }
+
+    if args.json:
+        print(json.dumps({key: round(value, 1) for key, value in result.items()}))
+        return
+
+    print(f"Median of {args.runs} fresh interpreters")
+    print("-" * 50)
+    print(f"import app              {result['import_ms']:8.1f} ms")
+    print(f"create_app()            {result['create_app_ms']:8.1f} ms")
+    print(f"first request           {result['first_request_ms']:8.1f} ms")
+    print(f"process start to exit   {result['process_ms']:8.1f} ms")
+    print()
+    print("Import time by package (python -X importtime, self time)")
+    print("-" * 50)
+    for package, ms in import_breakdown(stderr)[:args.top]:
+        print(f"{package:<24}{ms:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Socket.IO Wire Format Benchmark
+Compares JSON and the compact MessagePack frames (see app/wire.py) for the
+hot events: bytes and WebSocket frames per recipient, and server CPU to
+broadcast one event to a room, measured on a real Socket.IO server whose
+transport only encodes the engine.io packets it would send
+
+Usage: python bench_wire.py [--recipients 100] [--broadcasts 2000] [--members 20]
+"""
+
+import argparse
+import time
+from datetime import datetime
+import socketio
+from app.wire import msgpack, encode
+
+ROOM = 'room_1'
+
+
+def sample_payloads(members):
+    """Payloads shaped like Message.to_dict() and User.to_dict() output"""
+    now = datetime.utcnow()
+    user = {
+        'id': 42,
+        'username': 'ananya.k',
+        'display_name': 'Ananya Krishnan',
+        'profile_picture': '/uploads/profiles/3f/2a/3f2a9c1e7b.jpg',
+        'is_online': True,
+        'last_seen': now.isoformat(),
+    }
+    message = {
+        'id': 1048576,
+        'content': 'Running ten minutes late, start without me',
+        'user_id': user['id'],
+        'username': user['username'],
+        'display_name': user['display_name'],
+        'profile_picture': user['profile_picture'],
+        'room_id': 1,
+        'room_name': 'general',
+        'message_type': 'text',
+        'file_name': None,
+        'media_info': None,
+        'attachment': None,
+        'timestamp': now.isoformat(),
+        'formatted_time': now.strftime('%I:%M %p'),
+        'formatted_date': now.strftime('%B %d, %Y'),
+    }
+    return {
+        'new_message': message,
+        'room_members_update': {'room_id': 1, 'members': [dict(user, id=user['id'] + i) for i in range(members)]},
+        'user_typing': {'user_id': user['id'], 'username': user['username'], 'room_id': 1},
+    }
+
+
+def frame_sizes(server, event, payload):
+    """Return (bytes, websocket frames) one recipient receives for an event"""
+    encoded = server.packet_class(socketio.packet.EVENT, namespace='/', data=[event, payload]).encode()
+    frames = encoded if isinstance(encoded, list) else [encoded]
+    return sum(len(frame.encode() if isinstance(frame, str) else frame) for frame in frames), len(frames)
+
+
+def make_server(recipients):
+    """A Socket.IO server with recipients fake connections in ROOM; returns (server, bytes counter)"""
+    server = socketio.Server(async_mode='threading')
+    server.manager.initialize()
+    sent = {'bytes': 0}
+
+    def send(eio_sid, pkt):
+        # What the engine.io socket does before writing to the WebSocket
+        data = pkt.encode()
+        sent['bytes'] += len(data.encode() if isinstance(data, str) else data)
+
+    server._send_eio_packet = send
+    for i in range(recipients):
+        sid = server.manager.connect(f'eio{i}', '/')
+        server.manager.enter_room(sid, '/', ROOM)
+    return server, sent
+
+
+def cpu_per_broadcast(server, event, payload, wire, broadcasts):
+    """Median process CPU time in microseconds to encode and fan out one broadcast"""
+    samples = []
+    for _ in range(broadcasts):
+        started = time.process_time_ns()
+        data = encode(event, payload) if wire == 'msgpack' else payload
+        server.emit(event, data, room=ROOM)
+        samples.append((time.process_time_ns() - started) / 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare JSON and MessagePack Socket.IO frames')
+    parser.add_argument('--recipients', type=int, default=100, help='Connections in the room')
+    parser.add_argument('--broadcasts', type=int, default=2000, help='Broadcasts timed per event and format')
+    parser.add_argument('--members', type=int, default=20, help='Members listed in room_members_update')
+    args = parser.parse_args()
+
+    if msgpack is None:
+        print("✗ msgpack is not installed (pip install -r requirements.txt)")
+        return
+
+    server, sent = make_server(args.recipients)
+    payloads = sample_payloads(args.members)
+
+    print(f"{args.recipients} recipients, median of {args.broadcasts} broadcasts")
+    print(f"{'Event':<22}{'Format':<10}{'Bytes':>8}{'Frames':>8}{'Saved':>8}{'CPU us':>10}{'Room bytes':>12}")
+    print("-" * 78)
+    for event, payload in payloads.items():
+        json_bytes = None
+        for wire in ('json', 'msgpack'):
+            size, frames = frame_sizes(server, event, encode(event, payload) if wire == 'msgpack' else payload)
+            json_bytes = json_bytes or size
+            cpu_per_broadcast(server, event, payload, wire, 50)  # Warm up
+            sent['bytes'] = 0
+            cpu = cpu_per_broadcast(server, event, payload, wire, args.broadcasts)
+            room_bytes = sent['bytes'] // args.broadcasts
+            saved = f"{(1 - size / json_bytes) * 100:.0f}%" if wire == 'msgpack' else ''
+            print(f"{event:<22}{wire:<10}{size:>8}{frames:>8}{saved:>8}{cpu:>10.1f}{room_bytes:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,9 @@
 echo "Installing dependencies..."
 pip install -r requirements.txt
 
+echo "Building static assets..."
+python build_assets.py
+
 echo "Initializing database..."
 python init_db.py
 
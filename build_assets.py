@@ -0,0 +1,132 @@
+"""
+Build Static Assets
+Minifies the JavaScript and CSS under static/, writes them to static/dist/
+under content-hashed names with precompressed .gz and .br siblings, and
+records the mapping in static/dist/manifest.json. The app rewrites
+url_for('static', ...) through the manifest and serves the built files
+with a one-year immutable Cache-Control (see app/assets.py).
+
+Usage: python build_assets.py [--no-minify] [--clean]
+
+Run it in the deploy build step, after `pip install -r requirements.txt`.
+Files from the previous build are kept so pages rendered before a deploy
+can still load their assets; --clean removes them.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+from app.assets import DIST_DIR, MANIFEST_NAME, ASSET_PATTERNS, content_hash, source_files
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT_DIR, 'static')
+GZIP_LEVEL = 9  # Compressed once per build, so the slowest settings are affordable
+BROTLI_QUALITY = 11
+
+
+def minify(name, source):
+    """Minified bytes of a .js or .css file (unchanged if the minifier is not installed)"""
+    text = source.decode('utf-8')
+    if name.endswith('.js') and rjsmin is not None:
+        text = rjsmin.jsmin(text)
+    elif name.endswith('.css') and rcssmin is not None:
+        text = rcssmin.cssmin(text)
+    return text.encode('utf-8')
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_manifest(dist_dir):
+    try:
+        with open(os.path.join(dist_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def remove_stale(dist_dir, keep):
+    """Delete built files (and their .gz/.br) not in keep; returns how many were removed"""
+    removed = 0
+    for directory, _, files in os.walk(dist_dir):
+        for name in files:
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, STATIC_DIR).replace(os.sep, '/')
+            built = relative[:-3] if relative.endswith(('.gz', '.br')) else relative
+            if name != MANIFEST_NAME and built not in keep:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Minify, fingerprint and precompress static assets')
+    parser.add_argument('--no-minify', action='store_true', help='Fingerprint and compress the sources as they are')
+    parser.add_argument('--clean', action='store_true', help='Also remove the previous build')
+    args = parser.parse_args()
+
+    if not args.no_minify and (rjsmin is None or rcssmin is None):
+        print("Warning: rjsmin/rcssmin not installed, assets are not minified (pip install -r requirements.txt)")
+    if brotli is None:
+        print("Warning: Brotli not installed, skipping .br files")
+
+    dist_dir = os.path.join(STATIC_DIR, DIST_DIR)
+    previous = read_manifest(dist_dir)
+    manifest = {}
+
+    print(f"{'Asset':<28}{'Source':>9}{'Minified':>10}{'gzip':>8}{'br':>8}  Built as")
+    print("-" * 100)
+    for name in source_files(STATIC_DIR):
+        with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+            source = f.read()
+        data = source if args.no_minify else minify(name, source)
+        stem, ext = os.path.splitext(name)
+        built = f"{DIST_DIR}/{stem}.{content_hash(data)}{ext}"
+        path = os.path.join(STATIC_DIR, built)
+
+        compressed = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+        write_file(path, data)
+        write_file(path + '.gz', compressed)
+        br_size = ''
+        if brotli is not None:
+            br = brotli.compress(data, quality=BROTLI_QUALITY)
+            write_file(path + '.br', br)
+            br_size = len(br)
+        manifest[name] = {'file': built, 'source_hash': content_hash(source)}
+        print(f"{name:<28}{len(source):>9}{len(data):>10}{len(compressed):>8}{br_size:>8}  {built}")
+
+    if not manifest:
+        print(f"✗ No assets matching {', '.join(ASSET_PATTERNS)} under static/")
+        sys.exit(1)
+
+    keep = {entry['file'] for entry in manifest.values()}
+    if not args.clean:
+        keep |= {entry['file'] for entry in previous.values() if isinstance(entry, dict)}
+    removed = remove_stale(dist_dir, keep)
+    write_file(os.path.join(dist_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    print()
+    print(f"✓ Built {len(manifest)} assets into static/{DIST_DIR}/ ({removed} stale files removed)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Delete orphaned uploads
+Removes uploaded files that no message, profile picture or derivative refers to
+and that are older than the grace period, then reports the space reclaimed
+
+Usage: python gc_uploads.py [--dry-run] [--grace-hours 24] [--batch-size 500]
+
+The running server also does this in the background every UPLOAD_GC_INTERVAL
+seconds; this script is for cron jobs and one-off cleanups.
+"""
+
+import argparse
+from app import create_app
+from app.upload_gc import sweep_orphaned_uploads
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete uploads nothing refers to any more')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+    parser.add_argument('--grace-hours', type=float, default=24, help='Keep files younger than this')
+    parser.add_argument('--batch-size', type=int, default=500, help='Files deleted per batch')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        stats = sweep_orphaned_uploads(
+            grace_period=int(args.grace_hours * 3600),
+            batch_size=args.batch_size,
+            dry_run=args.dry_run
+        )
+
+    action = 'Would delete' if args.dry_run else 'Deleted'
+    print(f"Scanned {stats['scanned']} files against {stats['referenced']} references in {stats['seconds']}s")
+    print(f"{action} {stats['deleted']} orphaned files, "
+          f"reclaiming {stats['reclaimed_bytes'] / (1024 * 1024):.2f} MB")
+    if stats['kept']:
+        print(f"Kept {stats['kept']} files that were re-uploaded or sent during the sweep")
+    if stats['errors']:
+        print(f"⚠ {stats['errors']} files could not be deleted")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,133 +1,62 @@
 """
 Initialize database tables and run migrations
 Run this after deployment or when database schema changes
+
+Usage: python init_db.py [--status]
 """
 
-from app import create_app
-from app.models import db
+import argparse
 import os
+import sys
 
-def column_exists(conn, table_name, column_name):
-    """Check if a column exists in a table (works for both SQLite and PostgreSQL)"""
-    from sqlalchemy import text
-    database_url = os.environ.get('DATABASE_URL', '')
-    
-    if 'postgresql' in database_url or 'postgres' in database_url:
-        # PostgreSQL
-        result = conn.execute(text(f"""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = '{table_name}' AND column_name = '{column_name}'
-        """))
-        return result.fetchone() is not None
-    else:
-        # SQLite
-        result = conn.execute(text(f"PRAGMA table_info({table_name})"))
-        columns = result.fetchall()
-        return any(col[1] == column_name for col in columns)
+# Migrations run here, explicitly - keep create_app from also applying them
+os.environ['AUTO_MIGRATE'] = '0'
 
-def table_exists(conn, table_name):
-    """Check if a table exists (works for both SQLite and PostgreSQL)"""
-    from sqlalchemy import text
-    database_url = os.environ.get('DATABASE_URL', '')
-    
-    if 'postgresql' in database_url or 'postgres' in database_url:
-        # PostgreSQL
-        result = conn.execute(text(f"""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = '{table_name}'
-            )
-        """))
-        return result.fetchone()[0]
-    else:
-        # SQLite
-        result = conn.execute(text(f"""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name='{table_name}'
-        """))
-        return result.fetchone() is not None
+from app import create_app
+from app.models import db
+from app.migrations import SCHEMA_VERSION, MIGRATIONS, get_schema_version, upgrade
 
-def init_database():
-    """Initialize database tables"""
+
+def init_database(status_only=False):
+    """Create the schema or apply pending migrations; returns False on failure"""
     app = create_app()
-    
+
     with app.app_context():
+        current = get_schema_version(db.engine)
         print("=" * 50)
-        print("Initializing database...")
+        print(f"Database schema version: {current if current is not None else 'unversioned'} "
+              f"(latest: {SCHEMA_VERSION})")
         print("=" * 50)
-        
-        # Create all tables
-        print("Creating database tables...")
-        try:
-            db.create_all()
-            print("✓ Database tables created successfully!")
-        except Exception as e:
-            print(f"✗ Error creating tables: {e}")
-            import traceback
-            traceback.print_exc()
-            return
-        
-        # Run migrations if needed
-        print("\nChecking for required columns...")
-        from sqlalchemy import text
-        
+
+        if status_only:
+            for version, description, _ in MIGRATIONS:
+                state = 'applied' if current is not None and version <= current else 'pending'
+                print(f"  {version:>3}  {state:<8} {description}")
+            return True
+
         try:
-            with db.engine.connect() as conn:
-                # Check and add file_name column to messages table
-                if table_exists(conn, 'messages'):
-                    if not column_exists(conn, 'messages', 'file_name'):
-                        print("Adding file_name column to messages table...")
-                        try:
-                            conn.execute(text("ALTER TABLE messages ADD COLUMN file_name VARCHAR(255)"))
-                            conn.commit()
-                            print("✓ file_name column added!")
-                        except Exception as e:
-                            conn.rollback()
-                            print(f"⚠ Could not add file_name column (may already exist): {e}")
-                    else:
-                        print("✓ file_name column already exists in messages table")
-                else:
-                    print("⚠ messages table does not exist yet")
-                
-                # Check and add profile_picture column to users table
-                if table_exists(conn, 'users'):
-                    if not column_exists(conn, 'users', 'profile_picture'):
-                        print("Adding profile_picture column to users table...")
-                        try:
-                            conn.execute(text("ALTER TABLE users ADD COLUMN profile_picture VARCHAR(255)"))
-                            conn.commit()
-                            print("✓ profile_picture column added!")
-                        except Exception as e:
-                            conn.rollback()
-                            print(f"⚠ Could not add profile_picture column (may already exist): {e}")
-                    else:
-                        print("✓ profile_picture column already exists in users table")
-                    
-                    # Check and add display_name column to users table
-                    if not column_exists(conn, 'users', 'display_name'):
-                        print("Adding display_name column to users table...")
-                        try:
-                            conn.execute(text("ALTER TABLE users ADD COLUMN display_name VARCHAR(100)"))
-                            conn.commit()
-                            print("✓ display_name column added!")
-                        except Exception as e:
-                            conn.rollback()
-                            print(f"⚠ Could not add display_name column (may already exist): {e}")
-                    else:
-                        print("✓ display_name column already exists in users table")
-                else:
-                    print("⚠ users table does not exist yet")
-                    
+            applied = upgrade(db.engine)
         except Exception as e:
-            print(f"⚠ Migration check error: {e}")
+            print(f"✗ Migration failed: {e}")
             import traceback
             traceback.print_exc()
-        
+            return False
+
+        if not applied:
+            print("✓ Database is up to date")
         print("\n" + "=" * 50)
         print("Database initialization complete!")
         print("=" * 50)
+        return True
 
-if __name__ == '__main__':
-    init_database()
 
+def main():
+    parser = argparse.ArgumentParser(description='Create or migrate the database schema')
+    parser.add_argument('--status', action='store_true', help='Show the schema version and pending migrations only')
+    args = parser.parse_args()
+    if not init_database(status_only=args.status):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
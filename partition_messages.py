@@ -0,0 +1,80 @@
+"""
+Partition the messages table by month (PostgreSQL)
+Converts an existing messages table into monthly range partitions, creates
+upcoming months, and drops whole months for retention
+
+Usage: python partition_messages.py [--status] [--months-ahead 3] [--keep-old]
+       python partition_messages.py --drop-before 2025-01
+
+Run `python init_db.py` first. The conversion copies every message in one
+transaction and blocks chat while it runs; schedule it for a quiet period.
+The running server creates upcoming partitions itself (see
+PARTITION_MAINTENANCE_INTERVAL) and applies MESSAGE_RETENTION_MONTHS.
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from sqlalchemy import text
+from app import create_app
+from app.models import db
+from app.partitions import (PARTITION_MONTHS_AHEAD, partitioning_supported, is_partitioned, list_partitions,
+                            partition_messages, ensure_future_partitions, drop_partitions_before)
+
+
+def print_status(engine):
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            print("messages is a plain table (not partitioned)")
+            return
+        print(f"{'Partition':<22}{'Rows (est.)':>14}{'Size':>12}")
+        print("-" * 48)
+        for _, name in list_partitions(conn) + [(None, 'messages_default')]:
+            rows, size = conn.execute(text(
+                "SELECT reltuples::bigint, pg_size_pretty(pg_total_relation_size(oid)) FROM pg_class WHERE relname = :name"
+            ), {'name': name}).one()
+            print(f"{name:<22}{max(rows, 0):>14}{size:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Partition messages by month on PostgreSQL')
+    parser.add_argument('--status', action='store_true', help='List partitions and their sizes only')
+    parser.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD,
+                        help='Upcoming months to create partitions for')
+    parser.add_argument('--keep-old', action='store_true',
+                        help='Keep the original table as messages_unpartitioned after copying')
+    parser.add_argument('--drop-before', metavar='YYYY-MM',
+                        help='Drop every month before this one, releasing its attachments')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        engine = db.engine
+        if not partitioning_supported(engine):
+            print("✗ Partitioning needs PostgreSQL (set DATABASE_URL)")
+            sys.exit(1)
+
+        if args.status:
+            print_status(engine)
+            return
+
+        if args.drop_before:
+            cutoff = datetime.strptime(args.drop_before, '%Y-%m')
+            dropped = drop_partitions_before(engine, cutoff)
+            print(f"✓ Dropped {len(dropped)} partitions: {', '.join(dropped) or 'none'}")
+            return
+
+        started = datetime.utcnow()
+        copied = partition_messages(engine, months_ahead=args.months_ahead, keep_old=args.keep_old)
+        if copied is None:
+            with engine.begin() as conn:
+                created = ensure_future_partitions(conn, args.months_ahead)
+            print(f"✓ messages is already partitioned; created {len(created)} upcoming partitions")
+        else:
+            seconds = (datetime.utcnow() - started).total_seconds()
+            print(f"✓ Partitioned messages by month: copied {copied} rows in {seconds:.1f}s")
+        print_status(engine)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,18 @@ Main application entry point
 """
 
 from app import create_app, socketio
+from app.upload_gc import start_upload_gc
+from app.database import start_sqlite_checkpoints
+from app.partitions import start_partition_maintenance
+from app.retention import start_retention_reaper
+from app.routes.uploads import start_audio_stream_sweeper
 
 app = create_app()
+start_upload_gc(app)
+start_sqlite_checkpoints(app)
+start_partition_maintenance(app)
+start_retention_reaper(app)
+start_audio_stream_sweeper(app)
 
 if __name__ == '__main__':
     # Run the application
@@ -32,9 +32,10 @@ def initialize_database():
     try:
         from app import create_app
         from app.models import db
+        from app.migrations import upgrade
         app = create_app()
         with app.app_context():
-            db.create_all()
+            upgrade(db.engine)
             print("✓ Database initialized successfully!")
         return True
     except Exception as e:
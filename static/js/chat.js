@@ -3,8 +3,11 @@
  * Handles SocketIO, voice recording, GIF search, room management, and mobile UI
  */
 
-// Initialize SocketIO connection
-const socket = io();
+// Initialize SocketIO connection, asking for MessagePack frames when the decoder loaded
+const socket = io({ auth: { wire: window.MessagePack ? 'msgpack' : 'json' } });
+
+// Field layout of the compact MessagePack frames, sent by the server on connect
+let frameFields = {};
 
 // Application state
 let currentRoomId = null;
@@ -16,6 +19,17 @@ let mediaRecorder = null;
 let audioChunks = [];
 let recordingTimer = null;
 let recordingStartTime = null;
+let audioStream = null;  // Server-side upload that receives chunks while recording
+
+// MediaRecorder timeslice: chunks are uploaded this often while recording
+const AUDIO_CHUNK_INTERVAL = 1000;
+// Recording formats in order of preference (Safari only records mp4/AAC)
+const AUDIO_RECORDING_TYPES = ['audio/webm;codecs=opus', 'audio/webm', 'audio/mp4', 'audio/ogg;codecs=opus'];
+const AUDIO_RECORDING_EXTENSIONS = { 'audio/webm': 'webm', 'audio/mp4': 'm4a', 'audio/ogg': 'ogg' };
+
+// Unacknowledged sends are resent (with the same client_id, stored once) after this long
+const SEND_ACK_TIMEOUT = 5000;
+const SEND_ATTEMPTS = 4;
 
 // Common emojis
 const commonEmojis = [
@@ -177,13 +191,81 @@ function playNotificationSound(type = 'message') {
     }
 }
 
+// URL of a server-generated thumbnail for an uploaded image ('sm' or 'md').
+// The server falls back to the original until the thumbnail is ready.
+function thumbnailUrl(url, size) {
+    if (!url || !url.startsWith('/uploads/') || url.includes('?')) return url;
+    return `${url}?size=${size}`;
+}
+
+function formatDuration(seconds) {
+    const total = Math.max(0, Math.round(seconds || 0));
+    return `${Math.floor(total / 60)}:${String(total % 60).padStart(2, '0')}`;
+}
+
+// Waveform bars from the peaks computed server-side, so nothing is decoded in the browser
+function renderWaveform(mediaInfo) {
+    if (!mediaInfo || !Array.isArray(mediaInfo.peaks) || mediaInfo.peaks.length === 0) return '';
+    const bars = mediaInfo.peaks
+        .map(peak => `<span style="height: ${Math.max(8, Math.min(100, Number(peak) || 0))}%"></span>`)
+        .join('');
+    return `
+        <div class="audio-waveform" aria-hidden="true">${bars}</div>
+        <span class="audio-duration">${formatDuration(mediaInfo.duration)}</span>
+    `;
+}
+
+function renderAudioPlayer(content, mediaInfo) {
+    // Play the transcoded Opus file once the server has produced one
+    let audioUrl = (mediaInfo && mediaInfo.url) || content || '';
+    console.log('Audio URL before processing:', audioUrl);
+    
+    // Ensure URL is absolute if it's relative
+    if (audioUrl && !audioUrl.startsWith('http') && !audioUrl.startsWith('/')) {
+        audioUrl = '/' + audioUrl;
+    }
+    const safeAudioUrl = escapeHtml(audioUrl);
+    console.log('Audio URL after processing:', safeAudioUrl);
+    
+    // Get file extension to determine MIME type
+    const urlParts = safeAudioUrl.split('.');
+    const ext = urlParts.length > 1 ? urlParts[urlParts.length - 1].toLowerCase() : 'webm';
+    const mimeTypes = {
+        'webm': 'audio/webm',
+        'mp3': 'audio/mpeg',
+        'ogg': 'audio/ogg',
+        'wav': 'audio/wav',
+        'm4a': 'audio/mp4'
+    };
+    const mimeType = (mediaInfo && mediaInfo.mime) || mimeTypes[ext] || 'audio/webm';
+    // With the duration already known there is no need to fetch metadata for every note in the history
+    const preload = mediaInfo && mediaInfo.duration ? 'none' : 'metadata';
+    
+    return `
+        ${renderWaveform(mediaInfo)}
+        <audio 
+            controls 
+            controlsList="nodownload"
+            preload="${preload}" 
+            style="width: 100%; min-width: 300px; max-width: 500px; height: 48px; display: block;"
+            onerror="console.error('Audio load error:', this.error, this.src);"
+            onloadstart="console.log('Audio loading:', this.src);"
+            oncanplay="console.log('Audio can play:', this.src); this.style.opacity = '1';"
+            onloadedmetadata="this.style.opacity = '1';">
+            <source src="${safeAudioUrl}" type="${mimeType}">
+            <source src="${safeAudioUrl}">
+            <p>Your browser does not support audio playback. <a href="${safeAudioUrl}" download style="color: inherit; text-decoration: underline;">Download audio</a></p>
+        </audio>
+    `;
+}
+
 // Helper function to get profile picture or generate avatar
 function getUserAvatar(user, size = 'medium') {
     if (user.profile_picture) {
         const initial = (user.display_name || user.username || 'U')[0].toUpperCase();
         const color = getUserColor(user.id);
         return `
-            <img src="${escapeHtml(user.profile_picture)}" 
+            <img src="${escapeHtml(thumbnailUrl(user.profile_picture, 'sm'))}" 
                  alt="${escapeHtml(user.display_name || user.username)}" 
                  class="profile-img-${size}" 
                  onerror="this.onerror=null; this.style.display='none'; this.nextElementSibling.style.display='flex';">
@@ -243,9 +325,19 @@ function updateThemeIcon(theme) {
 }
 
 // Message Rendering
-function addMessage(messageData, isOwnMessage = false) {
+// Pass a DocumentFragment as batch to collect several messages for one DOM update (see addMessages)
+function addMessage(messageData, isOwnMessage = false, batch = null) {
     const messagesList = document.getElementById('messages-list');
     if (!messagesList) return;
+    const target = batch || messagesList;
+    
+    // Already shown (e.g. delivered live while a resync refetched the history)
+    if (messageData.id && messagesList.querySelector(`[data-message-id="${messageData.id}"]`)) {
+        return;
+    }
+    
+    // The stored copy of an own message shown optimistically replaces it in place
+    const pendingItem = messageData.id && messageData.client_id ? pendingMessageItem(messageData.client_id) : null;
     
     // Remove welcome message
     const welcomeMsg = messagesList.querySelector('.welcome-message');
@@ -254,7 +346,7 @@ function addMessage(messageData, isOwnMessage = false) {
     }
     
     // Check for date divider
-    const lastMessage = messagesList.lastElementChild;
+    const lastMessage = (batch && batch.lastElementChild) || messagesList.lastElementChild;
     let needsDateDivider = false;
     
     if (lastMessage && !lastMessage.classList.contains('message-date-divider')) {
@@ -270,18 +362,26 @@ function addMessage(messageData, isOwnMessage = false) {
         needsDateDivider = true;
     }
     
-    if (needsDateDivider) {
+    if (needsDateDivider && !pendingItem) {
         const dateDivider = document.createElement('div');
         dateDivider.className = 'message-date-divider';
         dateDivider.textContent = formatDate(messageData.timestamp);
-        messagesList.appendChild(dateDivider);
+        target.appendChild(dateDivider);
     }
     
     // Create message element
     const messageItem = document.createElement('div');
     messageItem.className = `message-item ${isOwnMessage ? 'own-message' : 'other-message'}`;
     messageItem.dataset.timestamp = messageData.timestamp;
-    messageItem.dataset.messageId = messageData.id;
+    if (messageData.id) {
+        messageItem.dataset.messageId = messageData.id;
+    }
+    if (messageData.client_id) {
+        messageItem.dataset.clientId = messageData.client_id;
+    }
+    if (messageData.pending) {
+        messageItem.classList.add('pending');
+    }
     
     const userColor = getUserColor(messageData.user_id);
     const messageType = (messageData.message_type || 'text').toLowerCase();
@@ -301,9 +401,14 @@ function addMessage(messageData, isOwnMessage = false) {
             </div>
         `;
     } else if (messageType === 'image') {
+        // Known dimensions reserve the space up front so history does not jump as images load
+        const attachment = messageData.attachment || {};
+        const imageSize = attachment.width && attachment.height
+            ? `width="${Number(attachment.width)}" height="${Number(attachment.height)}"`
+            : '';
         messageContent = `
             <div class="message-image">
-                <img src="${escapeHtml(messageData.content)}" alt="${escapeHtml(messageData.file_name || 'Image')}" loading="lazy" onclick="window.open('${escapeHtml(messageData.content)}', '_blank')">
+                <img src="${escapeHtml(thumbnailUrl(messageData.content, 'md'))}" ${imageSize} alt="${escapeHtml(messageData.file_name || 'Image')}" loading="lazy" onclick="window.open('${escapeHtml(messageData.content)}', '_blank')">
                 ${messageData.file_name ? `<div class="file-name">${escapeHtml(messageData.file_name)}</div>` : ''}
             </div>
         `;
@@ -363,46 +468,10 @@ function addMessage(messageData, isOwnMessage = false) {
             </div>
         `;
     } else if (messageType === 'audio') {
-        // Ensure URL is absolute if it's relative
-        let audioUrl = messageData.content || '';
-        console.log('Audio URL before processing:', audioUrl);
-        
-        if (audioUrl && !audioUrl.startsWith('http') && !audioUrl.startsWith('/')) {
-            audioUrl = '/' + audioUrl;
-        }
-        const safeAudioUrl = escapeHtml(audioUrl);
-        console.log('Audio URL after processing:', safeAudioUrl);
-        
-        // Get file extension to determine MIME type
-        const urlParts = safeAudioUrl.split('.');
-        const ext = urlParts.length > 1 ? urlParts[urlParts.length - 1].toLowerCase() : 'webm';
-        const mimeTypes = {
-            'webm': 'audio/webm',
-            'mp3': 'audio/mpeg',
-            'ogg': 'audio/ogg',
-            'wav': 'audio/wav',
-            'm4a': 'audio/mp4'
-        };
-        const mimeType = mimeTypes[ext] || 'audio/webm';
-        
         messageContent = `
             <div class="message-audio">
                 <div class="audio-icon">🎤</div>
-                <div class="audio-player">
-                    <audio 
-                        controls 
-                        controlsList="nodownload"
-                        preload="metadata" 
-                        style="width: 100%; min-width: 300px; max-width: 500px; height: 48px; display: block;"
-                        onerror="console.error('Audio load error:', this.error, this.src);"
-                        onloadstart="console.log('Audio loading:', this.src);"
-                        oncanplay="console.log('Audio can play:', this.src); this.style.opacity = '1';"
-                        onloadedmetadata="this.style.opacity = '1';">
-                        <source src="${safeAudioUrl}" type="${mimeType}">
-                        <source src="${safeAudioUrl}">
-                        <p>Your browser does not support audio playback. <a href="${safeAudioUrl}" download style="color: inherit; text-decoration: underline;">Download audio</a></p>
-                    </audio>
-                </div>
+                <div class="audio-player">${renderAudioPlayer(messageData.content, messageData.media_info)}</div>
             </div>
         `;
     } else {
@@ -417,8 +486,8 @@ function addMessage(messageData, isOwnMessage = false) {
         id: messageData.user_id
     }, 'small');
     
-    // Add delete button for own messages
-    const deleteButton = isOwnMessage ? `
+    // Add delete button for own messages (once stored)
+    const deleteButton = isOwnMessage && messageData.id ? `
         <button class="message-delete-btn" onclick="event.stopPropagation(); window.deleteMessage(${messageData.id}); return false;" title="Delete message">
             <svg width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
                 <polyline points="3 6 5 6 21 6"></polyline>
@@ -447,7 +516,92 @@ function addMessage(messageData, isOwnMessage = false) {
         ${isOwnMessage ? `<div class="message-avatar">${userAvatar}</div>` : ''}
     `;
     
-    messagesList.appendChild(messageItem);
+    if (pendingItem) {
+        messageItem.style.animation = 'none';
+        pendingItem.replaceWith(messageItem);
+        return;
+    }
+    target.appendChild(messageItem);
+    if (!batch) {
+        scrollToBottom();
+    }
+}
+
+// Optimistic copy of an own message not yet confirmed by the server
+function pendingMessageItem(clientId) {
+    return document.querySelector(`#messages-list [data-client-id="${CSS.escape(clientId)}"]:not([data-message-id])`);
+}
+
+function newClientId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 14)}`;
+}
+
+// Send a message and show it right away; the ack carries its stored id and timestamp.
+// Unacknowledged sends are resent with the same client_id, which the server stores once.
+function sendChatMessage(payload) {
+    const message = { ...payload, client_id: newClientId() };
+    const userName = document.querySelector('.sidebar-header .user-details h3');
+    const optimistic = {
+        ...message,
+        user_id: parseInt(document.getElementById('sidebar-user-avatar')?.dataset.userId || '0'),
+        display_name: userName ? userName.textContent.trim() : '',
+        profile_picture: document.getElementById('sidebar-profile-img')?.getAttribute('src')?.split('?')[0] || null,
+        timestamp: new Date().toISOString(),
+        pending: true
+    };
+    addMessage(optimistic, true);
+    
+    const attempt = (attemptNumber) => {
+        socket.timeout(SEND_ACK_TIMEOUT).emit('send_message', message, (err, ack) => {
+            const item = pendingMessageItem(message.client_id);
+            if (err) {
+                if (attemptNumber < SEND_ATTEMPTS) {
+                    attempt(attemptNumber + 1);
+                } else if (item) {
+                    // Still delivered if a queued resend gets through after reconnecting
+                    item.classList.replace('pending', 'failed');
+                    item.title = 'Not sent';
+                    showNotification('Message not sent. Check your connection.', 'error');
+                }
+                return;
+            }
+            if (!item) {
+                return;  // Already replaced by the broadcast, or the room was left
+            }
+            if (ack && ack.ok) {
+                addMessage({ ...optimistic, ...ack, pending: false }, true);
+            } else {
+                item.remove();  // Rejected; the server's 'error' event is shown as a notification
+            }
+        });
+    };
+    attempt(1);
+}
+
+// Render live messages with a single DOM update and scroll
+function addMessages(messages) {
+    const messagesList = document.getElementById('messages-list');
+    if (!messagesList) return;
+    const currentUserId = parseInt(document.querySelector('.sidebar-header .user-avatar')?.dataset.userId || '0');
+    const batch = document.createDocumentFragment();
+    let playSound = false;
+    
+    messages.forEach(messageData => {
+        const isOwnMessage = messageData.user_id === currentUserId;
+        // Play notification sound (once) if a message is not from current user
+        if (!isOwnMessage && messageData.room_id === currentRoomId) {
+            playSound = true;
+        }
+        addMessage(messageData, isOwnMessage, batch);
+    });
+    
+    if (playSound) {
+        playNotificationSound('message');
+    }
+    messagesList.appendChild(batch);
     scrollToBottom();
 }
 
@@ -675,15 +829,18 @@ window.joinRoomById = function(roomId, roomName) {
 async function startVoiceRecording() {
     try {
         const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-        mediaRecorder = new MediaRecorder(stream, {
-            mimeType: 'audio/webm;codecs=opus'
-        });
+        const mimeType = AUDIO_RECORDING_TYPES.find(type => MediaRecorder.isTypeSupported(type));
+        mediaRecorder = new MediaRecorder(stream, mimeType ? { mimeType } : {});
         
         audioChunks = [];
+        audioStream = await startAudioStream();
         
         mediaRecorder.ondataavailable = (event) => {
             if (event.data.size > 0) {
                 audioChunks.push(event.data);
+                if (audioStream) {
+                    queueAudioChunk(audioStream, event.data);
+                }
             }
         };
         
@@ -691,7 +848,7 @@ async function startVoiceRecording() {
             stream.getTracks().forEach(track => track.stop());
         };
         
-        mediaRecorder.start();
+        mediaRecorder.start(AUDIO_CHUNK_INTERVAL);
         recordingStartTime = Date.now();
         
         // Update UI
@@ -737,7 +894,7 @@ function stopVoiceRecording() {
         
         // Create audio blob and preview
         setTimeout(() => {
-            const audioBlob = new Blob(audioChunks, { type: 'audio/webm' });
+            const audioBlob = new Blob(audioChunks, { type: getRecordingType() });
             const audioUrl = URL.createObjectURL(audioBlob);
             
             if (voicePreview) {
@@ -753,6 +910,12 @@ function stopVoiceRecording() {
     }
 }
 
+// The format the recorder actually produced, without codec parameters
+function getRecordingType() {
+    const mimeType = ((mediaRecorder && mediaRecorder.mimeType) || 'audio/webm').split(';')[0];
+    return mimeType in AUDIO_RECORDING_EXTENSIONS ? mimeType : 'audio/webm';
+}
+
 function updateVoiceTimer() {
     if (recordingStartTime) {
         const elapsed = Math.floor((Date.now() - recordingStartTime) / 1000);
@@ -765,6 +928,72 @@ function updateVoiceTimer() {
     }
 }
 
+// Start a server-side upload so chunks can be sent while still recording.
+// Returns null if the server refuses, in which case the whole blob is uploaded on send.
+async function startAudioStream() {
+    try {
+        const response = await fetch('/upload_audio/stream', {
+            method: 'POST',
+            credentials: 'include'
+        });
+        const data = await response.json();
+        if (data.success && data.stream_id) {
+            return { id: data.stream_id, offset: 0, pending: Promise.resolve(), failed: false };
+        }
+    } catch (error) {
+        console.error('Error starting audio stream:', error);
+    }
+    return null;
+}
+
+// Chunks are uploaded one at a time, in recording order
+function queueAudioChunk(stream, chunk) {
+    stream.pending = stream.pending.then(async () => {
+        if (stream.failed) return;
+        const response = await fetch(`/upload_audio/stream/${stream.id}?offset=${stream.offset}`, {
+            method: 'PUT',
+            credentials: 'include',
+            headers: { 'Content-Type': 'application/octet-stream' },
+            body: chunk
+        });
+        if (!response.ok) {
+            stream.failed = true;
+            return;
+        }
+        const data = await response.json();
+        stream.offset = data.size;
+    }).catch((error) => {
+        console.error('Error uploading audio chunk:', error);
+        stream.failed = true;
+    });
+}
+
+// Finish the streamed upload; resolves to the upload response or null on failure
+async function finishAudioStream(stream) {
+    await stream.pending;
+    if (stream.failed) return null;
+    try {
+        const response = await fetch(`/upload_audio/stream/${stream.id}/finish`, {
+            method: 'POST',
+            credentials: 'include',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ mime_type: getRecordingType() })
+        });
+        const data = await response.json();
+        return data.success ? data : null;
+    } catch (error) {
+        console.error('Error finishing audio stream:', error);
+        return null;
+    }
+}
+
+function cancelAudioStream(stream) {
+    stream.pending.then(() => fetch(`/upload_audio/stream/${stream.id}`, {
+        method: 'DELETE',
+        credentials: 'include'
+    })).catch((error) => console.error('Error cancelling audio stream:', error));
+}
+
 async function sendVoiceMessage(audioBlob) {
     if (!currentRoomId) {
         showNotification('Please join a room first', 'error');
@@ -772,21 +1001,35 @@ async function sendVoiceMessage(audioBlob) {
     }
     
     try {
-        const formData = new FormData();
-        formData.append('audio', audioBlob, 'voice-message.webm');
-        
-        const response = await fetch('/upload_audio', {
-            method: 'POST',
-            credentials: 'include',  // Include cookies/session for authentication
-            body: formData
-        });
+        // Most of the recording is already on the server; only fall back to a
+        // full upload if streaming failed part-way
+        let data = null;
+        if (audioStream) {
+            const stream = audioStream;
+            audioStream = null;
+            data = await finishAudioStream(stream);
+            if (!data) {
+                cancelAudioStream(stream);
+            }
+        }
         
-        const data = await response.json();
+        if (!data) {
+            const formData = new FormData();
+            formData.append('audio', audioBlob, `voice-message.${AUDIO_RECORDING_EXTENSIONS[getRecordingType()]}`);
+            
+            const response = await fetch('/upload_audio', {
+                method: 'POST',
+                credentials: 'include',  // Include cookies/session for authentication
+                body: formData
+            });
+            
+            data = await response.json();
+        }
         
         if (data.success && data.url) {
             console.log('Sending audio message with URL:', data.url);
             // Send message via SocketIO
-            socket.emit('send_message', {
+            sendChatMessage({
                 content: data.url,
                 room_id: currentRoomId,
                 message_type: 'audio'
@@ -807,6 +1050,10 @@ async function sendVoiceMessage(audioBlob) {
 }
 
 function resetVoiceRecorder() {
+    if (audioStream) {
+        cancelAudioStream(audioStream);
+        audioStream = null;
+    }
     audioChunks = [];
     recordingStartTime = null;
     clearInterval(recordingTimer);
@@ -872,7 +1119,7 @@ function sendGIF(gifUrl) {
         return;
     }
     
-    socket.emit('send_message', {
+    sendChatMessage({
         content: gifUrl,
         room_id: currentRoomId,
         message_type: 'gif'
@@ -969,20 +1216,25 @@ async function uploadAndSendFile(file) {
     showUploadProgress(notificationId, file.name);
     
     try {
-        const formData = new FormData();
-        formData.append('file', file);
-        
-        const response = await fetch('/upload_attachment', {
-            method: 'POST',
-            credentials: 'include',  // Include cookies/session for authentication
-            body: formData
-        });
+        // Skip the upload entirely if the server already has this exact file
+        let data = await lookupAttachment(file);
         
-        const data = await response.json();
+        if (!data) {
+            const formData = new FormData();
+            formData.append('file', file);
+            
+            const response = await fetch('/upload_attachment', {
+                method: 'POST',
+                credentials: 'include',  // Include cookies/session for authentication
+                body: formData
+            });
+            
+            data = await response.json();
+        }
         
         if (data.success) {
             // Send message with file
-            socket.emit('send_message', {
+            sendChatMessage({
                 content: data.url,
                 room_id: currentRoomId,
                 message_type: data.file_type,
@@ -1002,6 +1254,31 @@ async function uploadAndSendFile(file) {
     }
 }
 
+// Hash a file with SHA-256 and ask the server whether it is already stored.
+// Resolves to the same shape as an /upload_attachment response, or null.
+async function lookupAttachment(file) {
+    if (!window.crypto || !window.crypto.subtle) return null;
+    try {
+        const buffer = await file.arrayBuffer();
+        const hashBuffer = await window.crypto.subtle.digest('SHA-256', buffer);
+        const sha256 = Array.from(new Uint8Array(hashBuffer))
+            .map(b => b.toString(16).padStart(2, '0'))
+            .join('');
+        
+        const response = await fetch('/upload_attachment/lookup', {
+            method: 'POST',
+            credentials: 'include',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ sha256: sha256, filename: file.name })
+        });
+        if (!response.ok) return null;
+        return await response.json();
+    } catch (error) {
+        console.error('Error looking up attachment:', error);
+        return null;
+    }
+}
+
 // Show upload progress notification
 function showUploadProgress(id, fileName) {
     const notification = document.createElement('div');
@@ -1047,6 +1324,32 @@ function getFileIcon(ext) {
 window.deleteMessage = deleteMessage;
 window.deleteRoom = deleteRoom;
 
+// Rebuild a payload object from a compact frame's values (see app/wire.py)
+function expandFrame(values, fields) {
+    const data = {};
+    fields.forEach((field, i) => {
+        if (Array.isArray(field)) {
+            data[field[0]] = (values[i] || []).map(record => expandFrame(record, field[1]));
+        } else {
+            data[field] = values[i];
+        }
+    });
+    return data;
+}
+
+// Register a handler for an event that may arrive as a compact frame
+// (MessagePack bytes, or a plain array for the smallest frames)
+function onFrame(event, handler) {
+    socket.on(event, (payload) => {
+        if (payload instanceof ArrayBuffer || ArrayBuffer.isView(payload)) {
+            payload = expandFrame(MessagePack.decode(payload), frameFields[event]);
+        } else if (Array.isArray(payload) && frameFields[event]) {
+            payload = expandFrame(payload, frameFields[event]);
+        }
+        handler(payload);
+    });
+}
+
 // SocketIO Event Handlers
 socket.on('connect', () => {
     console.log('Connected to server');
@@ -1054,6 +1357,7 @@ socket.on('connect', () => {
 
 socket.on('connected', (data) => {
     console.log('Connection confirmed:', data);
+    frameFields = data.frames || {};
 });
 
 socket.on('disconnect', () => {
@@ -1065,16 +1369,32 @@ socket.on('error', (data) => {
     showNotification(data.message || 'An error occurred', 'error');
 });
 
-socket.on('new_message', (messageData) => {
-    const currentUserId = parseInt(document.querySelector('.sidebar-header .user-avatar')?.dataset.userId || '0');
-    const isOwnMessage = messageData.user_id === currentUserId;
-    
-    // Play notification sound if message is not from current user
-    if (!isOwnMessage && messageData.room_id === currentRoomId) {
-        playNotificationSound('message');
+onFrame('new_message', (messageData) => {
+    addMessages([messageData]);
+});
+
+// A busy room's broadcasts collected over one server tick (see app/batching.py)
+socket.on('message_batch', (payload) => {
+    let events = payload;
+    if (payload instanceof ArrayBuffer || ArrayBuffer.isView(payload)) {
+        events = MessagePack.decode(payload).map(([event, values]) => [event, expandFrame(values, frameFields[event])]);
     }
     
-    addMessage(messageData, isOwnMessage);
+    // A batch also reaches the sender, so its own typing events are skipped here
+    const currentUserId = parseInt(document.querySelector('.sidebar-header .user-avatar')?.dataset.userId || '0');
+    const messages = [];
+    events.forEach(([event, data]) => {
+        if (event === 'new_message') {
+            messages.push(data);
+        } else if (event === 'user_typing' && data.user_id !== currentUserId) {
+            showTyping(data);
+        } else if (event === 'stop_typing' && data.user_id !== currentUserId) {
+            hideTyping(data);
+        }
+    });
+    if (messages.length) {
+        addMessages(messages);
+    }
 });
 
 socket.on('user_joined', (data) => {
@@ -1095,7 +1415,7 @@ socket.on('user_left', (data) => {
     }
 });
 
-socket.on('user_typing', (data) => {
+function showTyping(data) {
     const currentUserId = parseInt(document.querySelector('.sidebar-header .user-avatar')?.dataset.userId || '0');
     if (data.room_id === currentRoomId && data.user_id !== currentUserId) {
         const typingIndicator = document.getElementById('typing-indicator');
@@ -1105,22 +1425,35 @@ socket.on('user_typing', (data) => {
             typingIndicator.style.display = 'flex';
         }
     }
-});
+}
 
-socket.on('stop_typing', (data) => {
+function hideTyping(data) {
     if (data.room_id === currentRoomId) {
         const typingIndicator = document.getElementById('typing-indicator');
         if (typingIndicator) {
             typingIndicator.style.display = 'none';
         }
     }
+}
+
+onFrame('user_typing', showTyping);
+onFrame('stop_typing', hideTyping);
+
+// The server dropped events while this connection was too far behind: refetch current state
+socket.on('resync', () => {
+    hideTyping({ room_id: currentRoomId });
+    if (currentRoomId) {
+        loadMessages(currentRoomId);
+        loadRoomOnlineUsers(currentRoomId);
+    }
+    refreshRoomsList();
 });
 
 socket.on('user_status', (data) => {
     updateUserStatus(data.user_id, data.is_online);
 });
 
-socket.on('online_users', (data) => {
+onFrame('online_users', (data) => {
     // Handle both old format (array) and new format (object with room_id and users)
     if (Array.isArray(data)) {
         updateOnlineUsersList(data);
@@ -1132,7 +1465,7 @@ socket.on('online_users', (data) => {
     }
 });
 
-socket.on('room_members_update', (data) => {
+onFrame('room_members_update', (data) => {
     if (data.room_id === currentRoomId && data.members) {
         updateOnlineUsersList(data.members);
     }
@@ -1176,6 +1509,30 @@ socket.on('message_deleted', (data) => {
     }
 });
 
+socket.on('messages_expired', (data) => {
+    // The retention reaper removed messages older than the room's policy
+    data.message_ids.forEach((messageId) => {
+        const messageElement = document.querySelector(`[data-message-id="${messageId}"]`);
+        if (messageElement) messageElement.remove();
+    });
+});
+
+socket.on('message_media_ready', (data) => {
+    // A voice note finished transcoding: show its waveform and switch to the smaller file
+    const messageElement = document.querySelector(`[data-message-id="${data.message_id}"]`);
+    const player = messageElement && messageElement.querySelector('.audio-player');
+    if (!player) return;
+    const audio = player.querySelector('audio');
+    if (audio && !audio.paused) {
+        // Do not interrupt playback; only add the waveform
+        if (!player.querySelector('.audio-waveform')) {
+            audio.insertAdjacentHTML('beforebegin', renderWaveform(data.media_info));
+        }
+        return;
+    }
+    player.innerHTML = renderAudioPlayer(audio ? audio.querySelector('source').getAttribute('src') : '', data.media_info);
+});
+
 socket.on('room_deleted', (data) => {
     const roomId = data.room_id;
     const roomName = data.room_name;
@@ -1455,14 +1812,15 @@ function updateSidebarProfilePicture(userData = null) {
             
             if (user.profile_picture) {
                 if (img) {
-                    img.src = user.profile_picture + '?t=' + Date.now(); // Cache bust
+                    const avatarSrc = thumbnailUrl(user.profile_picture, 'sm');
+                    img.src = avatarSrc + (avatarSrc.includes('?') ? '&' : '?') + 't=' + Date.now(); // Cache bust
                     img.style.display = 'block';
                     if (placeholder) placeholder.style.display = 'none';
                 } else {
                     // Create img element if it doesn't exist
                     img = document.createElement('img');
                     img.id = 'sidebar-profile-img';
-                    img.src = user.profile_picture;
+                    img.src = thumbnailUrl(user.profile_picture, 'sm');
                     img.alt = user.display_name || user.username;
                     img.style.cssText = 'width: 100%; height: 100%; object-fit: cover;';
                     img.onerror = function() {
@@ -1584,7 +1942,7 @@ document.addEventListener('DOMContentLoaded', () => {
         messageForm.addEventListener('submit', (e) => {
             e.preventDefault();
             if (messageInput && messageInput.value.trim() && currentRoomId) {
-                socket.emit('send_message', {
+                sendChatMessage({
                     content: messageInput.value.trim(),
                     room_id: currentRoomId,
                     message_type: 'text'
@@ -0,0 +1,53 @@
+"""
+Test Fixtures
+An app on a throwaway SQLite database and upload directory, with two users
+(alice, bob), the 'general' room and logged-in test clients
+"""
+
+import os
+
+import pytest
+
+from app import create_app
+from app.models import db, User, Room
+from app.routes import uploads as uploads_routes
+
+
+def login(app, username):
+    """A test client logged in as username (password 'secret1')"""
+    client = app.test_client()
+    response = client.post('/auth/login', data={'username': username, 'password': 'secret1'})
+    assert response.status_code in (200, 302)
+    return client
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'chat.db'}")
+    monkeypatch.delenv('DATABASE_REPLICA_URLS', raising=False)
+    uploads_root = str(tmp_path / 'uploads')
+    # Temp files are renamed into storage, so they must live under the same root
+    monkeypatch.setattr(uploads_routes, 'UPLOADS_ROOT', uploads_root)
+    monkeypatch.setattr(uploads_routes, 'UPLOAD_FOLDER', os.path.join(uploads_root, 'audio'))
+    monkeypatch.setattr(uploads_routes, 'ATTACHMENTS_FOLDER', os.path.join(uploads_root, 'attachments'))
+    monkeypatch.setattr(uploads_routes, 'AUDIO_STREAM_FOLDER', os.path.join(uploads_root, 'audio', 'partial'))
+
+    app = create_app()
+    app.config.update(TESTING=True, UPLOADS_ROOT=uploads_root)
+    with app.app_context():
+        for username in ('alice', 'bob'):
+            user = User(username=username, email=f'{username}@example.com')
+            user.set_password('secret1')
+            db.session.add(user)
+        db.session.commit()
+        db.session.add(Room(name='general', created_by=1))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return login(app, 'alice')
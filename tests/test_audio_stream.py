@@ -0,0 +1,68 @@
+"""
+Streamed Voice Message Tests
+Recordings uploaded in chunks while recording (/upload_audio/stream): the
+recorder's format is kept, and abandoned partial recordings are swept
+"""
+
+import os
+import time
+
+from app.routes import uploads as uploads_routes
+from app.routes.uploads import cleanup_abandoned_audio_streams, AUDIO_STREAM_TIMEOUT
+
+RECORDING = b'\x00\x00\x00\x1cftypM4A recorded in safari ' * 64
+
+
+def stream_recording(client, data=RECORDING, chunk_size=500):
+    """Start a stream and upload data in chunks; return the stream id"""
+    stream_id = client.post('/upload_audio/stream').get_json()['stream_id']
+    for offset in range(0, len(data), chunk_size):
+        response = client.put(f'/upload_audio/stream/{stream_id}?offset={offset}',
+                              data=data[offset:offset + chunk_size],
+                              content_type='application/octet-stream')
+        assert response.status_code == 200
+    return stream_id
+
+
+def test_finished_stream_keeps_the_recorder_format(client):
+    stream_id = stream_recording(client)
+    response = client.post(f'/upload_audio/stream/{stream_id}/finish',
+                           json={'mime_type': 'audio/mp4;codecs=mp4a.40.2'})
+
+    assert response.status_code == 200
+    url = response.get_json()['url']
+    assert url.endswith('.m4a')
+    response = client.get(url)
+    assert response.data == RECORDING
+    assert response.mimetype == 'audio/mp4'
+
+
+def test_finished_stream_without_a_type_is_webm(client):
+    stream_id = stream_recording(client)
+    response = client.post(f'/upload_audio/stream/{stream_id}/finish')
+
+    assert response.status_code == 200
+    assert response.get_json()['url'].endswith('.webm')
+
+
+def test_finished_stream_with_unsupported_type_is_rejected(client):
+    stream_id = stream_recording(client)
+    response = client.post(f'/upload_audio/stream/{stream_id}/finish', json={'mime_type': 'video/x-matroska'})
+
+    assert response.status_code == 400
+    # The partial recording is kept so the client can fall back to a full upload
+    response = client.post(f'/upload_audio/stream/{stream_id}/finish', json={'mime_type': 'audio/webm'})
+    assert response.status_code == 200
+
+
+def test_sweep_removes_only_abandoned_recordings(client):
+    abandoned = stream_recording(client)
+    active = stream_recording(client)
+    folder = uploads_routes.AUDIO_STREAM_FOLDER
+    abandoned_path = os.path.join(folder, f'1_{abandoned}.part')
+    old = time.time() - AUDIO_STREAM_TIMEOUT - 60
+    os.utime(abandoned_path, (old, old))
+
+    assert cleanup_abandoned_audio_streams() == 1
+    assert not os.path.exists(abandoned_path)
+    assert os.path.exists(os.path.join(folder, f'1_{active}.part'))
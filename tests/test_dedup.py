@@ -0,0 +1,58 @@
+"""
+Send Deduplication Tests
+Dedup keys (message_client_ids) are deleted with their messages
+"""
+
+from datetime import datetime, timedelta
+
+from app.models import db, Message, MessageClientId, Room
+from app.retention import reap_room
+
+
+def sent_message(content, client_id, timestamp=None, user_id=1, room_id=1):
+    message = Message(content=content, user_id=user_id, room_id=room_id, client_id=client_id,
+                      timestamp=timestamp or datetime.utcnow())
+    db.session.add(message)
+    db.session.flush()
+    db.session.add(MessageClientId(user_id=user_id, client_id=client_id, message_id=message.id))
+    db.session.commit()
+    return message.id
+
+
+def test_deleting_a_message_deletes_its_key(app, client):
+    with app.app_context():
+        message_id = sent_message('hello', 'c1')
+
+    assert client.delete(f'/api/messages/{message_id}').status_code == 200
+
+    with app.app_context():
+        assert db.session.get(MessageClientId, (1, 'c1')) is None
+
+
+def test_deleting_a_room_deletes_its_keys(app, client):
+    with app.app_context():
+        room = Room(name='side', created_by=1)
+        db.session.add(room)
+        db.session.commit()
+        room_id = room.id
+        sent_message('one', 'r1', room_id=room_id)
+        sent_message('two', 'r2', room_id=room_id)
+        sent_message('elsewhere', 'g1')
+
+    assert client.delete(f'/api/rooms/{room_id}').status_code == 200
+
+    with app.app_context():
+        assert [key.client_id for key in MessageClientId.query.all()] == ['g1']
+
+
+def test_retention_deletes_reaped_keys(app):
+    with app.app_context():
+        old = datetime.utcnow() - timedelta(days=30)
+        expired = [sent_message(f'old {i}', f'old{i}', timestamp=old + timedelta(minutes=i)) for i in range(3)]
+        sent_message('new', 'new')
+
+        deleted = reap_room(1, retention_days=7)
+
+        # The sender's latest message anchors their room membership and stays
+        assert sorted(deleted) == sorted(expired)
+        assert sorted(key.client_id for key in MessageClientId.query.all()) == ['new']
@@ -0,0 +1,133 @@
+"""
+Giphy Client Tests
+Request coalescing and the circuit breaker of app/giphy.py, against a local
+stub server standing in for the Giphy API (GIPHY_API_URL)
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import giphy
+from app.giphy import GiphyUnavailable, get_gifs
+
+COOLDOWN = 0.3  # Seconds the circuit stays open in these tests
+
+
+class StubGiphy:
+    """Local HTTP server answering like the Giphy API; counts the calls it receives"""
+
+    def __init__(self):
+        self.calls = 0
+        self.delay = 0
+        self.status = 200
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub.lock:
+                    stub.calls += 1
+                time.sleep(stub.delay)
+                body = json.dumps({'data': [{
+                    'id': 'abc123',
+                    'title': 'cat',
+                    'images': {'original': {'url': 'https://media.giphy.com/media/abc123/giphy.gif'},
+                               'preview_gif': {'url': 'https://media.giphy.com/media/abc123/giphy-preview.gif'}},
+                }]}).encode() if stub.status == 200 else b'{}'
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/gifs"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = StubGiphy()
+    monkeypatch.setattr(giphy, 'GIPHY_API_URL', server.url)
+    monkeypatch.setattr(giphy, 'GIPHY_BREAKER_COOLDOWN', COOLDOWN)
+    # Fresh cache and breaker for every test
+    monkeypatch.setattr(giphy, '_cache', type(giphy._cache)())
+    monkeypatch.setattr(giphy, '_in_flight', {})
+    monkeypatch.setattr(giphy, '_failures', 0)
+    monkeypatch.setattr(giphy, '_circuit_open_until', 0)
+    yield server
+    server.close()
+
+
+def test_concurrent_cold_lookups_share_one_call(stub):
+    stub.delay = 0.3
+    results = []
+
+    def search():
+        results.append(get_gifs('search', 'Cats', limit=10))
+
+    threads = [threading.Thread(target=search) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stub.calls == 1
+    assert sorted(status for _, status in results) == ['HIT'] * 7 + ['MISS']
+    assert all(gifs == results[0][0] for gifs, _ in results)
+    assert results[0][0][0]['id'] == 'abc123'
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_cooldown(stub):
+    stub.status = 500
+    for i in range(giphy.GIPHY_BREAKER_THRESHOLD):
+        with pytest.raises(GiphyUnavailable):
+            get_gifs('search', f'failing {i}')
+    assert stub.calls == giphy.GIPHY_BREAKER_THRESHOLD
+
+    # Open: answered without calling Giphy
+    with pytest.raises(GiphyUnavailable):
+        get_gifs('search', 'while open')
+    assert stub.calls == giphy.GIPHY_BREAKER_THRESHOLD
+
+    # Half-open after the cooldown: one trial call, and its failure opens the circuit again at once
+    time.sleep(COOLDOWN + 0.05)
+    with pytest.raises(GiphyUnavailable):
+        get_gifs('search', 'trial')
+    assert stub.calls == giphy.GIPHY_BREAKER_THRESHOLD + 1
+    with pytest.raises(GiphyUnavailable):
+        get_gifs('search', 'reopened')
+    assert stub.calls == giphy.GIPHY_BREAKER_THRESHOLD + 1
+
+    # A successful trial closes it
+    stub.status = 200
+    time.sleep(COOLDOWN + 0.05)
+    gifs, status = get_gifs('search', 'recovered')
+    assert status == 'MISS' and gifs[0]['id'] == 'abc123'
+    assert giphy._failures == 0
+
+
+def test_open_breaker_serves_stale_results(stub, monkeypatch):
+    get_gifs('trending')
+    # Expire the cached result, then let Giphy fail until the circuit opens
+    monkeypatch.setattr(giphy, 'GIPHY_CACHE_TTL', {'search': 0, 'trending': 0})
+    stub.status = 500
+    for i in range(giphy.GIPHY_BREAKER_THRESHOLD):
+        with pytest.raises(GiphyUnavailable):
+            get_gifs('search', f'failing {i}')
+    calls = stub.calls
+
+    gifs, status = get_gifs('trending')
+    assert status == 'STALE' and gifs[0]['id'] == 'abc123'
+    assert stub.calls == calls
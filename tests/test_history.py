@@ -0,0 +1,49 @@
+"""
+Room History Tests
+Query budget of the room history endpoint (/api/messages/<room_id>), kept with
+assert_max_queries from app/profiler.py so an N+1 regression fails here
+"""
+
+import io
+
+from app.models import db, Message
+from app.profiler import assert_max_queries
+from tests.conftest import login
+
+HISTORY_QUERY_BUDGET = 3  # Session user, room, messages with their users and attachments
+
+
+def post_history(app, client, count=30):
+    """Messages from both users in 'general', every third one an attachment"""
+    url = client.post('/upload_attachment', data={'file': (io.BytesIO(b'%PDF minutes'), 'minutes.pdf')},
+                      content_type='multipart/form-data').get_json()['url']
+    with app.app_context():
+        for i in range(count):
+            if i % 3 == 0:
+                db.session.add(Message(content=url, user_id=1, room_id=1, message_type='file'))
+            else:
+                db.session.add(Message(content=f'message {i}', user_id=i % 2 + 1, room_id=1))
+        db.session.commit()
+
+
+def test_history_query_count_does_not_grow_with_messages(app, client):
+    post_history(app, client)
+
+    with assert_max_queries(HISTORY_QUERY_BUDGET):
+        response = client.get('/api/messages/1')
+
+    assert response.status_code == 200
+    messages = response.get_json()
+    assert len(messages) == 30
+    assert {message['username'] for message in messages} == {'alice', 'bob'}
+
+
+def test_history_query_count_for_another_member(app, client):
+    post_history(app, client, count=60)
+    bob = login(app, 'bob')
+
+    with assert_max_queries(HISTORY_QUERY_BUDGET):
+        response = bob.get('/api/messages/1?limit=50')
+
+    assert response.status_code == 200
+    assert len(response.get_json()) == 50
@@ -0,0 +1,92 @@
+"""
+Media Serving Tests
+Bytes sent for uploads (send_media / serve_upload): immutable caching,
+empty 304s on revalidation, exact 206 ranges and 416s
+"""
+
+import hashlib
+import io
+import os
+
+from app.routes.uploads import MEDIA_CACHE_MAX_AGE
+
+DATA = bytes(range(256)) * 400  # 100 KB
+
+
+def upload(client, data=DATA, name='notes.txt'):
+    response = client.post('/upload_attachment', data={'file': (io.BytesIO(data), name)},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    return response.get_json()['url']
+
+
+def assert_immutable(response):
+    assert response.cache_control.public
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == MEDIA_CACHE_MAX_AGE
+
+
+def test_content_addressed_upload_is_immutable_with_hash_etag(client):
+    url = upload(client)
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response.data == DATA
+    assert response.headers['Content-Length'] == str(len(DATA))
+    assert response.get_etag() == (hashlib.sha256(DATA).hexdigest(), False)
+    assert_immutable(response)
+
+
+def test_conditional_get_returns_empty_304(client):
+    url = upload(client)
+    etag = client.get(url).headers['ETag']
+
+    for _ in range(5):
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert_immutable(response)
+
+
+def test_range_request_returns_exactly_the_requested_bytes(client):
+    url = upload(client)
+    response = client.get(url, headers={'Range': 'bytes=1000-1099'})
+
+    assert response.status_code == 206
+    assert response.data == DATA[1000:1100]
+    assert len(response.data) == 100
+    assert response.headers['Content-Range'] == f'bytes 1000-1099/{len(DATA)}'
+
+    # If-Range with the current ETag still gets the slice
+    etag = client.get(url).headers['ETag']
+    response = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert response.status_code == 206 and response.data == DATA[:10]
+
+
+def test_unsatisfiable_range_returns_416(client):
+    url = upload(client)
+    response = client.get(url, headers={'Range': f'bytes={len(DATA) + 10}-{len(DATA) + 20}'})
+
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(DATA)}'
+
+
+def test_legacy_upload_revalidates_with_last_modified(app, client):
+    # Files from before content addressing are served from their flat path with werkzeug's validators
+    path = os.path.join(app.config['UPLOADS_ROOT'], 'attachments', 'legacy-report.txt')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(DATA)
+
+    response = client.get('/uploads/attachments/legacy-report.txt')
+    assert response.status_code == 200 and len(response.data) == len(DATA)
+    assert_immutable(response)
+
+    response = client.get('/uploads/attachments/legacy-report.txt',
+                          headers={'If-Modified-Since': response.headers['Last-Modified']})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_missing_upload_is_404(client):
+    assert client.get(f'/uploads/attachments/{"0" * 64}.txt').status_code == 404
@@ -0,0 +1,91 @@
+"""
+Upload Garbage Collector Tests
+Orphaned uploads and transcoded voice notes swept by app/upload_gc.py
+"""
+
+import hashlib
+import io
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from app.models import db, Message, StoredFile
+from app.storage import get_storage
+from app.upload_gc import sweep_orphaned_uploads
+
+VOICE_NOTE = b'\x1aE\xdf\xa3 not really webm ' * 64
+DAY = 24 * 60 * 60
+
+
+def store_old(key, data):
+    """Write a file into storage with a modification time two days ago"""
+    storage = get_storage()
+    path = storage._shard_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    old = time.time() - 2 * DAY
+    os.utime(path, (old, old))
+    return path
+
+
+def transcoded_voice_note(ref_count=0):
+    """A voice note whose original was replaced by its Opus transcode, as app/voice_notes.py leaves it"""
+    sha256 = hashlib.sha256(VOICE_NOTE).hexdigest()
+    source_url = f'/uploads/audio/{sha256}.webm'
+    transcoded_url = f'/uploads/audio/{sha256}.opus.ogg'
+    db.session.add(StoredFile(
+        path=source_url, sha256=sha256, size=len(VOICE_NOTE), ref_count=ref_count, mime_type='audio/webm',
+        media_info=json.dumps({'duration': 1.5, 'peaks': [0.5], 'url': transcoded_url, 'mime': 'audio/ogg'}),
+        created_at=datetime.utcnow() - timedelta(days=2)
+    ))
+    db.session.commit()
+    return source_url, transcoded_url, store_old(transcoded_url[len('/uploads/'):], b'OggS opus')
+
+
+def test_unsent_transcoded_voice_note_is_deleted_with_its_row(app, client):
+    with app.app_context():
+        source_url, _, transcoded_path = transcoded_voice_note()
+
+        stats = sweep_orphaned_uploads(grace_period=DAY)
+
+        assert stats['deleted'] == 1
+        assert not os.path.exists(transcoded_path)
+        assert StoredFile.query.filter_by(path=source_url).first() is None
+
+    # The same bytes uploaded again are stored, not mistaken for a duplicate of the deleted file
+    response = client.post('/upload_audio', data={'audio': (io.BytesIO(VOICE_NOTE), 'voice.webm')},
+                           content_type='multipart/form-data')
+    assert response.get_json()['url'] == source_url
+    response = client.get(source_url)
+    assert response.status_code == 200 and response.data == VOICE_NOTE
+
+
+def test_sent_transcoded_voice_note_is_kept(app):
+    with app.app_context():
+        source_url, _, transcoded_path = transcoded_voice_note(ref_count=1)
+        db.session.add(Message(content=source_url, user_id=1, room_id=1, message_type='audio'))
+        db.session.commit()
+
+        stats = sweep_orphaned_uploads(grace_period=DAY)
+
+        assert stats['deleted'] == 0
+        assert os.path.exists(transcoded_path)
+        assert StoredFile.query.filter_by(path=source_url).first() is not None
+
+
+def test_orphaned_attachment_is_deleted_and_recent_one_kept(app):
+    with app.app_context():
+        orphan = store_old('attachments/old-report.pdf', b'%PDF old')
+        storage = get_storage()
+        recent = storage._shard_path('attachments/new-report.pdf')
+        os.makedirs(os.path.dirname(recent), exist_ok=True)
+        with open(recent, 'wb') as f:
+            f.write(b'%PDF new')
+
+        stats = sweep_orphaned_uploads(grace_period=DAY)
+
+        assert stats['deleted'] == 1
+        assert not os.path.exists(orphan)
+        assert os.path.exists(recent)
@@ -0,0 +1,77 @@
+"""
+Wire Format Tests
+Frame sizes of the compact MessagePack encoding (app/wire.py) against the
+JSON frames other clients receive, for a representative message and batch
+"""
+
+from datetime import datetime
+
+import pytest
+import socketio
+
+from app.wire import BATCH_EVENT, MESSAGE_FIELDS, TYPING_FIELDS, encode
+
+msgpack = pytest.importorskip('msgpack')
+
+
+def sample_message(message_id=1048576, content='Running ten minutes late, start without me'):
+    """A payload shaped like Message.to_dict() output"""
+    now = datetime(2025, 3, 14, 9, 26, 53, 589793)
+    return {
+        'id': message_id,
+        'content': content,
+        'user_id': 42,
+        'username': 'ananya.k',
+        'display_name': 'Ananya Krishnan',
+        'profile_picture': '/uploads/profiles/3f/2a/3f2a9c1e7b.jpg',
+        'room_id': 1,
+        'room_name': 'general',
+        'message_type': 'text',
+        'file_name': None,
+        'media_info': None,
+        'attachment': None,
+        'timestamp': now.isoformat(),
+        'formatted_time': now.strftime('%I:%M %p'),
+        'formatted_date': now.strftime('%B %d, %Y'),
+        'client_id': '6f1c2a4e-8d3b-4f7a-9e21-5b0c7d9a3e14',
+    }
+
+
+def frame_bytes(event, payload):
+    """Bytes one recipient receives for an event: the Socket.IO packet and any binary attachments"""
+    encoded = socketio.packet.Packet(socketio.packet.EVENT, namespace='/', data=[event, payload]).encode()
+    frames = encoded if isinstance(encoded, list) else [encoded]
+    return sum(len(frame.encode() if isinstance(frame, str) else frame) for frame in frames)
+
+
+def test_message_frame_is_smaller_than_json():
+    message = sample_message()
+    packed = encode('new_message', message)
+
+    assert msgpack.unpackb(packed, raw=False) == [message.get(field) for field in MESSAGE_FIELDS]
+    json_size = frame_bytes('new_message', message)
+    msgpack_size = frame_bytes('new_message', packed)
+    # Field names, room_name and formatted_date are the bulk of the saving
+    assert msgpack_size < json_size * 0.75, (msgpack_size, json_size)
+
+
+def test_batch_frame_is_smaller_than_json():
+    typing = {'user_id': 7, 'username': 'dev.r', 'room_id': 1}
+    batch = [['new_message', sample_message(1048576 + i, f'Message number {i} of a busy room')]
+             for i in range(20)]
+    batch += [['user_typing', typing], ['stop_typing', typing]]
+    packed = encode(BATCH_EVENT, batch)
+
+    unpacked = msgpack.unpackb(packed, raw=False)
+    assert [name for name, _ in unpacked] == [name for name, _ in batch]
+    assert unpacked[0][1] == [batch[0][1].get(field) for field in MESSAGE_FIELDS]
+    assert unpacked[-1][1] == [typing[field] for field in TYPING_FIELDS]
+    json_size = frame_bytes(BATCH_EVENT, batch)
+    msgpack_size = frame_bytes(BATCH_EVENT, packed)
+    assert msgpack_size < json_size * 0.75, (msgpack_size, json_size)
+
+
+def test_typing_frames_stay_text():
+    # Too small to be worth a second (binary) WebSocket frame
+    typing = {'user_id': 7, 'username': 'dev.r', 'room_id': 1}
+    assert encode('user_typing', typing) == [7, 'dev.r', 1]
@@ -6,12 +6,28 @@ For Gunicorn with eventlet workers, use: gunicorn --worker-class eventlet -w 1 -
 """
 
 from app import create_app
+from app.upload_gc import start_upload_gc
+from app.database import start_sqlite_checkpoints
+from app.partitions import start_partition_maintenance
+from app.retention import start_retention_reaper
+from app.routes.uploads import start_audio_stream_sweeper
 
 # Create the Flask application
 # For Gunicorn with eventlet, we use the Flask app directly
 # The eventlet worker will handle SocketIO properly
 app = create_app()
 
+# Periodically delete uploads nothing refers to any more
+start_upload_gc(app)
+# Keep the SQLite WAL small when running without PostgreSQL
+start_sqlite_checkpoints(app)
+# Create upcoming monthly message partitions (PostgreSQL, once messages is partitioned)
+start_partition_maintenance(app)
+# Delete messages past their room's retention policy
+start_retention_reaper(app)
+# Delete voice recordings abandoned part-way through uploading
+start_audio_stream_sweeper(app)
+
 # Export as 'application' for some WSGI servers, 'app' for Gunicorn
 application = app
 